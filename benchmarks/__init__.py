@@ -0,0 +1 @@
+"""Benchmarks of the sort modes on synthetic complexes; see `python -m benchmarks.run --help`."""
@@ -0,0 +1,191 @@
+"""Time every sort mode on synthetic data and record throughput and peak RSS.
+
+    python -m benchmarks.run --gems 200000 --out results.json
+    python -m benchmarks.run --compare old.json new.json
+
+Each case runs in a fresh interpreter, so its peak RSS is not inflated by the
+cases before it.
+"""
+import argparse
+import csv
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from .synthetic import generate_complexes, generate_anchors, generate_queries
+
+MODES = ("abc", "AandBandC", "multiple", "batch")
+DEFAULT_ANCHORS = (1, 10, 100, 400)
+ABC_GRAPHS = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC;AtoB;CtoB"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare(workdir, num_gems, anchor_counts, seed=0, store=False):
+    """Generate the region file and one anchor file and query table per anchor count."""
+    os.makedirs(workdir, exist_ok=True)
+    region = os.path.join(workdir, f"syn-{num_gems}.region")
+    num_fragments = generate_complexes(region, num_gems, seed=seed)
+    if store:
+        from miasort import compile_complexes
+        compile_complexes(region)
+
+    # Smaller anchor files are prefixes of the largest one
+    generate_anchors(os.path.join(workdir, "anchors-all.bedte"), max(anchor_counts), seed=seed)
+    with open(os.path.join(workdir, "anchors-all.bedte"), 'r') as file:
+        lines = file.readlines()
+    for count in anchor_counts:
+        with open(os.path.join(workdir, f"anchors-{count}.bedte"), 'w') as file:
+            file.writelines(lines[:count])
+        generate_queries(os.path.join(workdir, f"queries-{count}.tsv"),
+                         os.path.join(workdir, f"anchors-{count}.bedte"))
+    return region, num_fragments
+
+
+def run_case(case):
+    """Run one case in this process and return its measurements."""
+    started = time.perf_counter()
+    import miasort
+    import_seconds = time.perf_counter() - started
+
+    out_dir = f"out_{case['mode']}_{case['engine']}_{case['anchors']}_{'plot' if case['plot'] else 'noplot'}"
+    options = dict(out_dir=out_dir, plot=case["plot"], engine=case["engine"])
+    started = time.perf_counter()
+    if case["mode"] == "abc":
+        miasort.abc_sort(case["region"], f"anchors-{case['anchors']}.bedte", ABC_GRAPHS, **options)
+    elif case["mode"] == "AandBandC":
+        miasort.multiple_sort(case["region"], f"anchors-{case['anchors']}.bedte", **options)
+    elif case["mode"] == "multiple":
+        # One run per query of the table that the batch case sorts in one go
+        from miasort.helper import read_queries
+        for regions, operations, id in read_queries(f"queries-{case['anchors']}.tsv"):
+            miasort.unlimited_multiple_sort(case["region"], regions, operations,
+                                            **dict(options, out_dir=os.path.join(out_dir, id)))
+    else:
+        miasort.batch_multiple_sort(case["region"], f"queries-{case['anchors']}.tsv", **options)
+    seconds = time.perf_counter() - started
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+
+    # The multiple mode keeps no records file
+    complexes = None if case["mode"] == "multiple" else 0
+    for path in glob.glob(os.path.join(out_dir, "*_comp_records.csv")):
+        with open(path, 'r', newline='') as file:
+            complexes += sum(int(row["num_complexes"]) for row in csv.DictReader(file))
+
+    return dict(case, seconds=seconds, import_seconds=import_seconds,
+                anchors_per_second=case["anchors"] / seconds if seconds else None,
+                complexes=complexes, peak_rss_bytes=peak_rss,
+                plots=len(glob.glob(os.path.join(out_dir, "**", "*.png"), recursive=True)))
+
+
+def spawn_case(workdir, case):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])),
+               MPLBACKEND="Agg")
+    process = subprocess.run([sys.executable, "-m", "benchmarks.run", "--case", json.dumps(case)],
+                             cwd=workdir, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Case {case} failed:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def metadata(num_gems, num_fragments, seed):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        from importlib.metadata import version
+        miasort_version = version("miasort")
+    except Exception:
+        miasort_version = None
+    return {"miasort_version": miasort_version, "commit": commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "gems": num_gems, "fragments": num_fragments, "seed": seed}
+
+
+def benchmark(workdir, num_gems=100000, anchor_counts=DEFAULT_ANCHORS, modes=MODES, engines=("numpy",),
+              plots=(False, True), seed=0, store=False):
+    """Run every mode, engine, plot setting and anchor count; return the results document."""
+    workdir = os.path.abspath(workdir)
+    region, num_fragments = prepare(workdir, num_gems, anchor_counts, seed, store)
+
+    results = []
+    for mode in modes:
+        for engine in engines:
+            for plot in plots:
+                for count in anchor_counts:
+                    case = {"mode": mode, "engine": engine, "plot": plot, "anchors": count, "region": region}
+                    result = spawn_case(workdir, case)
+                    print(f"{mode:>10} {engine:>8} {'plot' if plot else 'no plot':>8} {count:>4} anchors: "
+                          f"{result['seconds']:8.2f} s  {result['anchors_per_second']:8.2f} anchors/s  "
+                          f"{result['peak_rss_bytes'] / 2**20:8.1f} MB", flush=True)
+                    results.append(result)
+    return {"metadata": metadata(num_gems, num_fragments, seed), "results": results}
+
+
+def compare(old, new):
+    """Rows of (case, old seconds, new seconds, time ratio, RSS ratio) for the cases in both documents."""
+    def key(result):
+        return result["mode"], result["engine"], result["plot"], result["anchors"]
+
+    previous = {key(result): result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        before = previous.get(key(result))
+        if before is not None:
+            rows.append((key(result), before["seconds"], result["seconds"],
+                         result["seconds"] / before["seconds"],
+                         result["peak_rss_bytes"] / before["peak_rss_bytes"]))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", default="benchmark_data", help="directory for the synthetic data and outputs")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--gems", type=int, default=100000, help="number of synthetic complexes")
+    parser.add_argument("--anchors", default=",".join(map(str, DEFAULT_ANCHORS)),
+                        help="comma-separated anchor counts")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated sort modes")
+    parser.add_argument("--engines", default="numpy", help="comma-separated engines")
+    parser.add_argument("--plots", choices=("both", "yes", "no"), default="both")
+    parser.add_argument("--store", action="store_true", help="compile the region file into a binary store first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    if args.compare:
+        documents = []
+        for path in args.compare:
+            with open(path, 'r') as file:
+                documents.append(json.load(file))
+        for (mode, engine, plot, count), before, after, ratio, rss_ratio in compare(*documents):
+            print(f"{mode:>10} {engine:>8} {'plot' if plot else 'no plot':>8} {count:>4} anchors: "
+                  f"{before:8.2f} s -> {after:8.2f} s  x{ratio:5.2f} time  x{rss_ratio:5.2f} RSS")
+        return
+
+    plots = {"both": (False, True), "yes": (True,), "no": (False,)}[args.plots]
+    document = benchmark(args.workdir, args.gems, [int(count) for count in args.anchors.split(",")],
+                         args.modes.split(","), args.engines.split(","), plots, args.seed, args.store)
+    with open(args.out, 'w') as file:
+        json.dump(document, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Chromosome lengths of the synthetic genome, in bp
+DEFAULT_CHROMS = {"chr1": 50_000_000, "chr2": 40_000_000, "chr3": 30_000_000}
+
+
+def generate_complexes(path, num_gems, chroms=DEFAULT_CHROMS, seed=0, inter_chrom_rate=0.02):
+    """Write a synthetic region file of num_gems complexes, sorted by position.
+
+    The fragment count of a GEM follows a heavy-tailed distribution (most GEMs
+    have 2 or 3 fragments, a few have dozens), GEM spans and fragment lengths are
+    log-normal, and a small share of fragments lands on another chromosome, as in
+    ChIA-Drop and Pore-C libraries.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(chroms)
+    lengths = np.array([chroms[name] for name in names])
+
+    sizes = np.minimum(rng.zipf(2.2, num_gems) + 1, 100)
+    gem_chroms = rng.choice(len(names), num_gems, p=lengths / lengths.sum())
+    spans = np.minimum(rng.lognormal(np.log(60_000), 1.2, num_gems), 2_000_000).astype(np.int64)
+    gem_starts = (rng.random(num_gems) * np.maximum(lengths[gem_chroms] - spans, 1)).astype(np.int64)
+
+    # One row per fragment, spread over the span of its GEM
+    gems = np.repeat(np.arange(num_gems), sizes)
+    frag_chroms = gem_chroms[gems]
+    offsets = (rng.random(len(gems)) * spans[gems]).astype(np.int64)
+    starts = gem_starts[gems] + offsets
+    moved = rng.random(len(gems)) < inter_chrom_rate
+    frag_chroms[moved] = rng.choice(len(names), moved.sum())
+    starts[moved] = (rng.random(moved.sum()) * lengths[frag_chroms[moved]] * 0.99).astype(np.int64)
+    ends = starts + np.maximum(rng.lognormal(np.log(800), 0.8, len(gems)), 50).astype(np.int64)
+
+    order = np.lexsort((starts, frag_chroms))
+    with open(path, 'w') as file:
+        for i in order:
+            file.write(f"{names[frag_chroms[i]]}\t{starts[i]}\t{ends[i]}\t{sizes[gems[i]]}\tSYN-GEM-{gems[i]}\n")
+    return len(gems)
+
+
+def generate_anchors(path, num_anchors, chroms=DEFAULT_CHROMS, seed=0, shared_rate=0.3):
+    """Write an anchor file of num_anchors triples (A, B, C).
+
+    A and C are 8 kb motifs and B is a 1 kb site between them, 20 kb to 1 Mb
+    apart. Consecutive triples share their anchor A at shared_rate, like the
+    triples of a convergent CTCF loop.
+    """
+    rng = np.random.default_rng(seed + 1)
+    names = list(chroms)
+    lengths = np.array([chroms[name] for name in names])
+
+    with open(path, 'w') as file:
+        chrom, a = None, None
+        for i in range(num_anchors):
+            if chrom is None or rng.random() >= shared_rate:
+                chrom = rng.choice(len(names), p=lengths / lengths.sum())
+                a = int(rng.integers(0, lengths[chrom] - 2_200_000))
+            b = a + 8_000 + int(rng.integers(20_000, 500_000))
+            c = b + 1_000 + int(rng.integers(20_000, 500_000))
+            name = names[chrom]
+            file.write(f"{name}\t{a}\t{a + 8000}\t{name}\t{b}\t{b + 1000}\t{name}\t{c}\t{c + 8000}\tcr{i + 1}_M-1\n")
+
+
+def generate_queries(path, anchors_path):
+    """Write a batch query file with the three sites of each anchor triple as regions."""
+    with open(anchors_path, 'r') as anchors, open(path, 'w') as file:
+        for line in anchors:
+            fields = line.split()
+            regions = ";".join(f"{fields[i]}:{fields[i + 1]}-{fields[i + 2]}" for i in (0, 3, 6))
+            file.write(f"{regions}\tyes;yes;yes\t{fields[9]}\n")
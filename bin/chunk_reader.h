@@ -0,0 +1,340 @@
+// Input of the *2complexes converters: whole lines of a BGZF, gzip or plain
+// text file, read in large chunks, plus allocation-free field parsing.
+#ifndef MIASORT_CHUNK_READER_H
+#define MIASORT_CHUNK_READER_H
+
+#include <algorithm>
+#include <charconv>
+#include <condition_variable>
+#include <cstdint>
+#include <cstdio>
+#include <deque>
+#include <exception>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <string_view>
+#include <thread>
+#include <unordered_map>
+#include <vector>
+#include <zlib.h>
+
+// Reads a file as chunks of whole lines, in file order.
+//
+// With more than one thread, a BGZF file (bgzip output, as used for 4DN
+// .pairs.gz) is inflated a batch of blocks at a time, each thread taking a
+// share of the blocks of the batch. Other gzip and plain files are inflated by
+// one background thread. Either way the next chunk is read while the caller
+// parses the current one.
+class ChunkReader {
+public:
+    ChunkReader(const std::string& path, int threads, size_t chunkSize = 4 << 20)
+        : path(path), threads(std::max(threads, 1)), chunkSize(chunkSize) {
+        bgzf = this->threads > 1 && isBgzf(path);
+        if (bgzf) {
+            file = std::fopen(path.c_str(), "rb");
+            if (!file) {
+                throw std::runtime_error("Unable to open " + path);
+            }
+        } else {
+            gz = gzopen(path.c_str(), "rb");
+            if (!gz) {
+                throw std::runtime_error("Unable to open " + path);
+            }
+            gzbuffer(gz, 1 << 20);
+        }
+        if (this->threads > 1) {
+            producer = std::thread(&ChunkReader::produce, this);
+        }
+    }
+
+    ~ChunkReader() {
+        if (producer.joinable()) {
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                stopped = true;
+            }
+            changed.notify_all();
+            producer.join();
+        }
+        if (file) {
+            std::fclose(file);
+        }
+        if (gz) {
+            gzclose(gz);
+        }
+    }
+
+    // The next chunk of whole lines (the last one may lack its newline); false at the end of the file
+    bool next(std::string& chunk) {
+        if (threads == 1) {
+            return readChunk(chunk);
+        }
+        std::unique_lock<std::mutex> lock(mutex);
+        changed.wait(lock, [this] { return !ready.empty() || done; });
+        if (ready.empty()) {
+            if (error) {
+                std::rethrow_exception(error);
+            }
+            return false;
+        }
+        chunk.swap(ready.front());
+        ready.pop_front();
+        changed.notify_all();
+        return true;
+    }
+
+    static bool isBgzf(const std::string& path) {
+        unsigned char header[16];
+        std::FILE* probe = std::fopen(path.c_str(), "rb");
+        if (!probe) {
+            return false;
+        }
+        size_t n = std::fread(header, 1, sizeof(header), probe);
+        std::fclose(probe);
+        // gzip with an extra field whose first subfield is BC, of length 2
+        return n == sizeof(header) && header[0] == 0x1f && header[1] == 0x8b && (header[3] & 4) &&
+               header[12] == 'B' && header[13] == 'C' && header[14] == 2 && header[15] == 0;
+    }
+
+private:
+    void produce() {
+        try {
+            std::string chunk;
+            while (readChunk(chunk)) {
+                std::unique_lock<std::mutex> lock(mutex);
+                // Keep at most two chunks ahead of the parser
+                changed.wait(lock, [this] { return ready.size() < 2 || stopped; });
+                if (stopped) {
+                    return;
+                }
+                ready.push_back(std::move(chunk));
+                chunk = std::string();
+                changed.notify_all();
+            }
+        } catch (...) {
+            std::lock_guard<std::mutex> lock(mutex);
+            error = std::current_exception();
+        }
+        std::lock_guard<std::mutex> lock(mutex);
+        done = true;
+        changed.notify_all();
+    }
+
+    bool readChunk(std::string& chunk) {
+        chunk.clear();
+        chunk.swap(carry);
+        while (!finished) {
+            finished = !(bgzf ? inflateBatch(chunk) : readGzip(chunk));
+            size_t last = chunk.rfind('\n');
+            if (last != std::string::npos) {
+                // The partial line after the last newline starts the next chunk
+                if (!finished) {
+                    carry.assign(chunk, last + 1, std::string::npos);
+                    chunk.resize(last + 1);
+                }
+                return true;
+            }
+        }
+        return !chunk.empty();
+    }
+
+    // Appends up to chunkSize bytes; false at the end of the file
+    bool readGzip(std::string& out) {
+        size_t size = out.size();
+        out.resize(size + chunkSize);
+        int n = gzread(gz, &out[size], (unsigned)chunkSize);
+        if (n < 0) {
+            throw std::runtime_error("Unable to decompress " + path);
+        }
+        out.resize(size + n);
+        return n > 0;
+    }
+
+    // Reads the next BGZF block into block; false at the end of the file
+    bool readBlock(std::string& block) {
+        unsigned char header[12];
+        size_t n = std::fread(header, 1, sizeof(header), file);
+        if (n == 0) {
+            return false;
+        }
+        if (n != sizeof(header) || header[0] != 0x1f || header[1] != 0x8b || !(header[3] & 4)) {
+            throw std::runtime_error(path + " is not a BGZF file");
+        }
+        size_t xlen = header[10] | (header[11] << 8);
+        std::string extra(xlen, '\0');
+        if (std::fread(&extra[0], 1, xlen, file) != xlen) {
+            throw std::runtime_error("Truncated BGZF block in " + path);
+        }
+        size_t blockSize = 0;
+        for (size_t p = 0; p + 4 <= xlen; p += 4 + ((unsigned char)extra[p + 2] | ((unsigned char)extra[p + 3] << 8))) {
+            if (extra[p] == 'B' && extra[p + 1] == 'C') {
+                blockSize = ((unsigned char)extra[p + 4] | ((unsigned char)extra[p + 5] << 8)) + 1;
+            }
+        }
+        if (blockSize < sizeof(header) + xlen + 8) {
+            throw std::runtime_error(path + " is not a BGZF file");
+        }
+        // The deflate data, then CRC32 and ISIZE
+        block.resize(blockSize - sizeof(header) - xlen);
+        if (std::fread(&block[0], 1, block.size(), file) != block.size()) {
+            throw std::runtime_error("Truncated BGZF block in " + path);
+        }
+        return true;
+    }
+
+    static uint32_t trailer(const std::string& block, size_t offset) {
+        const unsigned char* p = reinterpret_cast<const unsigned char*>(block.data() + block.size() - 8 + offset);
+        return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24);
+    }
+
+    static void inflateBlock(const std::string& block, char* out, size_t size, const std::string& path) {
+        if (size == 0) {
+            return;  // the empty block that ends a BGZF file
+        }
+        z_stream stream = {};
+        if (inflateInit2(&stream, -15) != Z_OK) {
+            throw std::runtime_error("Unable to start inflating " + path);
+        }
+        stream.next_in = reinterpret_cast<Bytef*>(const_cast<char*>(block.data()));
+        stream.avail_in = (uInt)(block.size() - 8);
+        stream.next_out = reinterpret_cast<Bytef*>(out);
+        stream.avail_out = (uInt)size;
+        int status = inflate(&stream, Z_FINISH);
+        inflateEnd(&stream);
+        if (status != Z_STREAM_END || stream.total_out != size ||
+            crc32(0, reinterpret_cast<const Bytef*>(out), (uInt)size) != trailer(block, 0)) {
+            throw std::runtime_error("Corrupt BGZF block in " + path);
+        }
+    }
+
+    // Appends a batch of blocks, inflated on all threads; false at the end of the file
+    bool inflateBatch(std::string& out) {
+        const size_t batch = threads * std::max<size_t>(chunkSize >> 16, 1);
+        if (blocks.size() < batch) {
+            blocks.resize(batch);
+        }
+        size_t count = 0;
+        while (count < batch && readBlock(blocks[count])) {
+            ++count;
+        }
+        std::vector<size_t> offsets(count + 1, out.size());
+        for (size_t b = 0; b < count; ++b) {
+            offsets[b + 1] = offsets[b] + trailer(blocks[b], 4);
+        }
+        out.resize(offsets[count]);
+
+        std::vector<std::exception_ptr> errors(threads);
+        std::vector<std::thread> workers;
+        for (int t = 0; t < threads; ++t) {
+            size_t first = count * t / threads, last = count * (t + 1) / threads;
+            if (first == last) {
+                continue;
+            }
+            workers.emplace_back([&, t, first, last] {
+                try {
+                    for (size_t b = first; b < last; ++b) {
+                        inflateBlock(blocks[b], &out[offsets[b]], offsets[b + 1] - offsets[b], path);
+                    }
+                } catch (...) {
+                    errors[t] = std::current_exception();
+                }
+            });
+        }
+        for (std::thread& worker : workers) {
+            worker.join();
+        }
+        for (const std::exception_ptr& error : errors) {
+            if (error) {
+                std::rethrow_exception(error);
+            }
+        }
+        return count == batch;
+    }
+
+    std::string path;
+    int threads;
+    size_t chunkSize;
+    bool bgzf = false;
+    std::FILE* file = nullptr;
+    gzFile gz = nullptr;
+    std::vector<std::string> blocks;
+    std::string carry;
+    bool finished = false;
+
+    std::thread producer;
+    std::mutex mutex;
+    std::condition_variable changed;
+    std::deque<std::string> ready;
+    bool done = false;
+    bool stopped = false;
+    std::exception_ptr error;
+};
+
+// Calls f(line) for each line of text, without its newline
+template <typename F>
+void forEachLine(std::string_view text, F f) {
+    while (!text.empty()) {
+        size_t end = text.find('\n');
+        if (end == std::string_view::npos) {
+            f(text);
+            return;
+        }
+        f(text.substr(0, end));
+        text.remove_prefix(end + 1);
+    }
+}
+
+// Splits text into up to `parts` ranges of whole lines and calls parse(range, k) for range k, each on its own thread
+template <typename Parse>
+void parseInParallel(std::string_view text, int parts, Parse parse) {
+    std::vector<std::string_view> ranges;
+    size_t begin = 0;
+    for (int k = 1; k <= parts && begin < text.size(); ++k) {
+        size_t end = text.size();
+        if (k < parts) {
+            size_t newline = text.find('\n', std::max(begin, text.size() * k / parts));
+            end = newline == std::string_view::npos ? text.size() : newline + 1;
+        }
+        ranges.push_back(text.substr(begin, end - begin));
+        begin = end;
+    }
+    std::vector<std::thread> workers;
+    for (size_t k = 1; k < ranges.size(); ++k) {
+        workers.emplace_back(parse, ranges[k], k);
+    }
+    if (!ranges.empty()) {
+        parse(ranges[0], 0);
+    }
+    for (std::thread& worker : workers) {
+        worker.join();
+    }
+}
+
+// Splits line at sep into fields, reusing the storage of fields
+inline void splitFields(std::string_view line, char sep, std::vector<std::string_view>& fields) {
+    fields.clear();
+    size_t begin = 0;
+    while (true) {
+        size_t end = line.find(sep, begin);
+        if (end == std::string_view::npos) {
+            fields.push_back(line.substr(begin));
+            return;
+        }
+        fields.push_back(line.substr(begin, end - begin));
+        begin = end + 1;
+    }
+}
+
+// A view-keyed copy of map, so that lookups with a std::string_view build no std::string
+template <typename T>
+std::unordered_map<std::string_view, T> viewKeys(const std::unordered_map<std::string, T>& map) {
+    return std::unordered_map<std::string_view, T>(map.begin(), map.end());
+}
+
+// Parses the leading integer of text, like std::stoi; false when text does not start with one
+inline bool parseInt(std::string_view text, long long& value) {
+    return std::from_chars(text.data(), text.data() + text.size(), value).ec == std::errc();
+}
+
+#endif
@@ -0,0 +1,327 @@
+// Output of the *2complexes converters: a text region file, standard output, or
+// a miasort complex store (the `.mia` directory written by miasort.compile_complexes).
+//
+// A store holds the fragments grouped by complex, the per-complex offsets and
+// spans, and the per-chromosome position index, as .npy columns. Writing it
+// directly skips the text region file and the parse that would otherwise
+// rebuild the same arrays in Python.
+#ifndef MIASORT_COMPLEX_WRITER_H
+#define MIASORT_COMPLEX_WRITER_H
+
+#include <algorithm>
+#include <charconv>
+#include <cerrno>
+#include <cstdint>
+#include <cstdio>
+#include <deque>
+#include <fstream>
+#include <iostream>
+#include <memory>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include <vector>
+#include <sys/stat.h>
+#include <unistd.h>
+
+// Must match STORE_VERSION in miasort/store.py
+const int MIA_STORE_VERSION = 3;
+const std::string MIA_STORE_SUFFIX = ".mia";
+
+class ComplexWriter {
+public:
+    virtual ~ComplexWriter() {}
+    // Fragments are written in output order; the fragments of a complex share its gemId
+    virtual void write(std::string_view chrom, long long start, long long end, long long gemSize,
+                       std::string_view gemId) = 0;
+    virtual void close() = 0;
+};
+
+class RegionWriter : public ComplexWriter {
+public:
+    // "-" writes to standard output
+    explicit RegionWriter(const std::string& outputFile) : out(&std::cout) {
+        if (outputFile != "-") {
+            file.open(outputFile);
+            if (!file.is_open()) {
+                throw std::runtime_error("Unable to open output file at " + outputFile);
+            }
+            out = &file;
+        }
+    }
+
+    void write(std::string_view chrom, long long start, long long end, long long gemSize,
+               std::string_view gemId) override {
+        buffer.append(chrom).push_back('\t');
+        appendNumber(start);
+        buffer.push_back('\t');
+        appendNumber(end);
+        buffer.push_back('\t');
+        appendNumber(gemSize);
+        buffer.push_back('\t');
+        buffer.append(gemId).push_back('\n');
+        if (buffer.size() >= (1 << 20)) {
+            flush();
+        }
+    }
+
+    void close() override {
+        flush();
+        out->flush();
+        if (file.is_open()) {
+            file.close();
+        }
+    }
+
+private:
+    void appendNumber(long long value) {
+        char digits[24];
+        buffer.append(digits, std::to_chars(digits, digits + sizeof(digits), value).ptr);
+    }
+
+    void flush() {
+        out->write(buffer.data(), (std::streamsize)buffer.size());
+        buffer.clear();
+    }
+
+    std::ofstream file;
+    std::ostream* out;
+    std::string buffer;
+};
+
+class StoreWriter : public ComplexWriter {
+public:
+    explicit StoreWriter(const std::string& storePath) : storePath(storePath) {}
+
+    void write(std::string_view chrom, long long start, long long end, long long gemSize,
+               std::string_view gemId) override {
+        // Chromosomes and complexes are coded in order of first appearance, as in FragmentIndex.from_file.
+        // The fragments of a complex come together, so the previous codes are checked first.
+        if (chroms.empty() || chrom != chroms[lastChrom]) {
+            lastChrom = code(chromCodes, chroms, chrom);
+        }
+        if (gemNames.empty() || gemId != gemNames[lastGem]) {
+            lastGem = code(gemCodes, gemNames, gemId);
+        }
+        chromColumn.push_back((int32_t)lastChrom);
+        startColumn.push_back(start);
+        endColumn.push_back(end);
+        gemSizeColumn.push_back((int32_t)gemSize);
+        gemColumn.push_back((int64_t)lastGem);
+    }
+
+    void close() override {
+        const size_t n = startColumn.size();
+        const size_t numGems = gemNames.size();
+        const size_t numChroms = chroms.size();
+
+        // Group the fragments by complex, keeping the output order within each one
+        std::vector<int64_t> gemCount(numGems, 0);
+        for (size_t i = 0; i < n; ++i) {
+            gemCount[gemColumn[i]]++;
+        }
+        std::vector<int64_t> gemOffsets(numGems + 1, 0);
+        for (size_t g = 0; g < numGems; ++g) {
+            gemOffsets[g + 1] = gemOffsets[g] + gemCount[g];
+        }
+        std::vector<int64_t> row(n);
+        std::vector<int64_t> next(gemOffsets.begin(), gemOffsets.end() - 1);
+        for (size_t i = 0; i < n; ++i) {
+            row[next[gemColumn[i]]++] = (int64_t)i;
+        }
+
+        std::vector<int32_t> chrom(n), gemSize(n);
+        std::vector<int64_t> start(n), end(n), gem(n);
+        for (size_t k = 0; k < n; ++k) {
+            chrom[k] = chromColumn[row[k]];
+            start[k] = startColumn[row[k]];
+            end[k] = endColumn[row[k]];
+            gemSize[k] = gemSizeColumn[row[k]];
+            gem[k] = gemColumn[row[k]];
+        }
+        std::vector<int32_t>().swap(chromColumn);
+        std::vector<int64_t>().swap(startColumn);
+        std::vector<int64_t>().swap(endColumn);
+        std::vector<int32_t>().swap(gemSizeColumn);
+        std::vector<int64_t>().swap(gemColumn);
+
+        std::vector<int64_t> gemMinStart(numGems), gemMaxEnd(numGems);
+        for (size_t g = 0; g < numGems; ++g) {
+            gemMinStart[g] = *std::min_element(start.begin() + gemOffsets[g], start.begin() + gemOffsets[g + 1]);
+            gemMaxEnd[g] = *std::max_element(end.begin() + gemOffsets[g], end.begin() + gemOffsets[g + 1]);
+        }
+
+        // Position index: rows sorted by (chromosome, start), stable like np.lexsort
+        std::vector<int64_t> bounds(numChroms + 1, 0);
+        for (size_t k = 0; k < n; ++k) {
+            bounds[chrom[k] + 1]++;
+        }
+        for (size_t c = 0; c < numChroms; ++c) {
+            bounds[c + 1] += bounds[c];
+        }
+        std::vector<int64_t> order(n);
+        std::vector<int64_t> fill(bounds.begin(), bounds.end() - 1);
+        for (size_t k = 0; k < n; ++k) {
+            order[fill[chrom[k]]++] = (int64_t)k;
+        }
+        std::vector<int64_t> sortedStart(n), reach(n);
+        for (size_t c = 0; c < numChroms; ++c) {
+            std::stable_sort(order.begin() + bounds[c], order.begin() + bounds[c + 1],
+                             [&start](int64_t a, int64_t b) { return start[a] < start[b]; });
+            int64_t furthest = INT64_MIN;
+            for (int64_t p = bounds[c]; p < bounds[c + 1]; ++p) {
+                sortedStart[p] = start[order[p]];
+                furthest = std::max(furthest, end[order[p]]);
+                reach[p] = furthest;
+            }
+        }
+
+        // Write next to the destination first so a crash never leaves a half store
+        const std::string tmpPath = storePath + ".tmp";
+        removeStore(tmpPath);
+        if (mkdir(tmpPath.c_str(), 0777) != 0) {
+            throw std::runtime_error("Unable to create store directory at " + tmpPath);
+        }
+        saveColumn(tmpPath, "chrom", "<i4", chrom);
+        saveColumn(tmpPath, "start", "<i8", start);
+        saveColumn(tmpPath, "end", "<i8", end);
+        saveColumn(tmpPath, "gem_size", "<i4", gemSize);
+        saveColumn(tmpPath, "gem", "<i8", gem);
+        saveColumn(tmpPath, "row", "<i8", row);
+        saveColumn(tmpPath, "order", "<i8", order);
+        saveColumn(tmpPath, "bounds", "<i8", bounds);
+        saveColumn(tmpPath, "sorted_start", "<i8", sortedStart);
+        saveColumn(tmpPath, "reach", "<i8", reach);
+        saveColumn(tmpPath, "gem_offsets", "<i8", gemOffsets);
+        saveColumn(tmpPath, "gem_count", "<i8", gemCount);
+        saveColumn(tmpPath, "gem_min_start", "<i8", gemMinStart);
+        saveColumn(tmpPath, "gem_max_end", "<i8", gemMaxEnd);
+        std::vector<uint8_t> gemNameData;
+        std::vector<int64_t> gemNameOffsets(1, 0);
+        for (const std::string& name : gemNames) {
+            gemNameData.insert(gemNameData.end(), name.begin(), name.end());
+            gemNameOffsets.push_back((int64_t)gemNameData.size());
+        }
+        saveColumn(tmpPath, "gem_name_data", "|u1", gemNameData);
+        saveColumn(tmpPath, "gem_name_offsets", "<i8", gemNameOffsets);
+        saveMeta(tmpPath, n);
+
+        removeStore(storePath);
+        if (std::rename(tmpPath.c_str(), storePath.c_str()) != 0) {
+            throw std::runtime_error("Unable to move the store to " + storePath);
+        }
+    }
+
+private:
+    // Column files of a store; these are all a store directory holds
+    static const std::vector<std::string>& storeFiles() {
+        static const std::vector<std::string> files = {
+            "chrom.npy", "start.npy", "end.npy", "gem_size.npy", "gem.npy", "row.npy",
+            "order.npy", "bounds.npy", "sorted_start.npy", "reach.npy",
+            "gem_offsets.npy", "gem_count.npy", "gem_min_start.npy", "gem_max_end.npy",
+            "gem_name_data.npy", "gem_name_offsets.npy", "meta.json"};
+        return files;
+    }
+
+    static void removeStore(const std::string& path) {
+        struct stat info;
+        if (stat(path.c_str(), &info) != 0) {
+            return;
+        }
+        for (const std::string& name : storeFiles()) {
+            unlink((path + "/" + name).c_str());
+        }
+        if (rmdir(path.c_str()) != 0) {
+            throw std::runtime_error("Unable to replace " + path + ", which holds files other than a store");
+        }
+    }
+
+    // NumPy .npy format 1.0 of a 1-d little-endian array
+    template <typename T>
+    static void saveColumn(const std::string& dir, const std::string& name, const std::string& descr,
+                           const std::vector<T>& values) {
+        std::string header = "{'descr': '" + descr + "', 'fortran_order': False, 'shape': (" +
+                             std::to_string(values.size()) + ",), }";
+        // Magic, version and length take 10 bytes; pad the header so the data starts on 64 bytes
+        header.append(63 - (10 + header.size()) % 64, ' ');
+        header.push_back('\n');
+
+        const std::string path = dir + "/" + name + ".npy";
+        std::ofstream file(path, std::ios::binary);
+        if (!file.is_open()) {
+            throw std::runtime_error("Unable to write " + path);
+        }
+        const uint16_t length = (uint16_t)header.size();
+        file.write("\x93NUMPY\x01\x00", 8);
+        file.put((char)(length & 0xff));
+        file.put((char)(length >> 8));
+        file << header;
+        file.write(reinterpret_cast<const char*>(values.data()), (std::streamsize)(values.size() * sizeof(T)));
+        if (!file) {
+            throw std::runtime_error("Unable to write " + path);
+        }
+    }
+
+    void saveMeta(const std::string& dir, size_t numFragments) const {
+        std::ostringstream meta;
+        meta << "{\n  \"version\": " << MIA_STORE_VERSION << ",\n  \"num_fragments\": " << numFragments
+             << ",\n  \"chroms\": [";
+        for (size_t c = 0; c < chroms.size(); ++c) {
+            meta << (c ? ",\n    " : "\n    ") << jsonString(chroms[c]);
+        }
+        meta << (chroms.empty() ? "]" : "\n  ]") << ",\n  \"source\": null,\n  \"source_signature\": null\n}";
+
+        std::ofstream file(dir + "/meta.json");
+        file << meta.str();
+        if (!file) {
+            throw std::runtime_error("Unable to write " + dir + "/meta.json");
+        }
+    }
+
+    static std::string jsonString(const std::string& value) {
+        std::string quoted = "\"";
+        for (char c : value) {
+            if (c == '"' || c == '\\') {
+                quoted.push_back('\\');
+            }
+            quoted.push_back(c);
+        }
+        return quoted + "\"";
+    }
+
+    // Code of name, added to names when new. Keys are views of the strings in names, which a deque never moves.
+    static size_t code(std::unordered_map<std::string_view, size_t>& codes, std::deque<std::string>& names,
+                       std::string_view name) {
+        auto found = codes.find(name);
+        if (found != codes.end()) {
+            return found->second;
+        }
+        names.emplace_back(name);
+        codes.emplace(names.back(), names.size() - 1);
+        return names.size() - 1;
+    }
+
+    std::string storePath;
+    std::deque<std::string> chroms, gemNames;
+    std::unordered_map<std::string_view, size_t> chromCodes, gemCodes;
+    size_t lastChrom = 0, lastGem = 0;
+    std::vector<int32_t> chromColumn, gemSizeColumn;
+    std::vector<int64_t> startColumn, endColumn, gemColumn;
+};
+
+inline bool isStorePath(const std::string& outputFile) {
+    return outputFile.size() > MIA_STORE_SUFFIX.size() &&
+           outputFile.compare(outputFile.size() - MIA_STORE_SUFFIX.size(), MIA_STORE_SUFFIX.size(), MIA_STORE_SUFFIX) == 0;
+}
+
+// A store for a path ending in `.mia`, standard output for "-", a region file otherwise
+inline std::unique_ptr<ComplexWriter> openComplexWriter(const std::string& outputFile) {
+    if (isStorePath(outputFile)) {
+        return std::unique_ptr<ComplexWriter>(new StoreWriter(outputFile));
+    }
+    return std::unique_ptr<ComplexWriter>(new RegionWriter(outputFile));
+}
+
+#endif
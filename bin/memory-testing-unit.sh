@@ -14,13 +14,13 @@ anchor_options="no"
 out_dir="test_folder"
 
 # Check if the script is already running
-if pgrep -f "python main.py"; then
+if pgrep -f "miasort --path1"; then
     echo "The script is already running. Exiting."
     exit 1
 fi
 
 # Run the Python script in the background
-python main.py --path1 "$path1" --path2 "$path2" --type "$type" --graphs "$graphs" --numfrag_min "$numfrag_min" --anchor_options "$anchor_options" --out_dir "$out_dir" &
+miasort --path1 "$path1" --path2 "$path2" --type "$type" --graphs "$graphs" --numfrag_min "$numfrag_min" --anchor_options "$anchor_options" --out_dir "$out_dir" &
 
 # Get the PID of the Python script
 script_pid=$!
@@ -11,6 +11,9 @@
 #include <iomanip>
 #include <ctime>
 
+#include "chunk_reader.h"
+#include "complex_writer.h"
+
 std::string get_current_time() {
     auto now = std::chrono::system_clock::now();
     std::time_t currentTime = std::chrono::system_clock::to_time_t(now);
@@ -41,72 +44,77 @@ std::unordered_map<std::string, int> readChromSizes(const std::string& filepath)
     return chromSizes;
 }
 
-void processLine(const std::string& line, const std::unordered_map<std::string, int>& chromSizes, const std::string& libid,
-                int extbp, int selfbp, std::ofstream& fout, int& i, long long int& num_filtered, long long int& num_complexes,
-                long long int& num_lines) {
-    if (line.empty() || line[0] == '#') {
-        return;
-    }
+// A pair kept as a complex of two fragments; chrom and gemid point into the chunk it was parsed from
+struct PairComplex {
+    std::string_view chrom;
+    std::string_view gemid;
+    int start1, end1, start2, end2;
+};
 
-    std::istringstream ss(line);
-    std::vector<std::string> fields;
-    std::string field;
-    while (std::getline(ss, field, '\t')) {
-        fields.push_back(field);
-    }
+struct PairCounts {
+    long long int num_filtered = 0;
+    long long int num_complexes = 0;
+    long long int num_lines = 0;
+};
+
+void processLines(std::string_view text, const std::unordered_map<std::string_view, int>& chromSizes,
+                  int extbp, int selfbp, std::vector<PairComplex>& complexes, PairCounts& counts,
+                  std::string& messages) {
+    std::vector<std::string_view> fields;
+    forEachLine(text, [&](std::string_view line) {
+        if (line.empty() || line[0] == '#') {
+            return;
+        }
 
-    num_lines++;
+        splitFields(line, '\t', fields);
 
-    if (fields.size() < 5) {
-        std::cerr << "Skipping malformed line: " << line << std::endl;
-        return;
-    }
+        counts.num_lines++;
 
-    std::string gemid = fields[0];
-    std::string chrom1 = fields[1];
-    std::string chrom2 = fields[3];
+        if (fields.size() < 5) {
+            messages.append("Skipping malformed line: ").append(line).push_back('\n');
+            return;
+        }
 
-    int pos1, pos2;
-    try {
-        pos1 = std::stoi(fields[2]);
-        pos2 = std::stoi(fields[4]);
-    } catch (const std::invalid_argument& e) {
-        std::cerr << "Invalid position value in line: " << line << std::endl;
-        return;
-    }
+        std::string_view gemid = fields[0];
+        std::string_view chrom1 = fields[1];
+        std::string_view chrom2 = fields[3];
 
-    if (chrom1 == chrom2 && chrom1 != "chrM" && pos2 - pos1 > selfbp) {
-        auto it = chromSizes.find(chrom1);
-        if (it == chromSizes.end()) {
-            return; // Skip if chromosome not found
+        long long pos1, pos2;
+        if (!parseInt(fields[2], pos1) || !parseInt(fields[4], pos2)) {
+            messages.append("Invalid position value in line: ").append(line).push_back('\n');
+            return;
         }
-        int chromSize = it->second;
-
-        int start1 = std::max(0, pos1 - extbp);
-        int end1 = std::min(pos1 + extbp, chromSize);
-        int start2 = std::max(0, pos2 - extbp);
-        int end2 = std::min(pos2 + extbp, chromSize);
-        ++i;
-
-        fout << chrom1 << "\t" << start1 << "\t" << end1 << "\t2\t" << gemid << "\n";
-        fout << chrom1 << "\t" << start2 << "\t" << end2 << "\t2\t" << gemid << "\n";
-        num_complexes++;
-    } else {
-        num_filtered++;
-    }
+
+        if (chrom1 == chrom2 && chrom1 != "chrM" && pos2 - pos1 > selfbp) {
+            auto it = chromSizes.find(chrom1);
+            if (it == chromSizes.end()) {
+                return; // Skip if chromosome not found
+            }
+            int chromSize = it->second;
+
+            int start1 = std::max(0, (int)pos1 - extbp);
+            int end1 = std::min((int)pos1 + extbp, chromSize);
+            int start2 = std::max(0, (int)pos2 - extbp);
+            int end2 = std::min((int)pos2 + extbp, chromSize);
+
+            complexes.push_back({chrom1, gemid, start1, end1, start2, end2});
+            counts.num_complexes++;
+        } else {
+            counts.num_filtered++;
+        }
+    });
 }
 
-void readPairsAndWriteRegions(const std::string& pairsFile, const std::unordered_map<std::string, int>& chromSizes, const std::string& libid,
-                            int extbp, int selfbp, const std::string& outputFile, const std::string& logFile, int argc, char* argv[]) {
+void readPairsAndWriteRegions(const std::string& pairsFile, const std::unordered_map<std::string, int>& chromSizes,
+                            int extbp, int selfbp, int threads, const std::string& outputFile, const std::string& logFile,
+                            int argc, char* argv[]) {
 
     long long int num_filtered = 0;
     long long int num_complexes = 0;
     long long int num_lines = 0;
 
-    std::ofstream fout(outputFile);
-    if (!fout.is_open()) {
-        throw std::runtime_error("Unable to open output file at " + outputFile);
-    }
+    // "-" writes the complexes to standard output, e.g. to pipe them into `miasort`
+    std::unique_ptr<ComplexWriter> fout = openComplexWriter(outputFile);
 
     std::ofstream logfout(logFile);
     if (!logfout.is_open()) {
@@ -126,22 +134,35 @@ void readPairsAndWriteRegions(const std::string& pairsFile, const std::unordered
 
     logfout << "User Command: " << command << "\n\n";
 
-    gzFile gz = gzopen(pairsFile.c_str(), "rb");
-    if (!gz) {
-        throw std::runtime_error("Unable to open pairs file at " + pairsFile);
-    }
+    ChunkReader reader(pairsFile, threads);
+    const std::unordered_map<std::string_view, int> chromSizeViews = viewKeys(chromSizes);
 
-    char buffer[8192];
-    std::string line;
-    int i = 100000000;
+    // Each thread parses a share of the lines of a chunk; the shares are then written in file order
+    std::string chunk;
+    std::vector<std::vector<PairComplex>> complexes(threads);
+    std::vector<PairCounts> counts(threads);
+    std::vector<std::string> messages(threads);
 
     logfout << get_current_time() << " pairs2complexes starts\n" << std::endl;
-    while (gzgets(gz, buffer, sizeof(buffer)) != Z_NULL) {
-        line = buffer;
-        if (!line.empty() && line.back() == '\n') {
-            line.pop_back();
+    while (reader.next(chunk)) {
+        for (int k = 0; k < threads; ++k) {
+            complexes[k].clear();
+            counts[k] = PairCounts();
+            messages[k].clear();
+        }
+        parseInParallel(chunk, threads, [&](std::string_view text, size_t k) {
+            processLines(text, chromSizeViews, extbp, selfbp, complexes[k], counts[k], messages[k]);
+        });
+        for (int k = 0; k < threads; ++k) {
+            std::cerr << messages[k];
+            for (const PairComplex& complex : complexes[k]) {
+                fout->write(complex.chrom, complex.start1, complex.end1, 2, complex.gemid);
+                fout->write(complex.chrom, complex.start2, complex.end2, 2, complex.gemid);
+            }
+            num_filtered += counts[k].num_filtered;
+            num_complexes += counts[k].num_complexes;
+            num_lines += counts[k].num_lines;
         }
-        processLine(line, chromSizes, libid, extbp, selfbp, fout, i, num_filtered, num_complexes, num_lines);
     }
 
     logfout << "The total number of processed lines in the pairs file: " << num_lines << std::endl;
@@ -150,14 +171,13 @@ void readPairsAndWriteRegions(const std::string& pairsFile, const std::unordered
 
     logfout << "\n" << get_current_time() << " pairs2complexes ends" << std::endl;
 
-    gzclose(gz);
-    fout.close();
+    fout->close();
     logfout.close();
 }
 
 int main(int argc, char* argv[]) {
-    if (argc < 5 || argc > 7) {
-        std::cerr << "Usage: " << argv[0] << " <directory> <pairs_file> <chrom_sizes_file> <output_file> [<extbp> [<selfbp>]]" << std::endl;
+    if (argc < 5 || argc > 8) {
+        std::cerr << "Usage: " << argv[0] << " <directory> <pairs_file> <chrom_sizes_file> <output_file | output.mia | -> [<extbp> [<selfbp> [<threads>]]]" << std::endl;
         return 1;
     }
 
@@ -165,12 +185,14 @@ int main(int argc, char* argv[]) {
     std::string pairsFile = argv[2];
     std::string chromSizesFile = argv[3];
     std::string outputFile = argv[4];
-    outputFile += ".complexes";
+    // A `.mia` output is a complex store, which `miasort` loads without parsing text
+    if (outputFile != "-" && !isStorePath(outputFile)) {
+        outputFile += ".complexes";
+    }
 
     int extbp = (argc > 5) ? std::stoi(argv[5]) : 250;
     int selfbp = (argc > 6) ? std::stoi(argv[6]) : 8000;
-
-    std::string libid = pairsFile.substr(pairsFile.find_last_of("/") + 1, pairsFile.find(".bsorted.pairs.gz") - pairsFile.find_last_of("/") - 1);
+    int threads = (argc > 7) ? std::max(1, std::stoi(argv[7])) : 1;
 
     std::string inputFileName = pairsFile.substr(pairsFile.find_last_of("/") + 1);
     inputFileName = inputFileName.substr(0, inputFileName.find(".pairs.gz"));
@@ -179,7 +201,7 @@ int main(int argc, char* argv[]) {
 
     try {
         std::unordered_map<std::string, int> chromSizes = readChromSizes(chromSizesFile);
-        readPairsAndWriteRegions(pairsFile, chromSizes, libid, extbp, selfbp, outputFile, logFile, argc, argv);
+        readPairsAndWriteRegions(pairsFile, chromSizes, extbp, selfbp, threads, outputFile, logFile, argc, argv);
     } catch (const std::exception& e) {
         std::cerr << "Error: " << e.what() << std::endl;
         return 1;
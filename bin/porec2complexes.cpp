@@ -9,18 +9,23 @@
 #include <unordered_map>
 #include <iomanip>
 #include <algorithm>
+#include <climits>
 
+#include "chunk_reader.h"
+#include "complex_writer.h"
+
+// A fragment that passed the filter; chrom and readName point into the chunk it was parsed from
 struct Fragment {
-    std::string chrom;
-    std::string start;
-    std::string end;
-    std::string readName;
+    std::string_view chrom;
+    long long start;
+    long long end;
+    std::string_view readName;
 };
 
 // Helper function to calculate the midpoint
 float calculateMidpoint(const Fragment& fragment) {
-    int start = std::stoi(fragment.start);
-    int end = std::stoi(fragment.end);
+    int start = (int)fragment.start;
+    int end = (int)fragment.end;
     return start + (static_cast<float>(end - start) / 2);
 }
 
@@ -40,135 +45,71 @@ std::string get_current_time() {
     return oss.str();
 }
 
-std::unordered_map<std::string, int> readChromSizes(const std::string& filepath) {
-    std::unordered_map<std::string, int> chromSizes;
-    std::ifstream file(filepath);
-    if (!file.is_open()) {
-        throw std::runtime_error("Unable to open chromosome sizes file at " + filepath);
-    }
-
-    std::string line;
-    while (std::getline(file, line)) {
-        std::istringstream ss(line);
-        std::string chrom;
-        int size;
-        ss >> chrom >> size;
-        chromSizes[chrom] = size;
-    }
-    file.close();
-    return chromSizes;
-}
-
-void processLine(const std::string& line, std::vector<Fragment>& fragments,
-                std::string& currentReadName, long long int& fragmentCount, std::ofstream& fout,
-                long long int& num_frag, long long int& num_filtered, std::unordered_map<int, long long int>& histogram,
-                long long int& max_frag, long long int& min_frag, int extbp, int selfbp,
-                std::unordered_map<std::string, int>& chromSizes) {
-    std::istringstream ss(line);
-    std::string field;
-    std::vector<std::string> fields;
-
-    while (std::getline(ss, field, ',')) {
-        fields.push_back(field);
-    }
-
-    num_frag++;
-
-    if (fields.size() > 17 && fields[17] == "True") {  // Column 18: pass_filter == "True"
-        std::string chrom = fields[3];  // Column 4: chrom
-        std::string start = fields[4];  // Column 5: start
-        std::string end = fields[5];  // Column 6: end
-        std::string readName = fields[7];  // Column 8: read_name
-
-        if (readName != currentReadName) {
-            if (!currentReadName.empty()) {
-                std::unordered_map<std::string, std::vector<Fragment>> chromMap;
-
-                for (const auto& fragment : fragments) {
-                    chromMap[fragment.chrom].push_back(fragment);
-                }
-
-                int num_frag_in_complex = 0;
-                for (auto&[chrom, fragment_vec] : chromMap) {
-                    if (fragment_vec.size() == 1) {
-                        auto fragment = fragment_vec[0];
-                        num_frag_in_complex++;
-                        fout << fragment.chrom << "\t" << fragment.start << "\t" << fragment.end << "\t" << "1" << "\t" << fragment.readName << "\n";
-                    } else {
-                        std::sort(fragment_vec.begin(), fragment_vec.end(), compareFragments);
-                        std::vector<Fragment> validPositions;
-                        validPositions.push_back(fragment_vec.front());
-
-                        for (size_t j = 1; j < fragment_vec.size(); ++j) {
-                            int pos1 = std::stoi(validPositions.back().end);
-                            int pos2 = std::stoi(fragment_vec[j].start);
-                            if (pos2 - pos1 > selfbp) {
-                                validPositions.push_back(fragment_vec[j]);
-                            } else {
-                                num_filtered++;
-                            }
-                        }
-
-                        if (validPositions.size() == 1) {
-                            validPositions.clear();
-                        }
-
-                        int len = validPositions.size();
-                        num_frag_in_complex += len;
-                        for (auto& fragment : validPositions) {
-                            fout << fragment.chrom << "\t" << fragment.start << "\t" << fragment.end << "\t" << len << "\t" << fragment.readName << "\n";
-                        }
-                    }
-                }
-                if (num_frag_in_complex >= 6 && num_frag_in_complex <= 10) {
-                    histogram[6]++;
-                } else if (num_frag_in_complex >= 11 && num_frag_in_complex <= 50) {
-                    histogram[11]++;
-                } else if (num_frag_in_complex > 50) {
-                    histogram[51]++;
-                } else {
-                    histogram[num_frag_in_complex]++;
-                }
+struct PorecCounts {
+    long long int num_frag = 0;
+    long long int num_lines = 0;
+};
 
-                if (num_frag_in_complex > max_frag) {
-                    max_frag = num_frag_in_complex;
-                }
-                if (num_frag_in_complex < min_frag && num_frag_in_complex != 0) {
-                    min_frag = num_frag_in_complex;
-                }
-                fragments.clear();  // Clear fragments for the next readName
+// Parses the lines of text into the fragments that pass the filter, in file order
+void processLines(std::string_view text, std::vector<Fragment>& fragments, PorecCounts& counts,
+                  std::string& messages) {
+    std::vector<std::string_view> fields;
+    forEachLine(text, [&](std::string_view line) {
+        counts.num_lines++;
+        splitFields(line, ',', fields);
+
+        counts.num_frag++;
+
+        if (fields.size() > 17 && fields[17] == "True") {  // Column 18: pass_filter == "True"
+            Fragment fragment;
+            fragment.chrom = fields[3];  // Column 4: chrom
+            fragment.readName = fields[7];  // Column 8: read_name
+            // Columns 5 and 6: start and end
+            if (!parseInt(fields[4], fragment.start) || !parseInt(fields[5], fragment.end)) {
+                messages.append("Invalid position value in line: ").append(line).push_back('\n');
+                return;
             }
-            currentReadName = readName;  // Update currentReadName to the new readName
+            fragments.push_back(fragment);
         }
-        fragments.push_back({chrom, start, end, readName});
-    }
+    });
 }
 
-void writeFragments(std::ofstream& fout, const std::vector<Fragment>& fragments,
-                    int fragmentCount, std::unordered_map<int, long long int>& histogram,
-                    long long int& min_frag, long long int& max_frag, int extbp, int selfbp,
-                    std::unordered_map<std::string, int>& chromSizes, long long int& num_filtered) {
-    std::unordered_map<std::string, std::vector<Fragment>> chromMap;
-
-    for (const auto& fragment : fragments) {
-        chromMap[fragment.chrom].push_back(fragment);
+void writeFragments(ComplexWriter& fout, std::vector<Fragment>& fragments,
+                    std::unordered_map<int, long long int>& histogram,
+                    long long int& min_frag, long long int& max_frag, int selfbp, long long int& num_filtered) {
+    // Group the fragments by chromosome, in order of first appearance
+    std::vector<std::string_view> chroms;
+    std::vector<size_t> group(fragments.size());
+    for (size_t f = 0; f < fragments.size(); ++f) {
+        group[f] = std::find(chroms.begin(), chroms.end(), fragments[f].chrom) - chroms.begin();
+        if (group[f] == chroms.size()) {
+            chroms.push_back(fragments[f].chrom);
+        }
     }
 
     int num_frag_in_complex = 0;
-    for (auto&[chrom, fragment_vec] : chromMap) {
+    std::vector<Fragment> fragment_vec;
+    std::vector<Fragment> validPositions;
+    for (size_t c = 0; c < chroms.size(); ++c) {
+        fragment_vec.clear();
+        for (size_t f = 0; f < fragments.size(); ++f) {
+            if (group[f] == c) {
+                fragment_vec.push_back(fragments[f]);
+            }
+        }
+
         if (fragment_vec.size() == 1) {
-            auto fragment = fragment_vec[0];
+            const Fragment& fragment = fragment_vec[0];
             num_frag_in_complex++;
-            fout << fragment.chrom << "\t" << fragment.start << "\t" << fragment.end << "\t" << "1" << "\t" << fragment.readName << "\n";
+            fout.write(fragment.chrom, fragment.start, fragment.end, 1, fragment.readName);
         } else {
-            std::sort(fragment_vec.begin(), fragment_vec.end(), compareFragments);
-            std::vector<Fragment> validPositions;
+            std::stable_sort(fragment_vec.begin(), fragment_vec.end(), compareFragments);
+            validPositions.clear();
             validPositions.push_back(fragment_vec.front());
 
             for (size_t j = 1; j < fragment_vec.size(); ++j) {
-                std::cout << validPositions.back().end << " " << fragment_vec[j].start << std::endl;
-                int pos1 = std::stoi(validPositions.back().end);
-                int pos2 = std::stoi(fragment_vec[j].start);
+                int pos1 = (int)validPositions.back().end;
+                int pos2 = (int)fragment_vec[j].start;
                 if (pos2 - pos1 > selfbp) {
                     validPositions.push_back(fragment_vec[j]);
                 } else {
@@ -182,8 +123,8 @@ void writeFragments(std::ofstream& fout, const std::vector<Fragment>& fragments,
 
             int len = validPositions.size();
             num_frag_in_complex += len;
-            for (auto& fragment : validPositions) {
-                fout << fragment.chrom << "\t" << fragment.start << "\t" << fragment.end << "\t" << len << "\t" << fragment.readName << "\n";
+            for (const Fragment& fragment : validPositions) {
+                fout.write(fragment.chrom, fragment.start, fragment.end, len, fragment.readName);
             }
         }
     }
@@ -206,11 +147,8 @@ void writeFragments(std::ofstream& fout, const std::vector<Fragment>& fragments,
 }
 
 void readCSVAndWriteRegions(const std::string& csvFile, const std::string& outputFile, const std::string& logFile,
-                            int argc, char* argv[], int extbp, int selfbp, std::unordered_map<std::string, int>& chromSizes) {
-    std::ofstream fout(outputFile);
-    if (!fout.is_open()) {
-        throw std::runtime_error("Unable to open output file at " + outputFile);
-    }
+                            int argc, char* argv[], int selfbp, int threads) {
+    std::unique_ptr<ComplexWriter> fout = openComplexWriter(outputFile);
 
     std::ofstream logfout(logFile);
     if (!logfout.is_open()) {
@@ -229,15 +167,7 @@ void readCSVAndWriteRegions(const std::string& csvFile, const std::string& outpu
     }
     logfout << "User Command: " << command << "\n\n";
 
-    gzFile gz = gzopen(csvFile.c_str(), "rb");
-    if (!gz) {
-        throw std::runtime_error("Unable to open gzipped CSV file at " + csvFile);
-    }
-
-    std::string line;
-    std::string currentReadName;
-    long long int fragmentCount = 0;
-    std::vector<Fragment> fragments;
+    ChunkReader reader(csvFile, threads);
 
     std::unordered_map<int, long long int> histogram;
 
@@ -249,23 +179,56 @@ void readCSVAndWriteRegions(const std::string& csvFile, const std::string& outpu
 
     logfout << get_current_time() << " porec2complexes starts\n" << std::endl;
 
-    char buffer[8192];
-    while (gzgets(gz, buffer, sizeof(buffer)) != Z_NULL) {
-        line = buffer;
-
-        while (!line.empty() && line.back() != '\n' && gzgets(gz, buffer, sizeof(buffer)) != Z_NULL) {
-            line.append(buffer);
+    // Lines are parsed on all threads, a share of the chunk each; the fragments of a read
+    // are then gathered in file order, and the read is written when the next one starts
+    std::string chunk;
+    std::vector<std::vector<Fragment>> parsed(threads);
+    std::vector<PorecCounts> counts(threads);
+    std::vector<std::string> messages(threads);
+    std::vector<Fragment> fragments;
+    // The fragments of a read still open at the end of a chunk are copied into one of these, as the chunk is reused
+    std::string storages[2];
+    int current = 0;
+    while (reader.next(chunk)) {
+        for (int k = 0; k < threads; ++k) {
+            parsed[k].clear();
+            counts[k] = PorecCounts();
+            messages[k].clear();
+        }
+        parseInParallel(chunk, threads, [&](std::string_view text, size_t k) {
+            processLines(text, parsed[k], counts[k], messages[k]);
+        });
+        for (int k = 0; k < threads; ++k) {
+            std::cerr << messages[k];
+            num_frag += counts[k].num_frag;
+            num_lines += counts[k].num_lines;
+            for (const Fragment& fragment : parsed[k]) {
+                if (!fragments.empty() && fragment.readName != fragments.front().readName) {
+                    writeFragments(*fout, fragments, histogram, min_frag, max_frag, selfbp, num_filtered);
+                    fragments.clear();  // Clear fragments for the next readName
+                }
+                fragments.push_back(fragment);
+            }
         }
 
-        if (!line.empty()) {
-            num_lines++;
-            processLine(line, fragments, currentReadName, fragmentCount, fout, num_frag, num_filtered,
-            histogram, max_frag, min_frag, extbp, selfbp, chromSizes);
+        // The names may point into the storage of the previous chunk, so they are copied into the other one
+        current = 1 - current;
+        std::string& storage = storages[current];
+        storage.clear();
+        for (const Fragment& fragment : fragments) {
+            storage.append(fragment.chrom).append(fragment.readName);
+        }
+        size_t offset = 0;
+        for (Fragment& fragment : fragments) {
+            size_t chromSize = fragment.chrom.size(), readNameSize = fragment.readName.size();
+            fragment.chrom = std::string_view(storage.data() + offset, chromSize);
+            fragment.readName = std::string_view(storage.data() + offset + chromSize, readNameSize);
+            offset += chromSize + readNameSize;
         }
     }
 
     if (!fragments.empty()) {
-        writeFragments(fout, fragments, fragmentCount, histogram, min_frag, max_frag, extbp, selfbp, chromSizes, num_filtered);
+        writeFragments(*fout, fragments, histogram, min_frag, max_frag, selfbp, num_filtered);
     }
 
     long long int num_complexes = 0;
@@ -292,25 +255,28 @@ void readCSVAndWriteRegions(const std::string& csvFile, const std::string& outpu
 
     logfout << "\n" << get_current_time() << " porec2complexes ends" << std::endl;
 
-    gzclose(gz);
-    fout.close();
+    fout->close();
     logfout.close();
 }
 
 int main(int argc, char* argv[]) {
-    if (argc < 5 || argc > 7) {
-        std::cerr << "Usage: " << argv[0] << " <directory> <csv_file>  <chrom_sizes_file> <output_file> [<extbp> [<selfbp>]]" << std::endl;
+    if (argc < 5 || argc > 8) {
+        std::cerr << "Usage: " << argv[0] << " <directory> <csv_file>  <chrom_sizes_file> <output_file | output.mia | -> [<extbp> [<selfbp> [<threads>]]]" << std::endl;
         return 1;
     }
 
     std::string directory = argv[1];
     std::string csvFile = argv[2];
-    std::string chromSizesFile = argv[3];
+    // Pore-C fragments keep their aligned coordinates: <chrom_sizes_file> and <extbp>
+    // are only taken for the argument order of the other converters
     std::string outputFile = argv[4];
-    outputFile += ".complexes";
+    // A `.mia` output is a complex store, which `miasort` loads without parsing text
+    if (outputFile != "-" && !isStorePath(outputFile)) {
+        outputFile += ".complexes";
+    }
 
-    int extbp = (argc > 5) ? std::stoi(argv[4]) : 250;
-    int selfbp = (argc > 6) ? std::stoi(argv[5]) : 8000;
+    int selfbp = (argc > 6) ? std::stoi(argv[6]) : 8000;
+    int threads = (argc > 7) ? std::max(1, std::stoi(argv[7])) : 1;
 
     std::string inputFileName = csvFile.substr(csvFile.find_last_of("/") + 1);
     inputFileName = inputFileName.substr(0, inputFileName.find(".csv.gz"));
@@ -318,8 +284,7 @@ int main(int argc, char* argv[]) {
     std::string logFile = directory + "/porec2complexes_" + inputFileName + ".log";
 
     try {
-        std::unordered_map<std::string, int> chromSizes = readChromSizes(chromSizesFile);
-        readCSVAndWriteRegions(csvFile, outputFile, logFile, argc, argv, extbp, selfbp, chromSizes);
+        readCSVAndWriteRegions(csvFile, outputFile, logFile, argc, argv, selfbp, threads);
     } catch (const std::exception& e) {
         std::cerr << "Error: " << e.what() << std::endl;
         return 1;
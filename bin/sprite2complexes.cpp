@@ -4,12 +4,16 @@
 #include <string>
 #include <vector>
 #include <algorithm>
+#include <climits>
 #include <unordered_map>
 #include <zlib.h>
 #include <ctime>
 #include <chrono> // Include for std::chrono
 #include <iomanip> // Include for std::put_time
 
+#include "chunk_reader.h"
+#include "complex_writer.h"
+
 std::string get_current_time() {
     auto now = std::chrono::system_clock::now();
     std::time_t currentTime = std::chrono::system_clock::to_time_t(now);
@@ -40,121 +44,155 @@ std::unordered_map<std::string, int> readChromSizes(const std::string& filepath)
     return chromSizes;
 }
 
-void processClusterLine(const std::string& line, const std::unordered_map<std::string, int>& chromSizes,
-                        const std::string& libid, int extbp, int selfbp, std::ofstream& fout, int& i,
-                        long long int& num_frag, long long int& num_filtered,
-                        std::unordered_map<int, long long int>& histogram,
-                        long long int& max_frag, long long int& min_frag) {
-    std::istringstream ss(line);
-    std::string id;
-    ss >> id;
-
-    std::unordered_map<std::string, std::vector<int>> chromPositions;
-    std::string location;
-    while (ss >> location) {
-        size_t colonPos = location.find(':');
-        if (colonPos == std::string::npos || colonPos == location.length() - 1) {
-            std::cerr << "Error: Malformed location string: " << location << std::endl;
-            continue; // Skip malformed locations
-        }
+// A fragment kept from a cluster; chrom and id point into the chunk it was parsed from
+struct SpriteFragment {
+    std::string_view chrom;
+    std::string_view id;
+    int start, end, size;
+};
 
-        std::string chrom = location.substr(0, colonPos);
-        std::string posStr = location.substr(colonPos + 1);
+struct SpriteCounts {
+    std::unordered_map<int, long long int> histogram;
+    long long int num_frag = 0;
+    long long int num_filtered = 0;
+    long long int max_frag = LLONG_MIN;
+    long long int min_frag = LLONG_MAX;
+    long long int num_lines = 0;
+};
+
+// Calls f(token) for each whitespace-separated token of line
+template <typename F>
+void forEachToken(std::string_view line, F f) {
+    const char* whitespace = " \t\r\n\v\f";
+    size_t begin = line.find_first_not_of(whitespace);
+    while (begin != std::string_view::npos) {
+        size_t end = line.find_first_of(whitespace, begin);
+        f(line.substr(begin, end == std::string_view::npos ? std::string_view::npos : end - begin));
+        begin = end == std::string_view::npos ? end : line.find_first_not_of(whitespace, end);
+    }
+}
 
-        if (posStr.empty() || !std::all_of(posStr.begin(), posStr.end(), ::isdigit)) {
-            std::cerr << "Error: Invalid position string: " << posStr << " in line: " << line << std::endl;
-            continue;
-        }
+void processClusterLines(std::string_view text, const std::unordered_map<std::string_view, int>& chromSizes,
+                         int extbp, int selfbp, std::vector<SpriteFragment>& fragments, SpriteCounts& counts,
+                         std::string& messages) {
+    // Positions of a cluster as (chromosome, position), chromosomes numbered by first appearance
+    std::vector<std::string_view> chroms;
+    std::vector<std::pair<size_t, int>> positions;
+    std::vector<int> validPositions;
+
+    forEachLine(text, [&](std::string_view line) {
+        counts.num_lines++;
+        chroms.clear();
+        positions.clear();
+
+        std::string_view id;
+        bool first = true;
+        forEachToken(line, [&](std::string_view location) {
+            if (first) {
+                id = location;
+                first = false;
+                return;
+            }
+            size_t colonPos = location.find(':');
+            if (colonPos == std::string_view::npos || colonPos == location.length() - 1) {
+                messages.append("Error: Malformed location string: ").append(location).push_back('\n');
+                return; // Skip malformed locations
+            }
 
-        try {
-            int pos = std::stoi(posStr);
-            chromPositions[chrom].push_back(pos);
-        } catch (const std::invalid_argument& e) {
-            std::cerr << "Error: Invalid position string: " << posStr << " in line: " << line << std::endl;
-            continue;
-        } catch (const std::out_of_range& e) {
-            std::cerr << "Error: Position out of range: " << posStr << " in line: " << line << std::endl;
-            continue;
-        }
-    }
+            std::string_view chrom = location.substr(0, colonPos);
+            std::string_view posStr = location.substr(colonPos + 1);
 
-    int num_frag_in_complex = 0;
-    for (auto& [chrom, positions] : chromPositions) {
-        num_frag += positions.size();
-        if (positions.size() == 1) {
-            int pos1 = positions[0];
-            auto it = chromSizes.find(chrom);
-            if (it == chromSizes.end()) {
-                continue;
+            if (!std::all_of(posStr.begin(), posStr.end(), ::isdigit)) {
+                messages.append("Error: Invalid position string: ").append(posStr)
+                        .append(" in line: ").append(line).push_back('\n');
+                return;
             }
-            int chromSize = it->second;
-            int start1 = std::max(0, pos1 - extbp);
-            int end1 = std::min(pos1 + extbp, chromSize);
-            ++i;
-            num_frag_in_complex += 1;
-            fout << chrom << "\t" << start1 << "\t" << end1 << "\t1\t" << id << "\n";
-        } else if (positions.size() > 1) {
-            std::sort(positions.begin(), positions.end());
-
-            std::vector<int> validPositions;
-            validPositions.push_back(positions.front());
-
-            for (size_t j = 1; j < positions.size(); ++j) {
-                int pos1 = validPositions.back();
-                int pos2 = positions[j];
-                if (pos2 - pos1 > selfbp) {
-                    validPositions.push_back(positions[j]);
-                } else {
-                    num_filtered++;
-                }
+
+            long long pos;
+            if (!parseInt(posStr, pos) || pos > INT_MAX) {
+                messages.append("Error: Position out of range: ").append(posStr)
+                        .append(" in line: ").append(line).push_back('\n');
+                return;
             }
 
-            if (validPositions.size() == 1) {
-                validPositions.clear();
+            size_t code = std::find(chroms.begin(), chroms.end(), chrom) - chroms.begin();
+            if (code == chroms.size()) {
+                chroms.push_back(chrom);
             }
+            positions.emplace_back(code, (int)pos);
+        });
+
+        std::sort(positions.begin(), positions.end());
+
+        int num_frag_in_complex = 0;
+        for (size_t group = 0; group < positions.size();) {
+            size_t groupEnd = group;
+            while (groupEnd < positions.size() && positions[groupEnd].first == positions[group].first) {
+                ++groupEnd;
+            }
+            std::string_view chrom = chroms[positions[group].first];
+            auto it = chromSizes.find(chrom);
+            counts.num_frag += groupEnd - group;
 
-            int len = validPositions.size();
-            num_frag_in_complex += len;
-            for (int pos : validPositions) {
-                auto it = chromSizes.find(chrom);
-                if (it == chromSizes.end()) {
-                    continue;
+            if (groupEnd - group == 1) {
+                if (it != chromSizes.end()) {
+                    int pos1 = positions[group].second;
+                    num_frag_in_complex += 1;
+                    fragments.push_back({chrom, id, std::max(0, pos1 - extbp), std::min(pos1 + extbp, it->second), 1});
+                }
+            } else {
+                validPositions.clear();
+                validPositions.push_back(positions[group].second);
+
+                for (size_t j = group + 1; j < groupEnd; ++j) {
+                    int pos1 = validPositions.back();
+                    int pos2 = positions[j].second;
+                    if (pos2 - pos1 > selfbp) {
+                        validPositions.push_back(pos2);
+                    } else {
+                        counts.num_filtered++;
+                    }
+                }
+
+                if (validPositions.size() == 1) {
+                    validPositions.clear();
+                }
+
+                int len = validPositions.size();
+                num_frag_in_complex += len;
+                if (it != chromSizes.end()) {
+                    for (int pos : validPositions) {
+                        fragments.push_back({chrom, id, std::max(0, pos - extbp), std::min(pos + extbp, it->second), len});
+                    }
                 }
-                int chromSize = it->second;
-                int start1 = std::max(0, pos - extbp);
-                int end1 = std::min(pos + extbp, chromSize);
-                ++i;
-                fout << chrom << "\t" << start1 << "\t" << end1 << "\t" << len << "\t" << id << "\n";
             }
+            group = groupEnd;
         }
-    }
 
-    if (num_frag_in_complex >= 6 && num_frag_in_complex <= 10) {
-        histogram[6]++;
-    } else if (num_frag_in_complex >= 11 && num_frag_in_complex <= 50) {
-        histogram[11]++;
-    } else if (num_frag_in_complex > 50) {
-        histogram[51]++;
-    } else {
-        histogram[num_frag_in_complex]++;
-    }
+        if (num_frag_in_complex >= 6 && num_frag_in_complex <= 10) {
+            counts.histogram[6]++;
+        } else if (num_frag_in_complex >= 11 && num_frag_in_complex <= 50) {
+            counts.histogram[11]++;
+        } else if (num_frag_in_complex > 50) {
+            counts.histogram[51]++;
+        } else {
+            counts.histogram[num_frag_in_complex]++;
+        }
 
-    if (num_frag_in_complex > max_frag) {
-        max_frag = num_frag_in_complex;
-    }
+        if (num_frag_in_complex > counts.max_frag) {
+            counts.max_frag = num_frag_in_complex;
+        }
 
-    if (num_frag_in_complex < min_frag && num_frag_in_complex != 0) {
-        min_frag = num_frag_in_complex;
-    }
+        if (num_frag_in_complex < counts.min_frag && num_frag_in_complex != 0) {
+            counts.min_frag = num_frag_in_complex;
+        }
+    });
 }
 
 void readSpriteAndWriteRegions(const std::string& spriteFile, const std::unordered_map<std::string, int>& chromSizes,
-                                const std::string& libid, int extbp, int selfbp, const std::string& outputFile,
+                                int extbp, int selfbp, int threads, const std::string& outputFile,
                                 const std::string& logFile, int argc, char* argv[]) {
-    std::ofstream fout(outputFile);
-    if (!fout.is_open()) {
-        throw std::runtime_error("Unable to open output file at " + outputFile);
-    }
+    std::unique_ptr<ComplexWriter> fout = openComplexWriter(outputFile);
 
     std::ofstream logfout(logFile);
     if (!logfout.is_open()) {
@@ -173,14 +211,8 @@ void readSpriteAndWriteRegions(const std::string& spriteFile, const std::unorder
     }
     logfout << "User Command: " << command << "\n\n";
 
-    gzFile gz = gzopen(spriteFile.c_str(), "rb");
-    if (!gz) {
-        throw std::runtime_error("Unable to open sprite file at " + spriteFile);
-    }
-
-    std::string line;
-    int i = 100000000;
-    char buffer[8192];
+    ChunkReader reader(spriteFile, threads);
+    const std::unordered_map<std::string_view, int> chromSizeViews = viewKeys(chromSizes);
 
     std::unordered_map<int, long long int> histogram;
 
@@ -190,15 +222,36 @@ void readSpriteAndWriteRegions(const std::string& spriteFile, const std::unorder
     long long int min_frag = LLONG_MAX;
     long long int num_lines = 0;
 
+    // Each thread parses a share of the clusters of a chunk; the shares are then written in file order
+    std::string chunk;
+    std::vector<std::vector<SpriteFragment>> fragments(threads);
+    std::vector<SpriteCounts> counts(threads);
+    std::vector<std::string> messages(threads);
+
     logfout << get_current_time() << " sprite2complexes starts\n" << std::endl;
-    while (gzgets(gz, buffer, sizeof(buffer)) != Z_NULL) {
-        std::string part(buffer);
-        while (part.back() != '\n' && gzgets(gz, buffer, sizeof(buffer)) != Z_NULL) {
-            part.append(buffer);
+    while (reader.next(chunk)) {
+        for (int k = 0; k < threads; ++k) {
+            fragments[k].clear();
+            counts[k] = SpriteCounts();
+            messages[k].clear();
+        }
+        parseInParallel(chunk, threads, [&](std::string_view text, size_t k) {
+            processClusterLines(text, chromSizeViews, extbp, selfbp, fragments[k], counts[k], messages[k]);
+        });
+        for (int k = 0; k < threads; ++k) {
+            std::cerr << messages[k];
+            for (const SpriteFragment& fragment : fragments[k]) {
+                fout->write(fragment.chrom, fragment.start, fragment.end, fragment.size, fragment.id);
+            }
+            for (const auto& pair : counts[k].histogram) {
+                histogram[pair.first] += pair.second;
+            }
+            num_frag += counts[k].num_frag;
+            num_filtered += counts[k].num_filtered;
+            max_frag = std::max(max_frag, counts[k].max_frag);
+            min_frag = std::min(min_frag, counts[k].min_frag);
+            num_lines += counts[k].num_lines;
         }
-        line = part;
-        num_lines++;
-        processClusterLine(line, chromSizes, libid, extbp, selfbp, fout, i, num_frag, num_filtered, histogram, max_frag, min_frag);
     }
 
     long long int num_complexes = 0;
@@ -225,14 +278,13 @@ void readSpriteAndWriteRegions(const std::string& spriteFile, const std::unorder
 
     logfout << "\n" << get_current_time() << " sprite2complexes ends" << std::endl;
 
-    gzclose(gz);
-    fout.close();
+    fout->close();
     logfout.close();
 }
 
 int main(int argc, char* argv[]) {
-    if (argc < 5 || argc > 7) {
-        std::cerr << "Usage: " << argv[0] << " <directory> <sprite_file> <chrom_sizes_file> <output_file> [<extbp> [<selfbp>]]" << std::endl;
+    if (argc < 5 || argc > 8) {
+        std::cerr << "Usage: " << argv[0] << " <directory> <sprite_file> <chrom_sizes_file> <output_file | output.mia | -> [<extbp> [<selfbp> [<threads>]]]" << std::endl;
         return 1;
     }
 
@@ -240,12 +292,14 @@ int main(int argc, char* argv[]) {
     std::string spriteFile = argv[2];
     std::string chromSizesFile = argv[3];
     std::string outputFile = argv[4];
-    outputFile += ".complexes";
+    // A `.mia` output is a complex store, which `miasort` loads without parsing text
+    if (outputFile != "-" && !isStorePath(outputFile)) {
+        outputFile += ".complexes";
+    }
 
     int extbp = (argc > 5) ? std::stoi(argv[5]) : 250;
     int selfbp = (argc > 6) ? std::stoi(argv[6]) : 8000;
-
-    std::string libid = spriteFile.substr(spriteFile.find_last_of("/") + 1, spriteFile.find(".clusters") - spriteFile.find_last_of("/") - 1);
+    int threads = (argc > 7) ? std::max(1, std::stoi(argv[7])) : 1;
 
     std::string inputFileName = spriteFile.substr(spriteFile.find_last_of("/") + 1);
     inputFileName = inputFileName.substr(0, inputFileName.find(".clusters.gz"));
@@ -254,7 +308,7 @@ int main(int argc, char* argv[]) {
 
     try {
         std::unordered_map<std::string, int> chromSizes = readChromSizes(chromSizesFile);
-        readSpriteAndWriteRegions(spriteFile, chromSizes, libid, extbp, selfbp, outputFile, logFile, argc, argv);
+        readSpriteAndWriteRegions(spriteFile, chromSizes, extbp, selfbp, threads, outputFile, logFile, argc, argv);
     } catch (const std::exception& e) {
         std::cerr << "Error: " << e.what() << std::endl;
         return 1;
@@ -10,7 +10,7 @@ set -x
 start_time=$(date +%s)
 
 # Run the Python script with time measurement
-time python main.py --path1 LHG0035N_0035V_0045V.bsorted.pairs.ext250bp.g8000bp.region --path2 anchors-400.bedte \
+time miasort --path1 LHG0035N_0035V_0045V.bsorted.pairs.ext250bp.g8000bp.region --path2 anchors-400.bedte \
 --type abc --graphs BtoA\;BtoC\;AtoB\;AtoC\;CtoA\;CtoB\;AandC\;Bcentered --numfrag_min 2  --anchor_options no --out_dir test_folder_400_lhg
 
 # Record the end time
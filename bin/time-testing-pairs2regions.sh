@@ -4,7 +4,7 @@
 set -Eeuo pipefail
 set -x
 
-g++ -std=c++11 -o ./bin/pairs2complexes ./bin/pairs2complexes.cpp -lz -lpthread
+g++ -std=c++17 -O2 -o ./bin/pairs2complexes ./bin/pairs2complexes.cpp -lz -pthread
 
 # Record the start time
 start_time=$(date +%s)
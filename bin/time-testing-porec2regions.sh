@@ -4,7 +4,7 @@
 set -Eeuo pipefail
 set -x
 
-g++ -std=c++17 -o ./bin/porec2complexes ./bin/porec2complexes.cpp -lz
+g++ -std=c++17 -O2 -o ./bin/porec2complexes ./bin/porec2complexes.cpp -lz -pthread
 
 # Record the start time
 start_time=$(date +%s)
@@ -4,7 +4,7 @@
 set -Eeuo pipefail
 set -x
 
-g++ -std=c++17 -o ./bin/sprite2complexes ./bin/sprite2complexes.cpp -lz
+g++ -std=c++17 -O2 -o ./bin/sprite2complexes ./bin/sprite2complexes.cpp -lz -pthread
 
 # Record the start time
 start_time=$(date +%s)
@@ -1,3 +1,5 @@
 """A Tool for Multiplex Chromatin Interaction Analysis by Efficiently Sorting Chromatin Complexes."""
 
-from .miasort import abc_sort, multiple_sort, unlimited_multiple_sort
+from .miasort import abc_sort, multiple_sort, unlimited_multiple_sort, batch_multiple_sort, \
+    compile_complexes, load_complexes, anchor_cooccurrence, load_cooccurrence
+from .dataset import Dataset
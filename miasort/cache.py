@@ -0,0 +1,66 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024
+
+
+class GemSetCache:
+    """LRU cache of the GEMs touching a genomic interval, bounded by memory.
+
+    Keys are (chrom, start, end) tuples and values are GEM id sets (bedtools
+    engine) or sorted GEM code arrays (numpy engine). Once the estimated size of
+    the cached values exceeds budget bytes, the least recently used intervals are
+    evicted. Lookups and evictions are counted for stats().
+    """
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        size = value_size(value)
+        if size > self.budget:
+            return
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.budget:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "entries": len(self.entries),
+                "bytes": self.nbytes, "budget": self.budget}
+
+
+def value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
@@ -0,0 +1,117 @@
+import json
+import os
+from collections import deque
+
+MANIFEST_NAME = "run_manifest.jsonl"
+MANIFEST_VERSION = 1
+
+
+class RunManifest:
+    """Append-only record of the anchor triples completed by a run in out_dir.
+
+    The first line holds the run parameters and the CSV file name; each later
+    line records one completed anchor triple with its schemes and the size of the
+    CSV file once its rows were written. On resume, the CSV is cut back to the
+    last recorded size, so rows of a triple that was interrupted half-way are
+    dropped and written again in one piece. A run extended to another anchor
+    file moves the rows to the CSV file of the current run.
+    """
+
+    def __init__(self, out_dir, parameters, csv_file, resume=False):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.csv_path = os.path.join(out_dir, csv_file)
+        self.parameters = parameters
+        self.csv_file = csv_file
+        self.completed = set()
+        self.csv_size = 0
+        self.pending = deque()
+
+        if resume and self.exists(out_dir):
+            self.load()
+            # Drop rows written after the last completed anchor triple
+            with open(self.csv_path, 'a') as file:
+                file.truncate(self.csv_size)
+            self.file = open(self.path, 'a')
+        else:
+            self.file = open(self.path, 'w')
+            self.append({"version": MANIFEST_VERSION, "parameters": parameters, "csv_file": csv_file})
+
+    @staticmethod
+    def exists(out_dir):
+        """Whether out_dir holds a manifest with a complete header; an empty or cut one counts as missing."""
+        try:
+            with open(os.path.join(out_dir, MANIFEST_NAME), 'r') as file:
+                header = file.readline()
+            return header.endswith("\n") and isinstance(json.loads(header), dict)
+        except (OSError, ValueError):
+            return False
+
+    @property
+    def resumed(self):
+        return self.csv_size > 0
+
+    def load(self):
+        with open(self.path, 'r') as file:
+            lines = file.readlines()
+
+        header = json.loads(lines[0])
+        if header.get("version") != MANIFEST_VERSION or header["parameters"] != self.parameters:
+            raise ValueError(f"{self.path} was written by a run with other parameters "
+                             f"({header.get('parameters')}), use another out_dir or resume=False")
+        # The rows of the recorded run continue in the CSV file of this one
+        recorded_path = os.path.join(os.path.dirname(self.path), header["csv_file"])
+        if header["csv_file"] != self.csv_file:
+            if os.path.exists(recorded_path):
+                os.replace(recorded_path, self.csv_path)
+            header["csv_file"] = self.csv_file
+            lines[0] = json.dumps(header) + "\n"
+            rewritten = self.path + ".tmp"
+            with open(rewritten, 'w') as file:
+                file.writelines(lines)
+            os.replace(rewritten, self.path)
+
+        valid_size = len(lines[0])
+        for line in lines[1:]:
+            # Only the last line can be cut short by a crash
+            if not line.endswith("\n"):
+                break
+            entry = json.loads(line)
+            self.completed.add(entry["key"])
+            self.csv_size = entry["csv_size"]
+            valid_size += len(line)
+
+        with open(self.path, 'a') as file:
+            file.truncate(valid_size)
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def done(self, key):
+        return key in self.completed
+
+    def commit(self, key, schemes, plots=()):
+        """Record an anchor triple once its rows are written and its plots are rendered.
+
+        plots are the futures of its queued plots; triples are recorded in order,
+        as soon as all plots of the triples before them are done.
+        """
+        self.pending.append((key, schemes, os.path.getsize(self.csv_path), [p for p in plots if p is not None]))
+        self.flush(wait=False)
+
+    def flush(self, wait=True):
+        while self.pending:
+            key, schemes, csv_size, plots = self.pending[0]
+            if not wait and not all(plot.done() for plot in plots):
+                return
+            for plot in plots:
+                plot.result()
+            self.pending.popleft()
+            self.append({"key": key, "schemes": schemes, "csv_size": csv_size})
+            self.completed.add(key)
+            self.csv_size = csv_size
+
+    def close(self):
+        self.flush()
+        self.file.close()
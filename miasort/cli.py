@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import nullcontext
+
+from .start import start
+from .cache import DEFAULT_CACHE_BUDGET
+from .store import STORE_SUFFIX
+from .helper import DEFAULT_DENSITY_THRESHOLD
+
+
+def dataset_name(path1):
+    if path1 == "-":
+        return "stdin"
+    name = path1.rstrip("/").split("/")[-1]
+    if name.endswith(STORE_SUFFIX):
+        name = name[:-len(STORE_SUFFIX)]
+    return name.split(".region")[0]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="miasort",
+        description="Sort the chromatin complexes of a region file. The region file may be gzipped, "
+                    "or read from standard input with `--path1 -`.")
+    parser.add_argument("--path1", default="-",
+                        help="region file of the complexes (.region or .region.gz) or a .mia store; "
+                             "`-` reads standard input (default)")
+    parser.add_argument("--path2", default="",
+                        help="anchor file (abc, AandBandC) or query table (multiple)")
+    parser.add_argument("--type", required=True, choices=["abc", "AandBandC", "multiple"],
+                        help="sort mode")
+    parser.add_argument("--graphs", default="AtoC;CtoA;AandC;Bcentered;BtoA;BtoC",
+                        help="sort schemes of the abc mode, separated by `;`")
+    parser.add_argument("--region", default="",
+                        help="regions of the multiple mode without --path2, as chr:left-right;...")
+    parser.add_argument("--operation", default="",
+                        help="yes/no per region of the multiple mode without --path2")
+    parser.add_argument("--numfrag_min", type=int, default=2)
+    parser.add_argument("--numfrag_max", type=int, default=1000)
+    parser.add_argument("--anchor_options", default="no", choices=["no", "yes_top", "yes_complete"])
+    parser.add_argument("--out_dir", default=None,
+                        help="output folder; deleted first if it exists. Only optional with --stdout "
+                             "and neither plots nor histograms")
+    parser.add_argument("--dataset", default=None,
+                        help="dataset name in the output file names (default: from --path1)")
+    parser.add_argument("--colors", default="red;green;#525252")
+    parser.add_argument("--extension", default="6000")
+    parser.add_argument("--plot", default=None, choices=["yes", "no"],
+                        help="draw the plots (default: yes, or no with --stdout and no --out_dir)")
+    parser.add_argument("--histogram", default="no", choices=["yes", "no"])
+    parser.add_argument("--engine", default="numpy", choices=["numpy", "bedtools"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--render_workers", type=int, default=0)
+    parser.add_argument("--streaming", action="store_true",
+                        help="read a position-sorted --path1 one chromosome at a time (abc, AandBandC)")
+    parser.add_argument("--cache_budget", type=int, default=DEFAULT_CACHE_BUDGET)
+    parser.add_argument("--max_complexes", type=int, default=None,
+                        help="keep only the first N ranked complexes of each sort scheme")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="keep a random sample of N ranked complexes of each sort scheme")
+    parser.add_argument("--density_threshold", type=int, default=DEFAULT_DENSITY_THRESHOLD,
+                        help="complexes above which a plot draws a density image instead of every fragment")
+    parser.add_argument("--stdout", action="store_true",
+                        help="write the comp records CSV to standard output instead of --out_dir")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dataset = args.dataset or dataset_name(args.path1)
+
+    if args.type == "abc":
+        processing_type, line_width = "abc", 2.0
+        if not args.path2:
+            sys.exit("miasort: --path2 is required in abc mode")
+    elif args.type == "AandBandC":
+        processing_type, line_width = "AandBandC", 1.5
+        if not args.path2:
+            sys.exit("miasort: --path2 is required in AandBandC mode")
+    elif args.path2:
+        # A query table is sorted against the complexes loaded once
+        processing_type, line_width = "batch", 1.5
+    else:
+        processing_type, line_width = "multiple", 1.5
+        if not args.region or not args.operation:
+            sys.exit("miasort: the multiple mode needs --path2, or --region and --operation")
+
+    if args.plot is None:
+        args.plot = "no" if args.stdout and args.out_dir is None else "yes"
+    # Only the comp records are written, to standard output: the run keeps its
+    # temp files in a folder of its own and leaves --out_dir alone
+    records_only = args.stdout and args.plot == "no" and args.histogram == "no"
+    if args.out_dir is None and not records_only:
+        sys.exit("miasort: --out_dir is required unless --stdout is given without plots or histograms")
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="miasort.") if records_only else nullcontext() as run_dir:
+            out_dir = os.path.join(run_dir, "out") if records_only else args.out_dir
+            start(args.path1, args.path2, processing_type, args.graphs, args.numfrag_min, args.numfrag_max,
+                  args.region, args.operation, dataset, out_dir, args.colors, args.anchor_options, args.plot,
+                  args.extension, args.histogram, 0.6, line_width, 50, (0.9, 0.05, 0.9),
+                  engine=args.engine, workers=args.workers, render_workers=args.render_workers,
+                  streaming=args.streaming, cache_budget=args.cache_budget, stdout=args.stdout,
+                  max_complexes=args.max_complexes, sample=args.sample, density_threshold=args.density_threshold)
+    except BrokenPipeError:
+        # The reader of standard output (e.g. `head`) went away; keep the exit from flushing into it
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except ValueError as error:
+        sys.exit(f"miasort: {error}")
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Anchor pairs expanded at once when counting co-occurrences
+PAIR_BATCH = 1 << 22
+
+
+def read_anchor_sites(path2):
+    """Distinct (chrom, start, end) sites of the anchor triples in path2.
+
+    Every line contributes its A, B and C sites (the first nine columns); sites
+    without positions, such as the `.` B of a stripe-only file, are skipped. The
+    sites are ordered by chromosome (in order of first appearance), start and
+    end, so they are the rows and columns of the matrix in genome order.
+    """
+    sites = {}
+    chroms = {}
+    with open(path2, 'r') as infile:
+        for line in infile:
+            fields = line.strip().split('\t')
+            for chrom, start, end in zip(fields[0:9:3], fields[1:9:3], fields[2:9:3]):
+                if not (start.isdigit() and end.isdigit()):
+                    continue
+                chroms.setdefault(chrom, len(chroms))
+                sites[(chrom, int(start), int(end))] = None
+
+    return sorted(sites, key=lambda site: (chroms[site[0]], site[1], site[2]))
+
+
+def anchor_incidence(index, sites, num_fragments_min, num_fragments_max):
+    """The GEM x anchor incidence matrix, as (gem code, site) pairs sorted by GEM then site.
+
+    A GEM is incident to a site when one of its fragments overlaps the site, and
+    only GEMs whose fragment count is within the limits are kept. All sites are
+    located with one vectorized binary search per chromosome and their
+    candidate fragments are expanded together, in one sweep of the index.
+    """
+    codes = np.array([index.chrom_codes.get(chrom, -1) for chrom, _, _ in sites], dtype=np.int64)
+    starts = np.array([start for _, start, _ in sites], dtype=np.int64)
+    ends = np.array([end for _, _, end in sites], dtype=np.int64)
+    first, last = index.position_ranges(codes, starts, ends)
+
+    # Every candidate position of every site, as in gem_fragments
+    lengths = np.maximum(last - first, 0)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    positions = np.arange(offsets[-1]) + np.repeat(first - offsets[:-1], lengths)
+    site = np.repeat(np.arange(len(sites), dtype=np.int64), lengths)
+    rows = index.order[positions]
+
+    keep = index.end[rows] > starts[site]
+    gems = index.gem[rows[keep]]
+    site = site[keep]
+    counts = index.gem_count[gems]
+    keep = (counts >= num_fragments_min) & (counts <= num_fragments_max)
+
+    # A GEM with several fragments in a site is counted once
+    pairs = np.unique(gems[keep] * len(sites) + site[keep])
+    return pairs // max(len(sites), 1), pairs % max(len(sites), 1)
+
+
+def cooccurrence_counts(gems, sites, num_sites):
+    """The anchor x anchor product of the incidence matrix with itself.
+
+    Returns the (row, col, count) entries of its upper triangle: count is the
+    number of complexes that touch both sites, and the diagonal is the number of
+    complexes touching each site. The pairs of sites of every GEM are expanded
+    in batches of PAIR_BATCH and summed, which is the sparse product A^T A of a
+    0/1 matrix A.
+    """
+    # The entries of a GEM are a run of sorted sites; entry e pairs with itself and the rest of its run
+    heads = np.flatnonzero(np.concatenate(([True], gems[1:] != gems[:-1]))) if len(gems) else gems
+    run_ends = np.append(heads[1:], len(gems))
+    partners = np.repeat(run_ends, np.diff(run_ends, prepend=0)) - np.arange(len(gems))
+    totals = np.concatenate(([0], np.cumsum(partners)))
+
+    keys, counts = [], []
+    start = 0
+    while start < len(gems):
+        stop = max(int(np.searchsorted(totals, totals[start] + PAIR_BATCH, side='right')) - 1, start + 1)
+        batch = partners[start:stop]
+        entries = np.repeat(np.arange(start, stop), batch)
+        shift = np.arange(len(entries)) - np.repeat(totals[start:stop] - totals[start], batch)
+        batch_keys, batch_counts = np.unique(sites[entries] * num_sites + sites[entries + shift], return_counts=True)
+        keys.append(batch_keys)
+        counts.append(batch_counts)
+        start = stop
+
+    if not keys:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    return keys // num_sites, keys % num_sites, counts
+
+
+def write_cooccurrence(index, path2, out_path, num_fragments_min, num_fragments_max):
+    """Write the incidence and co-occurrence matrices of the sites of path2 to one NPZ file."""
+    sites = read_anchor_sites(path2)
+    gems, site = anchor_incidence(index, sites, num_fragments_min, num_fragments_max)
+    rows, cols, counts = cooccurrence_counts(gems, site, len(sites))
+
+    # Only the GEMs that touch a site are named, as codes in the order of the index
+    gem_codes, incidence_gem = np.unique(gems, return_inverse=True)
+    chroms = list(dict.fromkeys(chrom for chrom, _, _ in sites))
+    chrom_codes = {chrom: code for code, chrom in enumerate(chroms)}
+    np.savez_compressed(
+        out_path,
+        chroms=np.array(chroms, dtype=str),
+        anchor_chrom=np.array([chrom_codes[chrom] for chrom, _, _ in sites], dtype=np.int32),
+        anchor_start=np.array([start for _, start, _ in sites], dtype=np.int64),
+        anchor_end=np.array([end for _, _, end in sites], dtype=np.int64),
+        gem_ids=np.array([index.gem_names[code] for code in gem_codes], dtype=str),
+        incidence_gem=incidence_gem.astype(np.int32),
+        incidence_anchor=site.astype(np.int32),
+        cooccurrence_row=rows.astype(np.int32),
+        cooccurrence_col=cols.astype(np.int32),
+        cooccurrence_count=counts,
+        num_frag_limits=np.array([num_fragments_min, num_fragments_max], dtype=np.int64),
+    )
+    return out_path
+
+
+def load_cooccurrence(path):
+    """The columns of an NPZ file written by write_cooccurrence, as a dict of arrays."""
+    with np.load(path) as columns:
+        return {name: columns[name] for name in columns.files}
@@ -0,0 +1,154 @@
+from .start import start, cleanup_temp_files, temp_files_since, _session_tempfiles
+from .store import load_index
+from .cache import GemSetCache, DEFAULT_CACHE_BUDGET
+from .helper import DEFAULT_DENSITY_THRESHOLD
+from .cooccurrence import write_cooccurrence
+from .report import created_tempfiles
+
+
+class Dataset:
+    """A region file loaded once and sorted many times.
+
+    With the `numpy` engine the fragment index is built (or memory-mapped from a
+    compiled store) when the dataset is opened. With the `bedtools` engine the
+    file is wrapped in a BedTool. Anchor groupings and region GEM sets are then
+    cached for the following calls. The methods take the same parameters as the
+    functions of the same name, without `path1` and `engine`.
+    """
+
+    def __init__(self, path1, engine='numpy', cache_budget=DEFAULT_CACHE_BUDGET):
+        if engine == "numpy":
+            self.index = load_index(path1)
+            self.complexes = self.index.view()
+        elif engine == "bedtools":
+            from pybedtools import BedTool
+            self.index = None
+            self.complexes = BedTool(path1)
+        else:
+            raise ValueError(f"Unknown engine `{engine}`, expected `bedtools` or `numpy`")
+
+        self.path1 = path1
+        self.engine = engine
+        self.name = path1.split("/")[-1].split(".region")[0]
+        # Filled in by start(): anchor file -> grouped fragments, region -> GEM set
+        self.anchor_groups = {}
+        self.region_gems = GemSetCache(cache_budget)
+        # pybedtools temp files created by the calls, which the cached groupings may still read
+        self.tempfiles = []
+        self.closed = False
+
+    def abc_sort(self, path2, graphs, out_dir='/', plot=True, histogram=False, anchor_option='no',
+                 colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
+                 frag_height=0.6, line_width=2.0, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                 workers=1, render_workers=0, resume=False, report=False, profile_anchor=None,
+                 trace_memory=False, memory_budget=None, export_complexes=False, max_complexes=None, sample=None,
+                 density_threshold=DEFAULT_DENSITY_THRESHOLD):
+        """Sort Three Regions."""
+        self.run(path2, "abc", graphs, num_frag_min, num_frag_max, "", "", out_dir, colors, anchor_option,
+                 plot, extension, histogram, frag_height, line_width, plot_width, subplots_margins,
+                 workers=workers, render_workers=render_workers, resume=resume,
+                 report=report, profile_anchor=profile_anchor, trace_memory=trace_memory,
+                 memory_budget=memory_budget, export_complexes=export_complexes,
+                 max_complexes=max_complexes, sample=sample,
+                 density_threshold=density_threshold)
+
+    def multiple_sort(self, path2, out_dir='/', plot=True, histogram=False, anchor_option='no',
+                      colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
+                      frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                      workers=1, render_workers=0, resume=False, report=False, profile_anchor=None,
+                      trace_memory=False, memory_budget=None, export_complexes=False,
+                      max_complexes=None, sample=None,
+                      density_threshold=DEFAULT_DENSITY_THRESHOLD):
+        """Sort with A and B and C."""
+        self.run(path2, "AandBandC", "", num_frag_min, num_frag_max, "", "", out_dir, colors, anchor_option,
+                 plot, extension, histogram, frag_height, line_width, plot_width, subplots_margins,
+                 workers=workers, render_workers=render_workers, resume=resume,
+                 report=report, profile_anchor=profile_anchor, trace_memory=trace_memory,
+                 memory_budget=memory_budget, export_complexes=export_complexes,
+                 max_complexes=max_complexes, sample=sample,
+                 density_threshold=density_threshold)
+
+    def unlimited_multiple_sort(self, regions, operations, out_dir='/', plot=True, histogram=False,
+                                anchor_option='no', colors='red;green;#525252', num_frag_min=2,
+                                num_frag_max=1000, extension='6000', frag_height=0.6, line_width=1.5,
+                                plot_width=50, subplots_margins=(0.9, 0.05, 0.9), report=False,
+                                trace_memory=False, export_complexes=False, max_complexes=None, sample=None,
+                                density_threshold=DEFAULT_DENSITY_THRESHOLD):
+        """Sort an unlimited number of regions."""
+        self.run("", "multiple", "", num_frag_min, num_frag_max, regions, operations, out_dir, colors,
+                 anchor_option, plot, extension, histogram, frag_height, line_width, plot_width,
+                 subplots_margins, report=report, trace_memory=trace_memory,
+                 export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+                 density_threshold=density_threshold)
+
+    def batch_multiple_sort(self, path2, out_dir='/', plot=False, histogram=False, anchor_option='no',
+                            colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
+                            frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                            render_workers=0, report=False, profile_anchor=None, trace_memory=False,
+                            memory_budget=None, export_complexes=False, max_complexes=None, sample=None,
+                            density_threshold=DEFAULT_DENSITY_THRESHOLD):
+        """Sort many region sets."""
+        self.run(path2, "batch", "", num_frag_min, num_frag_max, "", "", out_dir, colors, anchor_option,
+                 plot, extension, histogram, frag_height, line_width, plot_width, subplots_margins,
+                 render_workers=render_workers, report=report, profile_anchor=profile_anchor,
+                 trace_memory=trace_memory, memory_budget=memory_budget,
+                 export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+                 density_threshold=density_threshold)
+
+    def run(self, path2, processing_type, graphs, num_frag_min, num_frag_max, regions, operations,
+            out_dir, colors, anchor_option, plot, extension, histogram, frag_height, line_width,
+            plot_width, subplots_margins, **options):
+        if self.closed:
+            raise ValueError(f"Dataset {self.path1} is closed")
+
+        if plot:
+            graph_flag = "yes"
+        else:
+            graph_flag = "no"
+
+        if histogram:
+            histogram_options = "yes"
+        else:
+            histogram_options = "no"
+
+        created = created_tempfiles()
+        try:
+            start(self.path1, path2, processing_type, graphs, num_frag_min, num_frag_max,
+                  regions, operations, self.name, out_dir, colors, anchor_option, graph_flag,
+                  extension, histogram_options, frag_height,
+                  line_width, plot_width, subplots_margins, engine=self.engine, session=self, **options)
+        finally:
+            tempfiles = temp_files_since(created)
+            self.tempfiles.extend(tempfiles)
+            _session_tempfiles.update(tempfiles)
+
+    def anchor_cooccurrence(self, path2, out_path=None, num_frag_min=2, num_frag_max=1000):
+        """Count the complexes shared by every pair of anchor sites of path2 (`numpy` engine only)."""
+        if self.closed:
+            raise ValueError(f"Dataset {self.path1} is closed")
+        if self.engine != "numpy":
+            raise ValueError("anchor_cooccurrence requires the `numpy` engine")
+        if out_path is None:
+            out_path = f"{self.name}_{path2.split('/')[-1]}_minfrag_{num_frag_min}_maxfrag_{num_frag_max}_cooccurrence.npz"
+        return write_cooccurrence(self.index, path2, out_path, num_frag_min, num_frag_max)
+
+    def cache_stats(self):
+        """Hits, misses, evictions and size of the region GEM set cache."""
+        return self.region_gems.stats()
+
+    def close(self):
+        """Drop the loaded complexes and every cache, and delete the temp files of this dataset."""
+        self.index = None
+        self.complexes = None
+        self.anchor_groups.clear()
+        self.region_gems.clear()
+        self.closed = True
+        cleanup_temp_files(self.tempfiles)
+        _session_tempfiles.difference_update(self.tempfiles)
+        self.tempfiles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
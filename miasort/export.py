@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class ComplexSink:
+    """Collects the ranked complexes of a run and writes them to one NPZ file.
+
+    Each complex is a row of the `complex_*` columns: its anchor triple (or
+    query) and scheme as codes into `anchor_ids` and `schemes`, its 1-based rank,
+    its GEM as a code into `gem_ids` and its span. Fragments are stored once in
+    the `fragment_*` table; `fragment_refs[complex_fragments[i]:complex_fragments[i + 1]]`
+    are the fragments of complex i. Columns are built in memory and written
+    together by close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.codes = {"anchor_ids": {}, "schemes": {}, "gem_ids": {}, "chroms": {}}
+        self.fragment_codes = {}
+        self.fragments = []  # (chrom code, start, end) per fragment code
+        self.complexes = []  # (anchor, scheme, rank, gem, span) per complex
+        self.offsets = [0]
+        self.refs = []
+
+    def code(self, table, value):
+        codes = self.codes[table]
+        if value not in codes:
+            codes[value] = len(codes)
+        return codes[value]
+
+    def add(self, id, scheme, ranked_gems):
+        """Add the ranked (gem_id, fragments, gem_length) tuples of one anchor triple and scheme."""
+        anchor = self.code("anchor_ids", str(id))
+        scheme = self.code("schemes", scheme)
+        for rank, (gem_id, fragments, length) in enumerate(ranked_gems, start=1):
+            self.complexes.append((anchor, scheme, rank, self.code("gem_ids", str(gem_id)), int(length)))
+            for fragment in fragments:
+                key = (fragment.chrom, int(fragment.start), int(fragment.end))
+                ref = self.fragment_codes.get(key)
+                if ref is None:
+                    ref = self.fragment_codes[key] = len(self.fragments)
+                    self.fragments.append((self.code("chroms", key[0]), key[1], key[2]))
+                self.refs.append(ref)
+            self.offsets.append(len(self.refs))
+
+    def close(self):
+        complexes = np.array(self.complexes, dtype=np.int64).reshape(-1, 5)
+        fragments = np.array(self.fragments, dtype=np.int64).reshape(-1, 3)
+        columns = {table: np.array(list(codes), dtype=str) for table, codes in self.codes.items()}
+        np.savez_compressed(
+            self.path,
+            **columns,
+            complex_anchor=complexes[:, 0].astype(np.int32),
+            complex_scheme=complexes[:, 1].astype(np.int8),
+            complex_rank=complexes[:, 2].astype(np.int32),
+            complex_gem=complexes[:, 3].astype(np.int32),
+            complex_span=complexes[:, 4],
+            complex_fragments=np.array(self.offsets, dtype=np.int64),
+            fragment_refs=np.array(self.refs, dtype=np.int32),
+            fragment_chrom=fragments[:, 0].astype(np.int32),
+            fragment_start=fragments[:, 1],
+            fragment_end=fragments[:, 2],
+        )
+        return self.path
+
+
+def load_complexes(path):
+    """The columns of an NPZ file written by ComplexSink, as a dict of arrays."""
+    with np.load(path) as columns:
+        return {name: columns[name] for name in columns.files}
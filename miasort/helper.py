@@ -1,5 +1,8 @@
 import string
 
+# Complexes above which a plot draws a density image instead of every fragment
+DEFAULT_DENSITY_THRESHOLD = 10000
+
 def process_multiple_regions(regions, operations):
     """
     Processes regions and operations to classify them into "Yes" and "No" chromosome tuples.
@@ -41,6 +44,23 @@ def process_multiple_regions(regions, operations):
     return yes_chromosomes, no_chromosomes
 
 
+def read_queries(path2):
+    """Read a query table with one `regions`, `operations`, `id` row per line, tab separated.
+
+    Blank lines and lines starting with `#` are skipped.
+    """
+    queries = []
+    with open(path2, 'r') as infile:
+        for line in infile:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 3:
+                raise ValueError(f"Expected `regions`, `operations` and `id` columns in {path2}: {line.strip()}")
+            queries.append((fields[0], fields[1], fields[2]))
+    return queries
+
+
 def process_graphs_arg(arg):
     graphs_flags = {
         "AtoB": False,
@@ -72,6 +92,12 @@ def create_csv_filename(dataset, path2, frag_description):
     return f"{dataset}_{path2}_{frag_description}_comp_records.csv"
 
 
+def create_complexes_filename(dataset, path2, frag_description):
+    """Generate the filename for the exported complexes."""
+    path2 = path2.split("/")[-1]
+    return f"{dataset}_{path2}_{frag_description}_complexes.npz"
+
+
 def create_histogram_filename(dataset, path2):
     """Generate the filename for the histogram text file."""
     path2 = path2.split("/")[-1]
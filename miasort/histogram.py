@@ -1,8 +1,11 @@
 import os
 
+from . import report
+from .ranking import num_complexes
+
 def generate_file(ranked_gems, output_file, out_dir):
     histogram = {}
-    num_gems = len(ranked_gems)
+    num_gems = num_complexes(ranked_gems)
     for gem_tuple in ranked_gems:
         num_fragments = len(gem_tuple[1])
         if num_fragments not in histogram.keys():
@@ -10,15 +13,22 @@ def generate_file(ranked_gems, output_file, out_dir):
         else:
             histogram[num_fragments] += 1
 
+    # When only some complexes were kept, every complex that matched is counted
+    if num_gems != len(ranked_gems) and getattr(ranked_gems, "histogram", None) is not None:
+        for num_fragments in sorted(ranked_gems.histogram):
+            histogram[num_fragments] = ranked_gems.histogram[num_fragments]
+
     if out_dir != "/":
         output_path = os.path.join(out_dir, f"{output_file}.txt")
     else:
         output_path = f"{output_file}.txt"
 
-    with open(output_path, "w") as file:
+    with report.stage("histogram"), open(output_path, "w") as file:
         # write the header
         file.write("num_frag_per_GEM\tnum_comp\n")
         # write the histogram data
         for key, value in histogram.items():
             file.write(f"{key}\t{value}\n")
         file.write(f"total\t{num_gems}")
+        if num_gems != len(ranked_gems):
+            file.write(f"\nkept\t{len(ranked_gems)}")
@@ -0,0 +1,336 @@
+import gzip
+import sys
+import numpy as np
+from collections import namedtuple
+from contextlib import nullcontext
+
+Fragment = namedtuple("Fragment", ["chrom", "start", "end", "gem_size", "gem_id"])
+
+GemGroups = namedtuple("GemGroups", ["gem", "first", "count", "min_start", "max_end", "offsets", "rows"])
+
+# Fragment columns, grouped by GEM (`row` is the fragment's line in the region file)
+FRAGMENT_COLUMNS = ["chrom", "start", "end", "gem_size", "gem", "row"]
+# Per-chromosome position index
+POSITION_COLUMNS = ["order", "bounds", "sorted_start", "reach"]
+# Per-GEM CSR offsets and summaries
+GEM_COLUMNS = ["gem_offsets", "gem_count", "gem_min_start", "gem_max_end"]
+
+
+class FragmentIndex:
+    """In-memory interval index over the fragments of a .region/.complexes file.
+
+    Fragments are kept as parallel NumPy arrays grouped by GEM in compressed
+    sparse row form: the fragments of GEM `g` are the slice
+    `gem_offsets[g]:gem_offsets[g + 1]`, in file order, and each GEM's fragment
+    count and span are precomputed. Chromosome names and GEM ids are interned as
+    integer codes (GEM codes follow first appearance in the file), and every
+    chromosome keeps its fragments sorted by start so that overlap queries are
+    two binary searches instead of a bedtools subprocess.
+    """
+
+    def __init__(self, chroms, gem_names, columns):
+        self.chroms = chroms
+        self.gem_names = gem_names
+        self.chrom_codes = {name: code for code, name in enumerate(chroms)}
+
+        for column in FRAGMENT_COLUMNS:
+            setattr(self, column, columns[column])
+
+        if not all(column in columns for column in POSITION_COLUMNS):
+            columns.update(self.build_positions())
+        for column in POSITION_COLUMNS:
+            setattr(self, column, columns[column])
+
+        if not all(column in columns for column in GEM_COLUMNS):
+            columns.update(self.build_gem_layout())
+        for column in GEM_COLUMNS:
+            setattr(self, column, columns[column])
+
+    def __len__(self):
+        return len(self.start)
+
+    @classmethod
+    def from_file(cls, path):
+        """Parse a 5-column region file (chrom, start, end, gem_size, gem_id); see open_region()."""
+        chrom_codes = {}
+        gem_codes = {}
+        chrom, start, end, gem_size, gem = [], [], [], [], []
+
+        with open_region(path) as file:
+            for line in file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 5:
+                    continue
+                chrom.append(chrom_codes.setdefault(fields[0], len(chrom_codes)))
+                start.append(int(fields[1]))
+                end.append(int(fields[2]))
+                gem_size.append(int(fields[3]))
+                gem.append(gem_codes.setdefault(fields[4], len(gem_codes)))
+
+        return cls.from_arrays(list(chrom_codes), list(gem_codes), np.array(chrom, dtype=np.int32),
+                               np.array(start, dtype=np.int64), np.array(end, dtype=np.int64),
+                               np.array(gem_size, dtype=np.int32), np.array(gem, dtype=np.int64))
+
+    @classmethod
+    def from_arrays(cls, chroms, gem_names, chrom, start, end, gem_size, gem):
+        """Build an index from fragment arrays in file order."""
+        row = np.argsort(gem, kind='stable')
+        columns = {"chrom": chrom[row], "start": start[row], "end": end[row],
+                   "gem_size": gem_size[row], "gem": gem[row], "row": row}
+        return cls(chroms, gem_names, columns)
+
+    def build_positions(self):
+        order = np.lexsort((self.start, self.chrom))
+        counts = np.bincount(self.chrom, minlength=len(self.chroms))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        # Furthest end of any fragment up to each position of a chromosome
+        reach = self.end[order]
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            np.maximum.accumulate(reach[lo:hi], out=reach[lo:hi])
+        return {"order": order, "bounds": bounds, "sorted_start": self.start[order], "reach": reach}
+
+    def build_gem_layout(self):
+        gem_count = np.bincount(self.gem, minlength=len(self.gem_names))
+        gem_offsets = np.concatenate(([0], np.cumsum(gem_count)))
+        if len(self):
+            gem_min_start = np.minimum.reduceat(self.start, gem_offsets[:-1])
+            gem_max_end = np.maximum.reduceat(self.end, gem_offsets[:-1])
+        else:
+            gem_min_start = gem_max_end = np.zeros(0, dtype=np.int64)
+        return {"gem_offsets": gem_offsets, "gem_count": gem_count,
+                "gem_min_start": gem_min_start, "gem_max_end": gem_max_end}
+
+    def query(self, chrom, start, end):
+        """Rows of the fragments overlapping [start, end) on chrom."""
+        code = self.chrom_codes.get(chrom, -1)
+        first, last = self.position_ranges(np.array([code]), np.array([start]), np.array([end]))
+        rows = self.order[first[0]:last[0]]
+        rows = rows[self.end[rows] > start]
+        return np.sort(rows)
+
+    def position_ranges(self, codes, starts, ends):
+        """Ranges of `order` holding the candidates for each interval.
+
+        Every fragment overlapping [starts[i], ends[i]) on chromosome codes[i]
+        is in order[first[i]:last[i]]; the range may also hold fragments that
+        end before starts[i], but it starts at the first fragment that does not.
+        All intervals of a chromosome are located with one vectorized binary
+        search, which only touches a few pages of a memory-mapped store.
+        """
+        first = np.zeros(len(codes), dtype=np.int64)
+        last = np.zeros(len(codes), dtype=np.int64)
+        for code in np.unique(codes[codes >= 0]):
+            selected = codes == code
+            lo, hi = self.bounds[code], self.bounds[code + 1]
+            # Fragments before the first position whose reach passes `start` all end before it
+            first[selected] = lo + np.searchsorted(self.reach[lo:hi], starts[selected], side='right')
+            last[selected] = lo + np.searchsorted(self.sorted_start[lo:hi], ends[selected], side='left')
+        return first, last
+
+    def gem_fragments(self, gem_codes):
+        """Rows of all fragments of the given GEMs, expanded from the CSR offsets."""
+        counts = self.gem_count[gem_codes]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        shift = np.repeat(self.gem_offsets[gem_codes] - offsets[:-1], counts)
+        return np.arange(offsets[-1]) + shift
+
+    def fragment(self, row):
+        return Fragment(self.chroms[self.chrom[row]], int(self.start[row]), int(self.end[row]),
+                        int(self.gem_size[row]), self.gem_names[self.gem[row]])
+
+    def fragments(self, rows):
+        return [self.fragment(row) for row in rows]
+
+    def view(self):
+        return FragmentView(self)
+
+
+class FragmentView:
+    """A subset of the fragments of a FragmentIndex, the counterpart of a BedTool.
+
+    A view is defined by an optional window, the (chrom code, start, end) its
+    fragments must overlap, and an optional set of GEM codes. `rows` holds the
+    matching fragment rows in ascending order, or None for the whole index.
+    """
+
+    def __init__(self, index, rows=None, window=None, gems=None):
+        self.index = index
+        self.rows = rows
+        self.window = window
+        self.gems = gems
+
+    def __len__(self):
+        if self.rows is None:
+            return len(self.index)
+        return len(self.rows)
+
+    def __iter__(self):
+        rows = self.all_rows()
+        for row in rows[np.argsort(self.index.row[rows], kind='stable')]:
+            yield self.index.fragment(row)
+
+    def all_rows(self):
+        if self.rows is None:
+            return np.arange(len(self.index))
+        return self.rows
+
+    def intersect(self, chrom, start, end):
+        """Fragments of this view overlapping [start, end) on chrom."""
+        index = self.index
+        code = index.chrom_codes.get(chrom, -1)
+        if self.window is None:
+            window = (code, start, end)
+        else:
+            # Overlapping both windows is overlapping their (possibly empty) intersection
+            window = (code if code == self.window[0] else -1,
+                      max(start, self.window[1]), min(end, self.window[2]))
+
+        if self.rows is None:
+            return FragmentView(index, index.query(chrom, start, end), window)
+
+        rows = self.rows
+        mask = (index.chrom[rows] == code) & (index.start[rows] < end) & (index.end[rows] > start)
+        return FragmentView(index, rows[mask], window, self.gems)
+
+    def gem_codes(self):
+        gems = self.index.gem[self.all_rows()]
+        # Rows are grouped by GEM, so GEM codes are already sorted
+        return gems[np.concatenate(([True], gems[1:] != gems[:-1]))] if len(gems) else gems
+
+    def select_gems(self, gem_codes):
+        """Fragments of this view that belong to the GEMs in gem_codes.
+
+        The GEMs are expanded by slicing their CSR ranges and checking the
+        fragments against the window, rather than by scanning the view.
+        """
+        index = self.index
+        gem_codes = np.asarray(gem_codes, dtype=np.int64)
+        if self.gems is not None:
+            gem_codes = np.intersect1d(gem_codes, self.gems, assume_unique=True)
+
+        rows = index.gem_fragments(gem_codes)
+        if self.window is not None:
+            code, start, end = self.window
+            mask = (index.chrom[rows] == code) & (index.start[rows] < end) & (index.end[rows] > start)
+            rows = rows[mask]
+        return FragmentView(index, rows, self.window, gem_codes)
+
+    def group_by_gem(self):
+        """Group the fragments by GEM, ordered by each GEM's first fragment in the file."""
+        index = self.index
+        rows = self.all_rows()
+        if not len(rows):
+            empty = np.zeros(0, dtype=np.int64)
+            return GemGroups(empty, empty, empty, empty, empty, np.zeros(1, dtype=np.int64), empty)
+
+        gems = index.gem[rows]
+        heads = np.concatenate(([0], np.flatnonzero(gems[1:] != gems[:-1]) + 1))
+        offsets = np.append(heads, len(rows))
+        groups = GemGroups(gem=gems[heads],
+                           first=index.row[rows[heads]],
+                           count=np.diff(offsets),
+                           min_start=np.minimum.reduceat(index.start[rows], heads),
+                           max_end=np.maximum.reduceat(index.end[rows], heads),
+                           offsets=offsets,
+                           rows=rows)
+
+        # Order groups by first appearance, as a dict filled in file order would be
+        appearance = np.argsort(groups.first, kind='stable')
+        return reorder_groups(groups, appearance)
+
+
+def reorder_groups(groups, selection):
+    """Keep and reorder the groups listed in selection (an index array or boolean mask)."""
+    if selection.dtype == bool:
+        selection = np.flatnonzero(selection)
+
+    counts = groups.count[selection]
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    # Position of every kept fragment in the old layout
+    shift = np.repeat(groups.offsets[selection] - offsets[:-1], counts)
+    rows = groups.rows[np.arange(offsets[-1]) + shift]
+
+    return GemGroups(gem=groups.gem[selection], first=groups.first[selection], count=counts,
+                     min_start=groups.min_start[selection], max_end=groups.max_end[selection],
+                     offsets=offsets, rows=rows)
+
+
+def open_region(path):
+    """Open a region file as text. `.gz` files are decompressed and `-` reads standard input."""
+    if path == "-":
+        return nullcontext(sys.stdin)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def read_anchor_spans(path2):
+    """(key, chrom, start, end) of every distinct anchor triple in path2.
+
+    The span runs from the start of A to the end of C, and keys match the
+    `filter_regions` intersect in `start()`.
+    """
+    spans = []
+    keys = set()
+    with open(path2, 'r') as infile:
+        for line in infile:
+            anchors = line.strip().split('\t')
+            if len(anchors) < 9:
+                continue
+            key = ' '.join([anchors[0], anchors[1], anchors[8]] + anchors)
+            if key in keys:
+                continue
+            keys.add(key)
+            spans.append((key, anchors[0], int(anchors[1]), int(anchors[8])))
+    return spans
+
+
+def span_rows(index, spans):
+    """Yield the position, rows and window of each span of spans with fragments in index."""
+    codes = np.array([index.chrom_codes.get(chrom, -1) for _, chrom, _, _ in spans])
+    starts = np.array([start for _, _, start, _ in spans], dtype=np.int64)
+    ends = np.array([end for _, _, _, end in spans], dtype=np.int64)
+    first, last = index.position_ranges(codes, starts, ends)
+
+    for i in np.flatnonzero(last > first):
+        rows = index.order[first[i]:last[i]]
+        rows = np.sort(rows[index.end[rows] > starts[i]])
+        if len(rows):
+            yield i, rows, (codes[i], starts[i], ends[i])
+
+
+def group_anchor_spans(index, spans):
+    """Collect the fragments of index overlapping each anchor span.
+
+    Anchors without fragments are dropped and the rest are ordered by their
+    first fragment, like the `filter_regions` intersect in `start()`.
+    """
+    if not spans:
+        return {}
+
+    # Anchors are handled by their position in spans; views share the index
+    # and only hold the rows of their own fragments
+    views = {}
+    firsts = {}
+    for i, rows, window in span_rows(index, spans):
+        views[i] = FragmentView(index, rows, window)
+        firsts[i] = index.row[rows].min()
+
+    return {spans[i][0]: views[i] for i in sorted(views, key=lambda i: firsts[i])}
+
+
+def order_anchor_spans(index, spans):
+    """The spans with fragments in index, in the order group_anchor_spans returns them.
+
+    Only the first fragment of each span is kept, so the anchors can be
+    grouped a batch at a time in the order of a single grouping.
+    """
+    if not spans:
+        return []
+    firsts = {i: index.row[rows].min() for i, rows, _ in span_rows(index, spans)}
+    return [spans[i] for i in sorted(firsts, key=lambda i: firsts[i])]
+
+
+def group_by_anchor(index, path2):
+    """Collect the fragments overlapping each anchor triple's A-start to C-end span."""
+    return group_anchor_spans(index, read_anchor_spans(path2))
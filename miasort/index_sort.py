@@ -0,0 +1,339 @@
+import numpy as np
+
+from .index import FragmentView, reorder_groups
+from .ranking import NO_LIMIT, RankedGems
+from . import report
+
+# NumPy counterparts of the functions in sort.py. They take a FragmentView
+# instead of a BedTool and return the same ranked complexes.
+
+
+def ranked_gems_from_groups(index, groups, limit=None, by_length=False):
+    """Build the (gem_id, fragments, gem_length) tuples consumed by plots and records.
+
+    With by_length the groups are ranked by length, ties keeping their order.
+    Only the groups kept by limit, a ComplexLimit, are built.
+    """
+    lengths = groups.max_end - groups.min_start
+    kept, total, histogram = (limit or NO_LIMIT).positions(index.gem_names, groups.gem, groups.count,
+                                                           lengths if by_length else None)
+    ranked_gems = []
+    for i in kept:
+        rows = groups.rows[groups.offsets[i]:groups.offsets[i + 1]]
+        ranked_gems.append((index.gem_names[groups.gem[i]], index.fragments(rows), int(lengths[i])))
+    return RankedGems(ranked_gems, total, histogram)
+
+
+def within_limits(groups, num_fragments_min, num_fragments_max):
+    """Drop GEMs outside the fragment count limits."""
+    return reorder_groups(groups, (groups.count >= num_fragments_min) & (groups.count <= num_fragments_max))
+
+
+def rank_by_length(groups, num_fragments_min, num_fragments_max):
+    """Drop GEMs outside the fragment count limits and sort the rest by length.
+
+    Ties keep their order of first appearance, like the stable sort in sort.py.
+    """
+    keep = np.flatnonzero((groups.count >= num_fragments_min) & (groups.count <= num_fragments_max))
+    lengths = groups.max_end[keep] - groups.min_start[keep]
+    return reorder_groups(groups, keep[np.argsort(lengths, kind='stable')])
+
+
+def reachable_gems(index, gem_codes, num_fragments_min):
+    """Drop GEMs with fewer fragments in total than a complex needs in its window."""
+    return gem_codes[index.gem_count[gem_codes] >= num_fragments_min]
+
+
+def process_left(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region, limit=None):
+    left_anchor_chrom, left_anchor_start, left_anchor_end = left_anchor.split('\t')[:3]
+    right_anchor_start = int(right_anchor.split('\t')[1])
+
+    index = ChIA_Drop.index
+    intersecting_gem_ids = ChIA_Drop.intersect(left_anchor_chrom, int(left_anchor_start),
+                                               int(left_anchor_end)).gem_codes()
+    ChIA_Drop = ChIA_Drop.select_gems(reachable_gems(index, intersecting_gem_ids, num_fragments_min))
+
+    rows = ChIA_Drop.rows
+    bad_gem_ids = np.unique(index.gem[rows[index.end[rows] >= right_anchor_start]])
+    ChIA_Drop = ChIA_Drop.select_gems(np.setdiff1d(ChIA_Drop.gems, bad_gem_ids, assume_unique=True))
+
+    groups = within_limits(ChIA_Drop.group_by_gem(), num_fragments_min, num_fragments_max)
+    return ranked_gems_from_groups(index, groups, limit, by_length=True)
+
+
+def process_right(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region, limit=None):
+    left_anchor_end = int(left_anchor.split('\t')[2])
+    right_anchor_chrom, right_anchor_start, right_anchor_end = right_anchor.split('\t')[:3]
+
+    index = ChIA_Drop.index
+    intersecting_gem_ids = ChIA_Drop.intersect(right_anchor_chrom, int(right_anchor_start),
+                                               int(right_anchor_end)).gem_codes()
+    ChIA_Drop = ChIA_Drop.select_gems(reachable_gems(index, intersecting_gem_ids, num_fragments_min))
+
+    rows = ChIA_Drop.rows
+    bad_gem_ids = np.unique(index.gem[rows[index.start[rows] <= left_anchor_end]])
+    ChIA_Drop = ChIA_Drop.select_gems(np.setdiff1d(ChIA_Drop.gems, bad_gem_ids, assume_unique=True))
+
+    groups = within_limits(ChIA_Drop.group_by_gem(), num_fragments_min, num_fragments_max)
+    return ranked_gems_from_groups(index, groups, limit, by_length=True)
+
+
+def process_middle(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region, middle_anchor,
+                   limit=None):
+    middle_anchor_chrom, middle_anchor_start, middle_anchor_end = middle_anchor.split('\t')
+
+    left_anchor_start = int(left_anchor.split('\t')[1])
+    left_anchor_end = int(left_anchor.split('\t')[2])
+    right_anchor_start = int(right_anchor.split('\t')[1])
+    right_anchor_end = int(right_anchor.split('\t')[2])
+
+    index = ChIA_Drop.index
+
+    # Make sure the GEM has at least 1 fragment in left area (area_1)
+    # and at least 1 fragment in right area (area_2)
+    area_1_gem_ids = ChIA_Drop.intersect(middle_anchor_chrom, left_anchor_end,
+                                         int(middle_anchor_start)).gem_codes()
+    area_2_gem_ids = ChIA_Drop.intersect(middle_anchor_chrom, int(middle_anchor_end),
+                                         right_anchor_start).gem_codes()
+    in_area_gem_ids = np.intersect1d(area_1_gem_ids, area_2_gem_ids, assume_unique=True)
+    ChIA_Drop = ChIA_Drop.select_gems(reachable_gems(index, in_area_gem_ids, num_fragments_min))
+
+    rows = ChIA_Drop.rows
+    start = index.start[rows]
+    end = index.end[rows]
+    in_anchor = ((start >= left_anchor_start) & (end <= left_anchor_end)) \
+        | ((start >= right_anchor_start) & (end <= right_anchor_end))
+    bad_gem_ids = np.unique(index.gem[rows[in_anchor]])
+    groups = ChIA_Drop.select_gems(np.setdiff1d(ChIA_Drop.gems, bad_gem_ids, assume_unique=True)).group_by_gem()
+
+    # Further filter valid GEMs based on the leftmost fragment and right anchor
+    inside = (groups.min_start > left_anchor_end) & (groups.max_end < right_anchor_start)
+    groups = reorder_groups(groups, inside)
+    groups = rank_by_length(groups, num_fragments_min, num_fragments_max)
+
+    # Keep a GEM only if it strictly contains the last kept one
+    nested = []
+    for i in range(len(groups.gem)):
+        if not nested or (groups.min_start[i] < groups.min_start[nested[-1]]
+                          and groups.max_end[i] > groups.max_end[nested[-1]]):
+            nested.append(i)
+
+    return ranked_gems_from_groups(index, reorder_groups(groups, np.array(nested, dtype=np.int64)), limit)
+
+
+def process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms, no_chroms, region_gems=None,
+                     limit=None):
+    # reduce search space
+    if not len(yes_chroms):
+        left_most_end = no_chroms[0][1]
+        right_most_end = no_chroms[-1][2]
+    elif not len(no_chroms):
+        left_most_end = yes_chroms[0][1]
+        right_most_end = yes_chroms[-1][2]
+    else:
+        left_most_end = min(yes_chroms[0][1], no_chroms[0][1])
+        right_most_end = max(yes_chroms[-1][2], no_chroms[-1][2])
+
+    index = ChIA_Drop.index
+
+    # Process the first chromosome to initialize the valid_gem_ids
+    valid_gem_ids = gem_codes_in_region(ChIA_Drop, yes_chroms[0][:3], region_gems)
+
+    # Intersect with GEM IDs from the remaining chromosomes
+    for yes_chrom in yes_chroms[1:]:
+        valid_gem_ids = np.intersect1d(valid_gem_ids, gem_codes_in_region(ChIA_Drop, yes_chrom[:3], region_gems),
+                                       assume_unique=True)
+
+    # Exclude GEM IDs from the no_chroms regions
+    for no_chrom in no_chroms:
+        valid_gem_ids = np.setdiff1d(valid_gem_ids, gem_codes_in_region(ChIA_Drop, no_chrom[:3], region_gems),
+                                     assume_unique=True)
+
+    ChIA_Drop = ChIA_Drop.select_gems(reachable_gems(index, valid_gem_ids, num_fragments_min))
+    rows = ChIA_Drop.rows
+    inside = (index.start[rows] >= left_most_end) & (index.end[rows] <= right_most_end)
+    groups = FragmentView(index, rows[inside]).group_by_gem()
+    if report.active() is not None:
+        # Scanned as in sort.process_multiple: the fragments overlapping the span of the regions
+        scanned = index.query(yes_chroms[0][0], left_most_end, right_most_end)
+        report.count("fragments_scanned", len(scanned))
+        report.count("gems_scanned", len(np.unique(index.gem[scanned])))
+    keep = (groups.count >= num_fragments_min) & (groups.count <= num_fragments_max)
+    valid_gems = ranked_gems_from_groups(index, reorder_groups(groups, keep), limit)
+    for _, fragments, _ in valid_gems:
+        fragments.sort(key=lambda x: x.start)
+
+    return valid_gems
+
+
+def gem_codes_in_region(ChIA_Drop, region, region_gems=None):
+    """Sorted codes of the GEMs with a fragment in region, a (chr_id, left, right) tuple.
+
+    region_gems, if given, caches the result across calls (a dict or a GemSetCache).
+    """
+    if region_gems is not None:
+        gem_codes = region_gems.get(region)
+        if gem_codes is not None:
+            return gem_codes
+
+    with report.stage("intersect"):
+        gem_codes = ChIA_Drop.intersect(*region).gem_codes()
+    report.count("intersect_calls")
+    if region_gems is not None:
+        region_gems[region] = gem_codes
+    return gem_codes
+
+
+class AnchorGems:
+    """The candidate GEMs of one anchor triple, grouped once for every sort scheme.
+
+    Each scheme is expressed as per-fragment masks that are reduced per GEM, so
+    the fragments of the anchor window are read a single time however many
+    schemes are requested.
+    """
+
+    def __init__(self, index, groups):
+        self.index = index
+        self.groups = groups
+        self.heads = groups.offsets[:-1]
+        self.chrom = index.chrom[groups.rows]
+        self.start = index.start[groups.rows]
+        self.end = index.end[groups.rows]
+        self.row = index.row[groups.rows]
+        # Fragment tuples by position, built for the GEMs that are kept and shared by the schemes
+        self.fragments = {}
+
+    def fragment(self, position):
+        fragment = self.fragments.get(position)
+        if fragment is None:
+            fragment = self.fragments[position] = self.index.fragment(self.groups.rows[position])
+        return fragment
+
+    def overlaps(self, site):
+        code, start, end = site
+        return (self.chrom == code) & (self.start < end) & (self.end > start)
+
+    def any(self, mask):
+        """Whether each GEM has at least one fragment in mask."""
+        return np.logical_or.reduceat(mask, self.heads)
+
+    def summarize(self, mask):
+        """Fragment count, span and first row of each GEM, over the fragments in mask."""
+        never = np.iinfo(np.int64).max
+        count = np.add.reduceat(mask.astype(np.int64), self.heads)
+        min_start = np.minimum.reduceat(np.where(mask, self.start, never), self.heads)
+        max_end = np.maximum.reduceat(np.where(mask, self.end, -1), self.heads)
+        first = np.minimum.reduceat(np.where(mask, self.row, never), self.heads)
+        return count, min_start, max_end, first
+
+    def rank(self, members, mask, num_fragments_min, num_fragments_max, by_length=True,
+             span_within=None, nested=False, limit=None):
+        """Ranked GEMs of one scheme.
+
+        members selects the GEMs of the scheme and mask the fragments they keep.
+        GEMs are sorted by length (or, without by_length, kept in order of first
+        appearance with their fragments sorted by start) like the process_*
+        functions do. Only the GEMs kept by limit, a ComplexLimit, are built.
+        """
+        count, min_start, max_end, first = self.summarize(mask)
+        keep = members & (count > 0) & (count >= num_fragments_min) & (count <= num_fragments_max)
+        if span_within is not None:
+            keep &= (min_start > span_within[0]) & (max_end < span_within[1])
+
+        selected = np.flatnonzero(keep)
+        selected = selected[np.argsort(first[selected], kind='stable')]
+        lengths = max_end[selected] - min_start[selected] if by_length else None
+
+        if nested:
+            # Keep a GEM only if it strictly contains the last kept one
+            kept = []
+            for i in selected[np.argsort(lengths, kind='stable')]:
+                if not kept or (min_start[i] < min_start[kept[-1]] and max_end[i] > max_end[kept[-1]]):
+                    kept.append(i)
+            selected = np.array(kept, dtype=np.int64)
+            lengths = None
+
+        kept, total, histogram = (limit or NO_LIMIT).positions(self.index.gem_names, self.groups.gem[selected],
+                                                               count[selected], lengths)
+        selected = selected[kept]
+
+        offsets = self.groups.offsets
+        ranked_gems = []
+        for i in selected:
+            positions = offsets[i] + np.flatnonzero(mask[offsets[i]:offsets[i + 1]])
+            fragments = [self.fragment(position) for position in positions]
+            if not by_length:
+                fragments.sort(key=lambda x: x.start)
+            ranked_gems.append((self.index.gem_names[self.groups.gem[i]], fragments,
+                                int(max_end[i] - min_start[i])))
+        return RankedGems(ranked_gems, total, histogram)
+
+
+def sort_anchor(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, B, C, schemes, limit=None):
+    """Run the requested sort schemes of one anchor triple in a single pass.
+
+    Returns the same dict as sort.sort_anchor.
+    """
+    index = ChIA_Drop_anchor.index
+
+    def site(anchor):
+        chrom, start, end = anchor.split('\t')
+        return index.chrom_codes.get(chrom, -1), int(start), int(end)
+
+    a_code, a_start, a_end = site(A)
+    b_code, b_start, b_end = site(B)
+    c_code, c_start, c_end = site(C)
+
+    gem_codes = reachable_gems(index, ChIA_Drop_anchor.gem_codes(), num_fragments_min)
+    groups = ChIA_Drop_anchor.select_gems(gem_codes).group_by_gem()
+    if not len(groups.gem):
+        return {scheme: RankedGems() for scheme in schemes}
+
+    gems = AnchorGems(index, groups)
+    start, end = gems.start, gems.end
+    in_a = gems.overlaps((a_code, a_start, a_end))
+    in_b = gems.overlaps((b_code, b_start, b_end))
+    in_c = gems.overlaps((c_code, c_start, c_end))
+    # Sub-windows A-start to B-end and B-start to C-end of the anchor window
+    in_ab = gems.overlaps((a_code, a_start, b_end))
+    in_bc = gems.overlaps((a_code, b_start, c_end))
+    in_window = np.ones(len(start), dtype=bool)
+    in_region = (start >= a_start) & (end <= c_end)
+
+    ranked = {}
+    for scheme in schemes:
+        if scheme == "AtoB":
+            members = gems.any(in_a & in_ab) & ~gems.any(in_ab & (end >= b_start))
+            ranked[scheme] = gems.rank(members, in_ab, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "AtoC":
+            members = gems.any(in_a) & ~gems.any(end >= c_start)
+            ranked[scheme] = gems.rank(members, in_window, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "BtoA":
+            members = gems.any(in_b & in_ab) & ~gems.any(in_ab & (start <= a_end))
+            ranked[scheme] = gems.rank(members, in_ab, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "BtoC":
+            members = gems.any(in_b & in_bc) & ~gems.any(in_bc & (end >= c_start))
+            ranked[scheme] = gems.rank(members, in_bc, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "CtoA":
+            members = gems.any(in_c) & ~gems.any(start <= a_end)
+            ranked[scheme] = gems.rank(members, in_window, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "CtoB":
+            members = gems.any(in_c & in_bc) & ~gems.any(in_bc & (start <= b_end))
+            ranked[scheme] = gems.rank(members, in_bc, num_fragments_min, num_fragments_max, limit=limit)
+        elif scheme == "Bcentered":
+            in_areas = gems.any(gems.overlaps((b_code, a_end, b_start))) \
+                & gems.any(gems.overlaps((b_code, b_end, c_start)))
+            in_anchor = ((start >= a_start) & (end <= a_end)) | ((start >= c_start) & (end <= c_end))
+            members = in_areas & ~gems.any(in_anchor)
+            ranked[scheme] = gems.rank(members, in_window, num_fragments_min, num_fragments_max,
+                                       span_within=(a_end, c_start), nested=True, limit=limit)
+        elif scheme == "AandC":
+            members = gems.any(in_a) & gems.any(in_c)
+            ranked[scheme] = gems.rank(members, in_region, num_fragments_min, num_fragments_max,
+                                       by_length=False, limit=limit)
+        else:  # scheme == "AandBandC"
+            members = gems.any(in_a) & gems.any(in_b) & gems.any(in_c)
+            ranked[scheme] = gems.rank(members, in_region, num_fragments_min, num_fragments_max,
+                                       by_length=False, limit=limit)
+
+    return ranked
@@ -0,0 +1,69 @@
+import gc
+import os
+import resource
+import sys
+
+
+def current_rss():
+    """Resident set size of this process, in bytes."""
+    try:
+        with open("/proc/self/statm", 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs (macOS): fall back to the peak
+        return peak_rss()
+
+
+def peak_rss():
+    """Peak resident set size of this process, in bytes."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    """Keeps the RSS of a run under budget bytes by changing how much it holds at once.
+
+    Anchor triples are grouped batch_size at a time. After each batch the batch
+    size is halved when the RSS is above 3/4 of the budget and doubled again when
+    it falls below 2/5. Callers also check over() to spill fragment sets to disk
+    and to wait for pending plots before going on.
+    """
+
+    def __init__(self, budget, batch_size=64, max_batch_size=1024):
+        self.budget = budget
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.shrinks = 0
+        self.spills = 0
+        self.drains = 0
+        self.peak = current_rss()
+
+    def over(self, fraction=1.0):
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        return rss > fraction * self.budget
+
+    def adapt(self):
+        """Pick the size of the next batch from the memory left."""
+        self.batches += 1
+        if self.over(0.75):
+            gc.collect()
+            if self.batch_size > 1:
+                self.batch_size //= 2
+                self.shrinks += 1
+        elif not self.over(0.4):
+            self.batch_size = min(2 * self.batch_size, self.max_batch_size)
+
+    def relieve(self, plots):
+        """Near the budget, wait for the pending plots of a PlotQueue and collect garbage."""
+        if self.over(0.9):
+            plots.drain()
+            gc.collect()
+            self.drains += 1
+
+    def stats(self):
+        return {"budget": self.budget, "peak_rss": self.peak, "batches": self.batches,
+                "batch_size": self.batch_size, "shrinks": self.shrinks,
+                "spills": self.spills, "drains": self.drains}
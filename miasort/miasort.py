@@ -1,8 +1,18 @@
 from .start import start
+from .store import compile_store, load_index
+from .cache import DEFAULT_CACHE_BUDGET
+from .helper import DEFAULT_DENSITY_THRESHOLD
+from .export import load_complexes as read_complexes
+from .cooccurrence import write_cooccurrence, load_cooccurrence as read_cooccurrence
 
 def abc_sort(path1, path2, graphs, out_dir='/', plot=True, histogram=False, anchor_option='no',
              colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
-             frag_height=0.6, line_width=2.0, plot_width=50, subplots_margins=(0.9, 0.05, 0.9)):
+             frag_height=0.6, line_width=2.0, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+             engine='bedtools', workers=1, render_workers=0,
+             streaming=False, cache_budget=DEFAULT_CACHE_BUDGET, resume=False,
+             report=False, profile_anchor=None, trace_memory=False, memory_budget=None,
+             export_complexes=False, max_complexes=None, sample=None,
+             density_threshold=DEFAULT_DENSITY_THRESHOLD):
     """Sort Three Regions."""
     dataset = path1.split("/")[-1].split(".region")[0]
 
@@ -19,12 +29,21 @@ def abc_sort(path1, path2, graphs, out_dir='/', plot=True, histogram=False, anch
     start(path1, path2, "abc", graphs, num_frag_min, num_frag_max,
          "", "", dataset, out_dir, colors, anchor_option, graph_flag,
          extension, histogram_options, frag_height,
-         line_width, plot_width, subplots_margins)
+         line_width, plot_width, subplots_margins, engine=engine, workers=workers, render_workers=render_workers,
+         streaming=streaming, cache_budget=cache_budget, resume=resume, report=report,
+         profile_anchor=profile_anchor, trace_memory=trace_memory, memory_budget=memory_budget,
+         export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+         density_threshold=density_threshold)
 
 
 def multiple_sort(path1, path2, out_dir='/', plot=True, histogram=False, anchor_option='no',
                     colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
-                    frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9)):
+                    frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                    engine='bedtools', workers=1, render_workers=0,
+                    streaming=False, cache_budget=DEFAULT_CACHE_BUDGET, resume=False,
+                    report=False, profile_anchor=None, trace_memory=False, memory_budget=None,
+                    export_complexes=False, max_complexes=None, sample=None,
+                    density_threshold=DEFAULT_DENSITY_THRESHOLD):
     """Sort with A and B and C."""
     dataset = path1.split("/")[-1].split(".region")[0]
 
@@ -41,12 +60,19 @@ def multiple_sort(path1, path2, out_dir='/', plot=True, histogram=False, anchor_
     start(path1, path2, "AandBandC", "", num_frag_min, num_frag_max,
          "", "", dataset, out_dir, colors, anchor_option, graph_flag,
          extension, histogram_options, frag_height,
-         line_width, plot_width, subplots_margins)
+         line_width, plot_width, subplots_margins, engine=engine, workers=workers, render_workers=render_workers,
+         streaming=streaming, cache_budget=cache_budget, resume=resume, report=report,
+         profile_anchor=profile_anchor, trace_memory=trace_memory, memory_budget=memory_budget,
+         export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+         density_threshold=density_threshold)
 
 
 def unlimited_multiple_sort(path1, regions, operations, out_dir='/', plot=True, histogram=False, anchor_option='no',
                             colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
-                            frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9)):
+                            frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                            engine='bedtools', report=False, trace_memory=False,
+                            export_complexes=False, max_complexes=None, sample=None,
+                            density_threshold=DEFAULT_DENSITY_THRESHOLD):
     """Sort with A and B and C."""
     dataset = path1.split("/")[-1].split(".region")[0]
 
@@ -63,4 +89,58 @@ def unlimited_multiple_sort(path1, regions, operations, out_dir='/', plot=True,
     start(path1, "", "multiple", "", num_frag_min, num_frag_max,
          regions, operations, dataset, out_dir, colors, anchor_option, graph_flag,
          extension, histogram_options, frag_height,
-         line_width, plot_width, subplots_margins)
+         line_width, plot_width, subplots_margins, engine=engine, report=report,
+         trace_memory=trace_memory, export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+         density_threshold=density_threshold)
+
+
+def batch_multiple_sort(path1, path2, out_dir='/', plot=False, histogram=False, anchor_option='no',
+                        colors='red;green;#525252', num_frag_min=2, num_frag_max=1000, extension='6000',
+                        frag_height=0.6, line_width=1.5, plot_width=50, subplots_margins=(0.9, 0.05, 0.9),
+                        engine='bedtools', render_workers=0, cache_budget=DEFAULT_CACHE_BUDGET,
+                        report=False, profile_anchor=None, trace_memory=False, memory_budget=None,
+                        export_complexes=False, max_complexes=None, sample=None,
+                        density_threshold=DEFAULT_DENSITY_THRESHOLD):
+    """Sort many region sets against one loaded dataset."""
+    dataset = path1.split("/")[-1].split(".region")[0]
+
+    if plot:
+        graph_flag = "yes"
+    else:
+        graph_flag = "no"
+
+    if histogram:
+        histogram_options = "yes"
+    else:
+        histogram_options = "no"
+
+    start(path1, path2, "batch", "", num_frag_min, num_frag_max,
+         "", "", dataset, out_dir, colors, anchor_option, graph_flag,
+         extension, histogram_options, frag_height,
+         line_width, plot_width, subplots_margins, engine=engine, render_workers=render_workers,
+         cache_budget=cache_budget, report=report, profile_anchor=profile_anchor, trace_memory=trace_memory,
+         memory_budget=memory_budget, export_complexes=export_complexes, max_complexes=max_complexes, sample=sample,
+         density_threshold=density_threshold)
+
+
+def compile_complexes(path1, out_path=None):
+    """Compile a region file into a columnar store for the `numpy` engine."""
+    return compile_store(path1, out_path)
+
+
+def load_complexes(path):
+    """Load the ranked complexes exported with `export_complexes=True` as a dict of arrays."""
+    return read_complexes(path)
+
+
+def anchor_cooccurrence(path1, path2, out_path=None, num_frag_min=2, num_frag_max=1000):
+    """Count the complexes shared by every pair of anchor sites of path2 and save them as sparse matrices."""
+    if out_path is None:
+        dataset = path1.split("/")[-1].split(".region")[0]
+        out_path = f"{dataset}_{path2.split('/')[-1]}_minfrag_{num_frag_min}_maxfrag_{num_frag_max}_cooccurrence.npz"
+    return write_cooccurrence(load_index(path1), path2, out_path, num_frag_min, num_frag_max)
+
+
+def load_cooccurrence(path):
+    """Load the incidence and co-occurrence matrices written by `anchor_cooccurrence` as a dict of arrays."""
+    return read_cooccurrence(path)
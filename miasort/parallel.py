@@ -0,0 +1,198 @@
+import cProfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from . import index_sort
+from .index import FragmentView
+from .cache import GemSetCache
+from . import report
+from .report import RunReport
+
+# Set in every worker process by init_worker
+_worker = {}
+
+
+def sorter_for(engine):
+    """The sort module of engine. The bedtools one, and pybedtools, are imported on first use."""
+    if engine == "numpy":
+        return index_sort
+    from . import sort
+    return sort
+
+
+def draw(*args, **kwargs):
+    """plot_ranked_gems, importing matplotlib with the first plot."""
+    from .plot import plot_ranked_gems
+    plot_ranked_gems(*args, **kwargs)
+
+
+def init_worker(engine, index, cache_budget, report_options=None, limit=None):
+    if report_options is not None:
+        report.activate(RunReport(**report_options))
+    _worker["sorter"] = sorter_for(engine)
+    _worker["index"] = index
+    # Each worker keeps its own cache of the GEMs touching each site
+    _worker["options"] = sort_options(engine, GemSetCache(cache_budget) if cache_budget else None, limit)
+
+
+def sort_options(engine, region_gems, limit=None):
+    options = {}
+    # Only the bedtools engine intersects sites one by one; the numpy engine
+    # classifies all sites of a triple in one pass and needs no cache
+    if engine == "bedtools" and region_gems is not None:
+        options["region_gems"] = region_gems
+    if limit is not None:
+        options["limit"] = limit
+    return options
+
+
+def sort_anchor_job(job, profile=False):
+    """Worker entry point: run the sort schemes of one anchor triple.
+
+    With profile, the job runs under cProfile and its stats travel back too.
+    """
+    ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, B, C, schemes = job
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    if _worker["index"] is not None:
+        # numpy views are shipped as (rows, window) and rebuilt on the shared index
+        rows, window = ChIA_Drop_anchor
+        ChIA_Drop_anchor = FragmentView(_worker["index"], rows, window)
+    with report.stage("sort"):
+        ranked = _worker["sorter"].sort_anchor(ChIA_Drop_anchor, num_fragments_min, num_fragments_max,
+                                               A, B, C, schemes, **_worker["options"])
+    profile_stats = None
+    if profiler is not None:
+        profiler.disable()
+        profiler.create_stats()
+        profile_stats = profiler.stats
+    # The stages and counters of the job travel back with its result
+    return ranked, report.active().drain() if report.active() is not None else None, profile_stats
+
+
+def map_anchors(engine, index, jobs, workers=1, region_gems=None, limit=None):
+    """Yield sort_anchor results for jobs, in order.
+
+    jobs are (ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, B, C,
+    schemes) tuples. With workers > 1 they run on a process pool; at most
+    2 * workers results are pending at a time, so memory stays bounded when the
+    caller (plots, records) is slower than the pool. region_gems is the
+    GemSetCache of the serial run; pool workers get their own with its budget.
+    limit is the ComplexLimit of every scheme, if any. The job of the anchor
+    triple profiled by the active report runs under cProfile in its worker.
+    """
+    if workers <= 1:
+        sorter = sorter_for(engine)
+        options = sort_options(engine, region_gems, limit)
+        for job in jobs:
+            with report.stage("sort"):
+                ranked = sorter.sort_anchor(*job, **options)
+            yield ranked
+        return
+
+    cache_budget = region_gems.budget if region_gems is not None else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(engine, index, cache_budget, report_options(), limit)) as executor:
+        pending = deque()
+        profiled = report.active().profiled_position() if report.active() is not None else None
+        for position, job in enumerate(jobs):
+            pending.append(executor.submit(sort_anchor_job, pack_job(job, index), position == profiled))
+            if len(pending) >= 2 * workers:
+                yield merge_stats(pending.popleft().result())
+        while pending:
+            yield merge_stats(pending.popleft().result())
+
+
+def report_options():
+    """Options of the worker reports, or None when no report is active."""
+    return report.active().options() if report.active() is not None else None
+
+
+def merge_stats(result):
+    """Fold the stages, counters and profile shipped with a worker result into the active report."""
+    result, stats, profile_stats = result
+    if stats is not None and report.active() is not None:
+        report.active().merge(stats)
+    if profile_stats is not None and report.active() is not None:
+        report.active().add_profile(profile_stats)
+    return result
+
+
+def pack_job(job, index):
+    if index is None:
+        return job
+    ChIA_Drop_anchor = job[0]
+    return ((ChIA_Drop_anchor.rows, ChIA_Drop_anchor.window),) + tuple(job[1:])
+
+
+def init_render_worker(report_options=None):
+    # Render workers have no display; draw straight to image files
+    import matplotlib
+    matplotlib.use("Agg")
+    if report_options is not None:
+        report.activate(RunReport(**report_options))
+
+
+def render_job(*args, **kwargs):
+    """Render worker entry point: draw one plot and ship back its stages."""
+    with report.stage("plot"):
+        draw(*args, **kwargs)
+    return report.active().drain() if report.active() is not None else None
+
+
+class PlotQueue:
+    """Render plots on a pool of render workers while the caller keeps sorting.
+
+    submit() takes the arguments of plot_ranked_gems. With workers = 0 the plot
+    is drawn immediately; otherwise it is queued, and once max_pending figures
+    are waiting submit() blocks on the oldest one, which bounds the memory held
+    by pending figures.
+    """
+
+    def __init__(self, workers=0, max_pending=None):
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.pending = deque()
+        self.executor = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker,
+                                                initargs=(report_options(),))
+
+    def submit(self, *args, **kwargs):
+        """Draw or queue a plot; returns its future, or None once drawn."""
+        if self.executor is None:
+            with report.stage("plot"):
+                draw(*args, **kwargs)
+            return None
+        future = self.executor.submit(render_job, *args, **kwargs)
+        self.pending.append(future)
+        while len(self.pending) > self.max_pending:
+            self.wait(self.pending.popleft())
+        return future
+
+    def wait(self, future):
+        stats = future.result()
+        if stats is not None and report.active() is not None:
+            report.active().merge(stats)
+
+    def drain(self):
+        """Wait for the queued plots, raising the first rendering error."""
+        while self.pending:
+            self.wait(self.pending.popleft())
+
+    def close(self):
+        """Wait for the queued plots and stop the render workers."""
+        if self.executor is None:
+            return
+        try:
+            self.drain()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
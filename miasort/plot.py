@@ -1,22 +1,37 @@
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgb
 from matplotlib.gridspec import GridSpec
-from .helper import figsize_height_scaler, kb_format, create_plot_title
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+from .helper import figsize_height_scaler, kb_format, create_plot_title, DEFAULT_DENSITY_THRESHOLD
+from .ranking import complexes_label
+from . import report
+
+# Rank and position bins of a density image, and its height as a number of complexes
+DENSITY_ROWS = 400
+DENSITY_COLUMNS = 1000
+DENSITY_HEIGHT = 100
 
 def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
                            right_anchor_list, middle_anchor_list, out_dir, colors_flags,
                            anchor_options, id, path1, commands_list, extension,
                            frag_height, line_width, plot_width, subplots_margins, frag_description,
-                           flag="abc", regions=[]):
+                           flag="abc", regions=[], density_threshold=DEFAULT_DENSITY_THRESHOLD):
     directory_str = output_file
     if out_dir != "/":
         directory_str = f"./{out_dir}/{output_file}"
 
+    def dense(ranked_gems):
+        return density_threshold is not None and len(ranked_gems) > density_threshold
+
+    def subplot_height(ranked_gems):
+        # A density image has the same size however many complexes it holds
+        return round(figsize_height_scaler(DENSITY_HEIGHT if dense(ranked_gems) else len(ranked_gems)))
+
     if flag == "abc":
-        heights = [round(figsize_height_scaler(len(ranked_gems_list[0]))),
-                    round(figsize_height_scaler(len(ranked_gems_list[1]))),
-                    round(figsize_height_scaler(len(ranked_gems_list[2])))]
+        heights = [subplot_height(ranked_gems) for ranked_gems in ranked_gems_list]
         total_height = sum(heights) * 2
         max_height = 32767 / plot_width  # Matplotlib limit for the height
 
@@ -27,10 +42,10 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
 
         fig = plt.figure(figsize=(plot_width, total_height))
         # Create GridSpec with custom heights
-        gs = GridSpec(3, 1, height_ratios=heights, figure=fig)
+        gs = GridSpec(len(heights), 1, height_ratios=heights, figure=fig)
 
     else:
-        height = round(figsize_height_scaler(len(ranked_gems_list[0])))
+        height = subplot_height(ranked_gems_list[0])
         max_height = 32767 / plot_width  # Matplotlib limit for the height
 
         if height * 2 > max_height:
@@ -47,33 +62,29 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
         right_anchor = right_anchor_list[idx]
         middle_anchor = middle_anchor_list[idx]
 
-        gem_fragments = {}
-
-        for i, (gem_id, fragments, _) in enumerate(ranked_gems):
-            gem_fragments[gem_id] = fragments
-            for fragment in fragments:
-                _, start, end = fragment.chrom, fragment.start, fragment.end
-                if extension == "natural":
-                    width = end - start
-                else:
-                    width = int(extension)
-                rect = patches.Rectangle((start - width / 2, i - 0.225),
-                                         width, frag_height, linewidth=2,
-                                         edgecolor="black",
-                                         facecolor=colors_flags["fragments"],
-                                         zorder=2)
-                ax.add_patch(rect)
-
-        count = 0
-        for gem_id, fragments in gem_fragments.items():
-            start = fragments[0].start
-            end = fragments[-1].start
-            line = Line2D([start, end], [count, count],
-                          color=colors_flags["lines"],
-                          linestyle='-', linewidth=line_width,
-                          zorder=1)
-            ax.add_line(line)
-            count += 1
+        starts, ends, rows, line_starts, line_ends = fragment_arrays(ranked_gems)
+        if extension == "natural":
+            widths = ends - starts
+        else:
+            widths = np.full(len(starts), int(extension))
+        left = starts - widths / 2
+
+        if not dense(ranked_gems):
+            # One polygon per fragment, drawn as a single collection
+            bottom = rows - 0.225
+            verts = np.stack([np.column_stack([left, bottom]),
+                              np.column_stack([left + widths, bottom]),
+                              np.column_stack([left + widths, bottom + frag_height]),
+                              np.column_stack([left, bottom + frag_height])], axis=1)
+            ax.add_collection(PolyCollection(verts, linewidths=2, edgecolors="black",
+                                             facecolors=colors_flags["fragments"], joinstyle="miter", zorder=2))
+
+            # One line per complex, from its first to its last fragment
+            counts = np.arange(len(line_starts))
+            segments = np.stack([np.column_stack([line_starts, counts]),
+                                 np.column_stack([line_ends, counts])], axis=1)
+            ax.add_collection(LineCollection(segments, colors=colors_flags["lines"],
+                                             linestyles='-', linewidths=line_width, zorder=1))
 
         if flag == "abc":
             left_start, left_end = int(left_anchor.split('\t')[1]), int(left_anchor.split('\t')[2])
@@ -156,7 +167,7 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
         if flag == "abc":
             anchors = [left_anchor, middle_anchor, right_anchor]
             anchors.sort(key=lambda x: int(x.split('\t')[1]))
-            title = create_plot_title(id, path1, commands_list[idx], anchors, len(ranked_gems), frag_description)
+            title = create_plot_title(id, path1, commands_list[idx], anchors, complexes_label(ranked_gems), frag_description)
             ax.set_title(title, fontdict=title_font)
 
             left_end = min(left_start, right_start, middle_start)
@@ -169,7 +180,7 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
                 left_end = min(left_end, l)
                 right_end = max(right_end, r)
             title = create_plot_title(id, path1, commands_list[idx],
-                                      regions, len(ranked_gems), frag_description, flag=flag)
+                                      regions, complexes_label(ranked_gems), frag_description, flag=flag)
             ax.set_title(title, fontdict=title_font)
 
         distance = right_end - left_end
@@ -178,7 +189,13 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
 
         ax.set_xlabel("Genomic Position", fontdict=label_font)
         ax.set_ylabel("Chromatin Complexes", fontdict=label_font)
-        ax.set_yticks([i for i in range(len(ranked_gems))], labels=range(1, len(ranked_gems) + 1))
+        if dense(ranked_gems):
+            draw_density(ax, left, left + widths, rows, line_starts, line_ends, len(ranked_gems), colors_flags)
+            # A tick per complex would be unreadable, and slow to lay out
+            ax.yaxis.set_major_locator(MaxNLocator(20, integer=True))
+            ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f"{int(y) + 1}"))
+        else:
+            ax.set_yticks([i for i in range(len(ranked_gems))], labels=range(1, len(ranked_gems) + 1))
 
         ax.invert_yaxis()
         ax.tick_params(axis='x', labelsize=tick_font_size)
@@ -187,5 +204,66 @@ def plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
         ax.xaxis.set_major_formatter(plt.FuncFormatter(kb_format))
 
     plt.subplots_adjust(top=subplots_margins[0], bottom=subplots_margins[1], hspace=subplots_margins[2])
-    plt.savefig(directory_str)
+    with report.stage("savefig"):
+        fig.savefig(directory_str)
     plt.close(fig)
+
+
+def fragment_arrays(ranked_gems):
+    """Fragment starts, ends and complex ranks, plus each complex's line span, as arrays."""
+    counts = [len(fragments) for _, fragments, _ in ranked_gems]
+    starts = np.fromiter((fragment.start for _, fragments, _ in ranked_gems for fragment in fragments),
+                         dtype=np.float64, count=sum(counts))
+    ends = np.fromiter((fragment.end for _, fragments, _ in ranked_gems for fragment in fragments),
+                       dtype=np.float64, count=sum(counts))
+    rows = np.repeat(np.arange(len(ranked_gems)), counts)
+    line_starts = np.array([fragments[0].start for _, fragments, _ in ranked_gems], dtype=np.float64)
+    line_ends = np.array([fragments[-1].start for _, fragments, _ in ranked_gems], dtype=np.float64)
+    return starts, ends, rows, line_starts, line_ends
+
+
+def draw_density(ax, lefts, rights, rows, line_starts, line_ends, num_gems, colors_flags):
+    """Draw the complexes as one layer of binned ranks and positions, within the current limits.
+
+    Each pixel is shaded by the number of fragments (in the fragment color) and
+    of complex lines (in the line color) that cover it, on a log scale, so the
+    image has the same size however many complexes there are.
+    """
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    num_rows = min(DENSITY_ROWS, num_gems)
+    fragments = coverage(rows, lefts, rights, num_gems, num_rows, xlim)
+    lines = coverage(np.arange(num_gems), line_starts, line_ends, num_gems, num_rows, xlim)
+
+    def shade(counts):
+        return np.log1p(counts) / np.log1p(counts.max()) if counts.max() > 0 else counts
+
+    # Fragments over lines, on a transparent background so the anchors show through
+    fragment_alpha = shade(fragments)[..., None]
+    line_alpha = 0.6 * shade(lines)[..., None]
+    alpha = fragment_alpha + line_alpha * (1 - fragment_alpha)
+    color = np.array(to_rgb(colors_flags["fragments"])) * fragment_alpha \
+        + np.array(to_rgb(colors_flags["lines"])) * line_alpha * (1 - fragment_alpha)
+    image = np.concatenate([np.divide(color, alpha, out=np.zeros_like(color), where=alpha > 0), alpha], axis=2)
+
+    # A mesh of the bins, unlike imshow, is not resampled to a buffer the size of the figure
+    ax.pcolormesh(np.linspace(xlim[0], xlim[1], DENSITY_COLUMNS + 1), np.linspace(-0.5, num_gems - 0.5, num_rows + 1),
+                  image, shading="flat", edgecolors="none", antialiased=False, zorder=2)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+
+
+def coverage(rows, lefts, rights, num_gems, num_rows, xlim):
+    """Number of intervals covering each (rank bin, position bin) of xlim."""
+    scale = DENSITY_COLUMNS / (xlim[1] - xlim[0])
+    first = np.floor((np.minimum(lefts, rights) - xlim[0]) * scale)
+    last = np.floor((np.maximum(lefts, rights) - xlim[0]) * scale)
+    visible = (last >= 0) & (first < DENSITY_COLUMNS)
+    first = np.clip(first[visible], 0, DENSITY_COLUMNS - 1).astype(np.int64)
+    last = np.clip(last[visible], 0, DENSITY_COLUMNS - 1).astype(np.int64)
+    bins = rows[visible] * num_rows // num_gems
+
+    # Add one at the first bin of each interval and take it back after the last
+    counts = np.zeros((num_rows, DENSITY_COLUMNS + 1))
+    np.add.at(counts, (bins, first), 1)
+    np.add.at(counts, (bins, last + 1), -1)
+    return np.cumsum(counts, axis=1)[:, :DENSITY_COLUMNS]
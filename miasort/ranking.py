@@ -0,0 +1,135 @@
+import hashlib
+import heapq
+
+import numpy as np
+
+
+class RankedGems(list):
+    """The ranked (gem_id, fragments, gem_length) tuples of one sort scheme.
+
+    When a ComplexLimit dropped complexes, total and histogram (complexes per
+    number of fragments) still count every complex that matched the scheme, so
+    the comp records and histogram files stay exact.
+    """
+
+    def __init__(self, gems=(), total=None, histogram=None):
+        super().__init__(gems)
+        self.total = len(self) if total is None else total
+        self.histogram = histogram
+
+
+def num_complexes(ranked_gems):
+    """Number of complexes that matched, kept or not."""
+    return getattr(ranked_gems, "total", len(ranked_gems))
+
+
+def complexes_label(ranked_gems):
+    """num_complexes of a plot title, with the number drawn when complexes were dropped."""
+    total = num_complexes(ranked_gems)
+    if total == len(ranked_gems):
+        return f"{total}"
+    return f"{total} ({len(ranked_gems)} shown)"
+
+
+class ComplexLimit:
+    """Which of the ranked complexes of a sort scheme to keep.
+
+    max_complexes keeps the first complexes of the ranking (the shortest, for
+    the schemes ranked by length), selected with a heap of that size instead of
+    a full sort. sample keeps a uniform random sample of that size, ranked like
+    the full list: it is a reservoir sample with random keys, the complexes with
+    the smallest hash of seed and GEM id, so reruns and both engines keep the
+    same GEMs.
+    """
+
+    def __init__(self, max_complexes=None, sample=None, seed=0):
+        if max_complexes is not None and sample is not None:
+            raise ValueError("max_complexes and sample cannot be used together")
+        for name, value in (("max_complexes", max_complexes), ("sample", sample)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be at least 1, got {value}")
+        self.max_complexes = max_complexes
+        self.sample = sample
+        self.seed = seed
+
+    def priority(self, gem_id):
+        digest = hashlib.blake2b(f"{self.seed}\t{gem_id}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def select(self, candidates, key=None, build=None):
+        """Rank and keep the complexes of candidates.
+
+        candidates are (gem_id, fragments, gem_length, ...) tuples in order of
+        first appearance, ranked by key (ties keep that order) or left in that
+        order without one. build, if given, turns each kept candidate into its
+        ranked tuple. Only the kept candidates are held in a heap, never all of
+        them.
+        """
+        histogram = {}
+        total = 0
+
+        def counted():
+            nonlocal total
+            for position, candidate in enumerate(candidates):
+                total += 1
+                size = len(candidate[1])
+                histogram[size] = histogram.get(size, 0) + 1
+                yield position, candidate
+
+        if key is None:
+            rank = lambda entry: entry[0]
+        else:
+            rank = lambda entry: (key(entry[1]), entry[0])
+
+        if self.sample is not None:
+            kept = heapq.nsmallest(self.sample, counted(), key=lambda entry: (self.priority(entry[1][0]), entry[0]))
+            kept.sort(key=rank)
+        elif self.max_complexes is not None:
+            kept = heapq.nsmallest(self.max_complexes, counted(), key=rank)
+        else:
+            kept = sorted(counted(), key=rank)
+
+        kept = [candidate for _, candidate in kept]
+        if build is not None:
+            kept = [build(candidate) for candidate in kept]
+        return RankedGems(kept, total, histogram)
+
+    def positions(self, gem_names, gem_codes, counts, keys=None):
+        """The NumPy counterpart of select.
+
+        gem_codes (codes into gem_names) and counts (fragments per complex)
+        describe the candidates in order of first appearance, and keys ranks
+        them. Returns the positions of the kept candidates in ranked order, their
+        total and their histogram.
+        """
+        total = len(counts)
+        sizes, frequencies = np.unique(counts, return_counts=True)
+        histogram = dict(zip(sizes.tolist(), frequencies.tolist()))
+
+        if self.sample is not None:
+            priorities = np.array([self.priority(gem_names[code]) for code in gem_codes], dtype=np.uint64)
+            kept = np.sort(smallest(priorities, self.sample))
+            if keys is not None:
+                kept = kept[np.argsort(keys[kept], kind='stable')]
+        elif self.max_complexes is not None:
+            if keys is None:
+                kept = np.arange(min(self.max_complexes, total))
+            else:
+                kept = smallest(keys, self.max_complexes)
+        else:
+            kept = np.arange(total) if keys is None else np.argsort(keys, kind='stable')
+        return kept, total, histogram
+
+
+def smallest(keys, k):
+    """Positions of the k smallest keys in ranked order, ties in order of position, without a full sort."""
+    if k < len(keys):
+        kth = np.partition(keys, k - 1)[k - 1]
+        candidates = np.flatnonzero(keys <= kth)
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates], kind='stable')][:k]
+
+
+# Keeps every complex
+NO_LIMIT = ComplexLimit()
@@ -1,20 +1,60 @@
 import os
 import csv
+import sys
 
-def write_to_csv_file(id, A, B, C, command, num_complexes, csv_file, out_dir, ranked_gems):
-    # Determine the output path
-    if out_dir != "/":
-        output_path = os.path.join(out_dir, csv_file)
-    else:
-        output_path = csv_file
+from . import report
 
+# csv_file that sends the comp records to standard output
+STDOUT = "-"
+
+
+class RecordsWriter:
+    """The comp records file of a run, opened once for all its rows.
+
+    Rows are buffered and reach the file in bulk when flush() is called, once
+    per anchor triple, so the size a RunManifest records covers all of them.
+    """
+
+    def __init__(self, csv_file, out_dir):
+        self.stdout = csv_file == STDOUT
+        if self.stdout:
+            self.file = sys.stdout
+        else:
+            self.file = open(os.path.join(out_dir, csv_file) if out_dir != "/" else csv_file, "a", newline='')
+        self.writer = csv.writer(self.file)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        with report.stage("records"):
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if not self.stdout:
+            self.file.close()
+
+
+def fragment_histogram(ranked_gems):
+    """Number of complexes with 1, 2, 3, 4 and >=5 fragments."""
     histogram = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    # Counted over every complex that matched, when only some were kept
+    if getattr(ranked_gems, "histogram", None) is not None:
+        for num_fragments, num_gems in ranked_gems.histogram.items():
+            histogram[min(num_fragments, 5)] += num_gems
+        return histogram
     for gem_tuple in ranked_gems:
         num_fragments = int(len(gem_tuple[1]))
         if num_fragments >= 5:
             histogram[5] += 1
         else:
             histogram[num_fragments] += 1
+    return histogram
+
+
+def write_to_csv_file(id, A, B, C, command, num_complexes, records, ranked_gems):
+    histogram = fragment_histogram(ranked_gems)
 
     l = A.split('\t')
     anchor_a = f"{l[0]}:{l[1]}-{l[2]}"
@@ -27,30 +67,25 @@ def write_to_csv_file(id, A, B, C, command, num_complexes, csv_file, out_dir, ra
 
     region = f"{l[0]}:{l[1]}-{r[2]}"
 
-    with open(output_path, "a") as file:
-        writer = csv.writer(file)
+    with report.stage("records"):
         field = [id, anchor_a, anchor_b, anchor_c, region, command, num_complexes,
                  histogram[1], histogram[2], histogram[3], histogram[4], histogram[5]]
-        writer.writerow(field)
+        records.writerow(field)
 
 
-def write_to_csv_file_multiple(id, A, B, C, region, command, num_complexes, csv_file, out_dir, ranked_gems):
-    # Determine the output path
-    if out_dir != "/":
-        output_path = os.path.join(out_dir, csv_file)
-    else:
-        output_path = csv_file
+def write_to_csv_file_multiple(id, A, B, C, region, command, num_complexes, records, ranked_gems):
+    histogram = fragment_histogram(ranked_gems)
 
-    histogram = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-    for gem_tuple in ranked_gems:
-        num_fragments = int(len(gem_tuple[1]))
-        if num_fragments >= 5:
-            histogram[5] += 1
-        else:
-            histogram[num_fragments] += 1
-
-    with open(output_path, "a") as file:
-        writer = csv.writer(file)
+    with report.stage("records"):
         field = [id, A, B, C, region, command, num_complexes,
                  histogram[1], histogram[2], histogram[3], histogram[4], histogram[5]]
-        writer.writerow(field)
+        records.writerow(field)
+
+
+def write_to_csv_file_batch(id, regions, operations, num_complexes, records, ranked_gems):
+    histogram = fragment_histogram(ranked_gems)
+
+    with report.stage("records"):
+        field = [id, regions, operations, num_complexes,
+                 histogram[1], histogram[2], histogram[3], histogram[4], histogram[5]]
+        records.writerow(field)
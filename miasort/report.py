@@ -0,0 +1,250 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+
+from .memory import current_rss, peak_rss
+
+REPORT_NAME = "run_report.json"
+
+# Report of the running start() call, or of this worker process
+_active = None
+
+# Stage fields that keep their largest value instead of adding up
+PEAK_FIELDS = ("rss_growth", "traced_peak")
+
+
+class RunReport:
+    """Wall and CPU time per stage, counters and per-anchor costs of one run.
+
+    Stages nest, so the time of a stage includes the stages run inside it (for
+    instance `intersect` inside `sort`). Worker processes keep their own report
+    and ship it back with each result through drain() and merge().
+    profile_anchor is the ID of an anchor triple (or batch query) to run under
+    cProfile; its stats, with those of its sort in a worker process, are
+    dumped to `<id>.prof` in out_dir.
+
+    Each stage and anchor also records its RSS growth. With trace_memory, the
+    peak of the Python allocations above their level at the start of the stage
+    or anchor is traced with tracemalloc, which slows the run down.
+    """
+
+    def __init__(self, out_dir="/", profile_anchor=None, trace_memory=False):
+        self.out_dir = out_dir
+        self.profile_anchor = profile_anchor
+        self.trace_memory = trace_memory
+        # (traced memory at the start, highest peak seen) of the anchor and each open stage
+        self.traced = []
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self.stages = {}
+        self.counters = Counter()
+        self.anchors = []
+        self.upcoming = deque()
+        self.profiler = None
+        # Profile stats shipped back by the worker that sorted the profiled anchor triple
+        self.worker_profiles = []
+        self.mark = None
+        self.tempfiles = created_tempfiles()
+        self.started = (time.perf_counter(), time.process_time())
+
+    def options(self):
+        """Arguments of the reports of worker processes."""
+        return {"trace_memory": self.trace_memory}
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss()
+        if self.trace_memory:
+            self.enter_traced()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "rss_growth": 0})
+            totals["calls"] += 1
+            totals["wall"] += time.perf_counter() - wall
+            totals["cpu"] += time.process_time() - cpu
+            totals["rss_growth"] = max(totals["rss_growth"], current_rss() - rss)
+            if self.trace_memory:
+                totals["traced_peak"] = max(totals.get("traced_peak", 0), self.exit_traced())
+
+    def enter_traced(self):
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak is reset for the new frame, so keep the one of the enclosing frame
+        if self.traced:
+            self.traced[-1][1] = max(self.traced[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.traced.append([current, current])
+
+    def exit_traced(self):
+        """Close the innermost frame; returns its peak above its starting level."""
+        start, seen = self.traced.pop()
+        peak = max(seen, tracemalloc.get_traced_memory()[1])
+        if self.traced:
+            self.traced[-1][1] = max(self.traced[-1][1], peak)
+        return peak - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def sync_tempfiles(self):
+        """Count the pybedtools temp files created since the last sync."""
+        created = created_tempfiles()
+        if created > self.tempfiles:
+            self.counters["temp_files"] += created - self.tempfiles
+        self.tempfiles = created
+
+    def drain(self):
+        """Stages and counters recorded since the last drain, for merge() in the parent."""
+        self.sync_tempfiles()
+        stats = (self.stages, dict(self.counters))
+        self.stages, self.counters = {}, Counter()
+        return stats
+
+    def merge(self, stats):
+        stages, counters = stats
+        for name, totals in stages.items():
+            merged = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            for field, value in totals.items():
+                if field in PEAK_FIELDS:
+                    merged[field] = max(merged.get(field, 0), value)
+                else:
+                    merged[field] += value
+        self.counters.update(counters)
+
+    def expect(self, ids):
+        """Queue the IDs of the anchor triples about to be processed, in order."""
+        self.upcoming.extend(ids)
+        self.checkpoint()
+
+    def anchor(self, id, **fields):
+        """Close the record of anchor triple id, which covers everything done since the previous one."""
+        self.sync_tempfiles()
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss()
+        mark_wall, mark_cpu, mark_rss, stages, counters = self.mark
+        record = {"id": id, "wall": wall - mark_wall, "cpu": cpu - mark_cpu,
+                  "rss": rss, "rss_growth": rss - mark_rss,
+                  "stages": {name: totals["wall"] - stages.get(name, 0.0) for name, totals in self.stages.items()
+                             if totals["wall"] != stages.get(name, 0.0)},
+                  "counters": dict(self.counters - counters)}
+        if self.trace_memory:
+            record["traced_peak"] = self.exit_traced()
+        record.update(fields)
+        self.anchors.append(record)
+
+        if self.upcoming and self.upcoming[0] == id:
+            self.upcoming.popleft()
+        if self.profiler is not None:
+            self.profiler.disable()
+            stats = pstats.Stats(self.profiler)
+            for worker_stats in self.worker_profiles:
+                stats.add(WorkerProfile(worker_stats))
+            stats.dump_stats(self.output_path(f"{id}.prof"))
+            self.profiler = None
+            self.worker_profiles = []
+        self.checkpoint()
+
+    def profiled_position(self):
+        """Position of the profiled anchor triple among the upcoming ones, or None."""
+        if self.profile_anchor is None or self.profile_anchor not in self.upcoming:
+            return None
+        return list(self.upcoming).index(self.profile_anchor)
+
+    def add_profile(self, stats):
+        """Add the profile stats of a worker to the profile of the current anchor triple."""
+        self.worker_profiles.append(stats)
+
+    def checkpoint(self):
+        self.mark = (time.perf_counter(), time.process_time(), current_rss(),
+                     {name: totals["wall"] for name, totals in self.stages.items()}, Counter(self.counters))
+        if self.trace_memory:
+            # An anchor is the outermost frame; the frame of a previous chunk may still be open
+            self.traced.clear()
+            self.enter_traced()
+        # The next anchor triple starts with its sort, so profiling starts here
+        if self.profile_anchor is not None and self.upcoming and self.upcoming[0] == self.profile_anchor \
+                and self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def output_path(self, name):
+        return os.path.join(self.out_dir, name) if self.out_dir != "/" else name
+
+    def to_dict(self, **fields):
+        self.sync_tempfiles()
+        wall, cpu = self.started
+        document = dict(fields)
+        document.update({"wall": time.perf_counter() - wall, "cpu": time.process_time() - cpu,
+                         "peak_rss": peak_rss(),
+                         "stages": self.stages, "counters": dict(self.counters), "anchors": self.anchors})
+        return document
+
+    def write(self, **fields):
+        """Write the report to run_report.json in out_dir; returns its path."""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler = None
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        path = self.output_path(REPORT_NAME)
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(**fields), file, indent=2)
+        return path
+
+
+class WorkerProfile:
+    """Profile stats shipped back by a worker, in the form pstats.Stats loads."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def created_tempfiles():
+    # pybedtools lists every temp file it creates
+    filenames = sys.modules.get("pybedtools.filenames")
+    return len(filenames.TEMPFILES) if filenames is not None else 0
+
+
+def activate(report):
+    """Make report the target of stage() and count() in this process; returns the previous one."""
+    global _active
+    previous, _active = _active, report
+    return previous
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    """Time a stage of the active report; does nothing when no report is active."""
+    if _active is None:
+        return nullcontext()
+    return _active.stage(name)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def timed(iterable, name):
+    """Iterate over iterable, timing the production of each item as stage name."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -1,14 +1,16 @@
 import pybedtools
 from pybedtools import BedTool
 
-def process_left(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region):
+from .helper import process_multiple_regions
+from .ranking import NO_LIMIT
+from . import report
+
+def process_left(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region,
+                 region_gems=None, limit=None):
     right_anchor_start = int(right_anchor.split('\t')[1])
     right_anchor_end = int(right_anchor.split('\t')[2])
 
-    left_anchor_bed = BedTool(left_anchor, from_string=True)
-
-    intersecting_fragments = ChIA_Drop.intersect(left_anchor_bed, wa=True, wb=True)
-    intersecting_gem_ids = set(fragment.fields[4] for fragment in intersecting_fragments)
+    intersecting_gem_ids = gem_ids_in_region(ChIA_Drop, site_region(left_anchor), region_gems)
 
     ChIA_Drop = ChIA_Drop.filter(lambda x: x.fields[4] in intersecting_gem_ids)
 
@@ -48,26 +50,20 @@ def process_left(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, r
 
         num_frgaments = len(gem_info['fragments'])
         if num_frgaments >= num_fragments_min and num_frgaments <= num_fragments_max:
-            fragments = [
-                pybedtools.create_interval_from_list(fragment)
-                for fragment in gem_info['fragments']
-            ]
-            valid_gems.append((gem_id, fragments, gem_length))
-
-    valid_gems.sort(key=lambda x: x[2])
+            valid_gems.append((gem_id, gem_info['fragments'], gem_length))
 
     # test_gem_id_difference(valid_gems, "cr1491_SE_Left.bed")
 
-    return valid_gems
+    # Only the kept GEMs get their fragments as Intervals
+    return (limit or NO_LIMIT).select(valid_gems, key=lambda x: x[2], build=gem_intervals)
 
 
-def process_right(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region):
+def process_right(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region,
+                  region_gems=None, limit=None):
     left_anchor_start = int(left_anchor.split('\t')[1])
     left_anchor_end = int(left_anchor.split('\t')[2])
 
-    right_anchor_bed = BedTool(right_anchor, from_string=True)
-    intersecting_fragments = ChIA_Drop.intersect(right_anchor_bed, wa=True, wb=True)
-    intersecting_gem_ids = set(fragment.fields[4] for fragment in intersecting_fragments)
+    intersecting_gem_ids = gem_ids_in_region(ChIA_Drop, site_region(right_anchor), region_gems)
 
     ChIA_Drop = ChIA_Drop.filter(lambda x: x.fields[4] in intersecting_gem_ids)
 
@@ -107,20 +103,16 @@ def process_right(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor,
 
         num_frgaments = len(gem_info['fragments'])
         if num_frgaments >= num_fragments_min and num_frgaments <= num_fragments_max:
-            fragments = [
-                pybedtools.create_interval_from_list(fragment)
-                for fragment in gem_info['fragments']
-            ]
-            valid_gems.append((gem_id, fragments, gem_length))
-
-    valid_gems.sort(key=lambda x: x[2])
+            valid_gems.append((gem_id, gem_info['fragments'], gem_length))
 
     # test_gem_id_difference(valid_gems, "cr1491_SE_Right.bed")
 
-    return valid_gems
+    # Only the kept GEMs get their fragments as Intervals
+    return (limit or NO_LIMIT).select(valid_gems, key=lambda x: x[2], build=gem_intervals)
 
 
-def process_middle(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region, middle_anchor):
+def process_middle(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor, right_anchor, region, middle_anchor,
+                   region_gems=None, limit=None):
     middle_anchor_chrom, middle_anchor_start, middle_anchor_end = middle_anchor.split('\t')
 
     left_anchor_start = int(left_anchor.split('\t')[1])
@@ -133,16 +125,11 @@ def process_middle(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor,
 
     # Make sure the GEM has at least 1 fragment in left area (area_1)
     # and at least 1 fragment in right area (area_2)
-    area_1 = BedTool(f"{middle_anchor_chrom}\t{left_anchor_end}\t{middle_anchor_start}",
-                     from_string=True)
-    area_2 = BedTool(f"{middle_anchor_chrom}\t{middle_anchor_end}\t{right_anchor_start}",
-                     from_string=True)
-
-    area_1_frags = ChIA_Drop.intersect(area_1, wa=True, wb=True)
-    area_1_gem_ids = set(area_1_frag[4] for area_1_frag in area_1_frags)
+    area_1 = (middle_anchor_chrom, left_anchor_end, int(middle_anchor_start))
+    area_2 = (middle_anchor_chrom, int(middle_anchor_end), right_anchor_start)
 
-    area_2_frags = ChIA_Drop.intersect(area_2, wa=True, wb=True)
-    area_2_gem_ids = set(area_2_frag[4] for area_2_frag in area_2_frags)
+    area_1_gem_ids = gem_ids_in_region(ChIA_Drop, area_1, region_gems)
+    area_2_gem_ids = gem_ids_in_region(ChIA_Drop, area_2, region_gems)
 
     in_area_gem_ids = area_1_gem_ids.intersection(area_2_gem_ids)
 
@@ -204,10 +191,17 @@ def process_middle(ChIA_Drop, num_fragments_min, num_fragments_max, left_anchor,
     else:
         new_valid_gems = valid_gems
 
-    return new_valid_gems
+    return (limit or NO_LIMIT).select(new_valid_gems)
+
 
+def process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms, no_chroms, region_gems=None,
+                     limit=None, count_window=True):
+    """Rank the GEMs touching every yes region and no no region.
 
-def process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms, no_chroms):
+    With count_window, the fragments (and their GEMs) overlapping the span of
+    the regions are counted as scanned; sort_anchor leaves it to the caller,
+    which counts the anchor window once.
+    """
     # reduce search space
     chr_id = yes_chroms[0][0]
     if not len(yes_chroms):
@@ -222,44 +216,29 @@ def process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms
     region = BedTool(f"{chr_id}\t{left_most_end}\t{right_most_end}", from_string=True)
 
     # Process the first chromosome to initialize the valid_gem_ids
-    chr_id, left, right = yes_chroms[0]
-    frags = ChIA_Drop.intersect(
-        BedTool(f"{chr_id}\t{left}\t{right}", from_string=True),
-        wa=True,
-        wb=True,
-    )
-    valid_gem_ids = set(frag[4] for frag in frags)
+    valid_gem_ids = set(gem_ids_in_region(ChIA_Drop, yes_chroms[0][:3], region_gems))
 
     # Intersect with GEM IDs from the remaining chromosomes
     for yes_chrom in yes_chroms[1:]:
-        chr_id, left, right = yes_chrom[:3]
-        frags = ChIA_Drop.intersect(
-            BedTool(f"{chr_id}\t{left}\t{right}", from_string=True),
-            wa=True,
-            wb=True,
-        )
-        candidate_gem_ids = set(frag[4] for frag in frags)
-        valid_gem_ids.intersection_update(candidate_gem_ids)
+        valid_gem_ids.intersection_update(gem_ids_in_region(ChIA_Drop, yes_chrom[:3], region_gems))
 
     # Exclude GEM IDs from the no_chroms regions
     for no_chrom in no_chroms:
-        chr_id, left, right = no_chrom[:3]
-        frags = ChIA_Drop.intersect(
-            BedTool(f"{chr_id}\t{left}\t{right}", from_string=True),
-            wa=True,
-            wb=True,
-        )
-        candidate_gem_ids = set(frag[4] for frag in frags)
-        valid_gem_ids.difference_update(candidate_gem_ids)
+        valid_gem_ids.difference_update(gem_ids_in_region(ChIA_Drop, no_chrom[:3], region_gems))
 
     valid_gems = []
     gem_fragments = {}
     gem_lengths = {}
 
+    scanned_gems = set()
+    num_fragments = 0
     for fragment in ChIA_Drop:
         gem_id = fragment[4]
         start = int(fragment[1])
         end = int(fragment[2])
+        if count_window and fragment[0] == chr_id and start < right_most_end and end > left_most_end:
+            num_fragments += 1
+            scanned_gems.add(gem_id)
         if gem_id in valid_gem_ids and start >= left_most_end and end <= right_most_end:
             if gem_id not in gem_fragments:
                 gem_fragments[gem_id] = []
@@ -270,14 +249,116 @@ def process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms
                                        max(gem_lengths[gem_id][1], end))
             else:
                 gem_lengths[gem_id] = (start, end)
+    if count_window:
+        report.count("fragments_scanned", num_fragments)
+        report.count("gems_scanned", len(scanned_gems))
 
     # Further filter valid GEMs based on the leftmost fragment and right anchor
     for gem_id, fragments in gem_fragments.items():
         # leftmost_fragment_start = int(fragments[0][1])
         # leftmost_fragment_end = int(fragments[0][2])
         start, end = gem_lengths[gem_id]
-        fragments.sort(key=lambda x: x[1])
+        fragments.sort(key=lambda x: int(x[1]))
         if len(fragments) >= num_fragments_min and len(fragments) <= num_fragments_max:
             valid_gems.append((gem_id, fragments, end - start))
 
-    return valid_gems
+    return (limit or NO_LIMIT).select(valid_gems)
+
+
+def sort_anchor(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, B, C, schemes, region_gems=None,
+                limit=None):
+    """Run the requested sort schemes of one anchor triple.
+
+    Returns a dict mapping each scheme in `schemes` (AtoB, AtoC, BtoA, BtoC, CtoA,
+    CtoB, AandC, Bcentered or AandBandC) to its ranked GEMs. region_gems is an
+    optional cache of the GEMs touching each site, shared across anchor triples,
+    and limit an optional ComplexLimit of the complexes kept per scheme.
+    """
+    chrom, a_start, a_end = A.split('\t')
+    b_chrom, b_start, b_end = B.split('\t')
+    c_chrom, c_start, c_end = C.split('\t')
+    filter_region = f"{chrom}\t{a_start}\t{c_end}"
+
+    # The GEMs touching a site only depend on the site while it lies inside the
+    # anchor window, which holds when the triple is on a single chromosome
+    if b_chrom != chrom or c_chrom != chrom:
+        region_gems = None
+
+    if any(scheme in schemes for scheme in ("AtoB", "BtoA")):
+        region_bed = BedTool(f"{chrom}\t{a_start}\t{b_end}", from_string=True)
+        with report.stage("intersect"):
+            ChIA_Drop_ab = ChIA_Drop_anchor.intersect(region_bed, wa=True, wb=True)
+        report.count("intersect_calls")
+    if any(scheme in schemes for scheme in ("BtoC", "CtoB")):
+        region_bed = BedTool(f"{chrom}\t{b_start}\t{c_end}", from_string=True)
+        with report.stage("intersect"):
+            ChIA_Drop_bc = ChIA_Drop_anchor.intersect(region_bed, wa=True, wb=True)
+        report.count("intersect_calls")
+
+    ranked = {}
+    for scheme in schemes:
+        if scheme == "AtoB":
+            ranked[scheme] = process_left(ChIA_Drop_ab, num_fragments_min, num_fragments_max, A, B, filter_region,
+                                           region_gems, limit)
+        elif scheme == "AtoC":
+            ranked[scheme] = process_left(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region,
+                                           region_gems, limit)
+        elif scheme == "BtoA":
+            ranked[scheme] = process_right(ChIA_Drop_ab, num_fragments_min, num_fragments_max, A, B, filter_region,
+                                            region_gems, limit)
+        elif scheme == "BtoC":
+            ranked[scheme] = process_left(ChIA_Drop_bc, num_fragments_min, num_fragments_max, B, C, filter_region,
+                                           region_gems, limit)
+        elif scheme == "CtoA":
+            ranked[scheme] = process_right(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region,
+                                            region_gems, limit)
+        elif scheme == "CtoB":
+            ranked[scheme] = process_right(ChIA_Drop_bc, num_fragments_min, num_fragments_max, B, C, filter_region,
+                                            region_gems, limit)
+        elif scheme == "Bcentered":
+            ranked[scheme] = process_middle(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region, B,
+                                             region_gems, limit)
+        else:  # scheme == "AandC" or scheme == "AandBandC"
+            sites = [A, C] if scheme == "AandC" else [A, B, C]
+            region = ";".join(f"{site[0]}:{site[1]}-{site[2]}" for site in (entry.split('\t') for entry in sites))
+            yes_chroms, no_chroms = process_multiple_regions(region, ";".join(["yes"] * len(sites)))
+            ranked[scheme] = process_multiple(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, yes_chroms, no_chroms,
+                                               region_gems, limit, count_window=False)
+
+    return ranked
+
+
+def gem_intervals(gem):
+    """A ranked (gem_id, fragments, gem_length) tuple with its fragment fields as Intervals."""
+    gem_id, fragments, gem_length = gem
+    return gem_id, [pybedtools.create_interval_from_list(fragment) for fragment in fragments], gem_length
+
+
+def gem_ids_in_region(ChIA_Drop, region, region_gems=None):
+    """IDs of the GEMs with a fragment in region, a (chr_id, left, right) tuple.
+
+    region_gems, if given, caches the result across calls (a dict or a GemSetCache).
+    """
+    if region_gems is not None:
+        gem_ids = region_gems.get(region)
+        if gem_ids is not None:
+            return gem_ids
+
+    chr_id, left, right = region
+    with report.stage("intersect"):
+        frags = ChIA_Drop.intersect(
+            BedTool(f"{chr_id}\t{left}\t{right}", from_string=True),
+            wa=True,
+            wb=True,
+        )
+        gem_ids = frozenset(frag[4] for frag in frags)
+    report.count("intersect_calls")
+    if region_gems is not None:
+        region_gems[region] = gem_ids
+    return gem_ids
+
+
+def site_region(site):
+    """The (chr_id, left, right) tuple of a tab separated site."""
+    chr_id, left, right = site.split('\t')[:3]
+    return chr_id, int(left), int(right)
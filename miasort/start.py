@@ -1,25 +1,95 @@
-import pybedtools
-from pybedtools import BedTool
+import gc
 import os
 import shutil
-import csv
+import sys
 
-from .plot import plot_ranked_gems
 from .histogram import generate_file
-from .sort import *
-from .records import write_to_csv_file, write_to_csv_file_multiple
+from . import index_sort
+from .index import FragmentView, group_by_anchor, group_anchor_spans, order_anchor_spans, read_anchor_spans
+from .store import load_index, source_signature
+from .cache import GemSetCache, DEFAULT_CACHE_BUDGET
+from .checkpoint import RunManifest
+from .report import RunReport, activate, stage, timed
+from .memory import MemoryBudget
+from .export import ComplexSink
+from .ranking import ComplexLimit, num_complexes
+from .stream import stream_anchors
+from .parallel import map_anchors, sorter_for, PlotQueue
+from .records import STDOUT, RecordsWriter, write_to_csv_file, write_to_csv_file_multiple, write_to_csv_file_batch
 from .helper import process_multiple_regions, process_graphs_arg, \
     create_plot_filename, process_color_arg, \
-    create_csv_filename, generate_filter_regions
+    create_csv_filename, create_complexes_filename, generate_filter_regions, read_queries, \
+    DEFAULT_DENSITY_THRESHOLD
+
+# pybedtools temp files of the open Dataset sessions
+_session_tempfiles = set()
+
+# Figures of the abc mode, each with its sort schemes as
+# (graphs flag, scheme in the records, left site, right site, middle site)
+ABC_PLOTS = [
+    ("stripes", [("AtoC", "AtoC", "A", "C", "B"),
+                 ("CtoA", "CtoA", "A", "C", "B"),
+                 ("AandC", "AandC", "A", "C", "B")]),
+    ("jets", [("Bcentered", "BtoAC", "A", "C", "B"),
+              ("BtoA", "BtoA", "A", "B", "C"),
+              ("BtoC", "BtoC", "B", "C", "A")]),
+    ("Bstripes", [("AtoB", "AtoB", "A", "B", "C"),
+                  ("CtoB", "CtoB", "B", "C", "A")]),
+]
 
 def start(path1, path2, processing_type, graphs,
          num_fragments_min, num_fragments_max, region, operation,
          dataset, out_dir, colors, anchor_options,
          graph_flag, extension, histogram_options, frag_height,
-         line_width, plot_width, subplots_margins):
-    pybedtools.helpers.cleanup()
+         line_width, plot_width, subplots_margins, engine="bedtools", workers=1, render_workers=0,
+         streaming=False, session=None, cache_budget=DEFAULT_CACHE_BUDGET, resume=False, report=False,
+         profile_anchor=None, trace_memory=False, memory_budget=None, export_complexes=False, stdout=False,
+         max_complexes=None, sample=None, density_threshold=DEFAULT_DENSITY_THRESHOLD):
+    if session is None:
+        cleanup_temp_files()
 
-    ChIA_Drop = BedTool(path1)
+    if resume and (out_dir == "/" or processing_type not in ("abc", "AandBandC")):
+        raise ValueError("Resuming needs an out_dir and is only available in abc and AandBandC modes")
+
+    if resume and export_complexes:
+        raise ValueError("Exported complexes are written at the end of a run and cannot be resumed")
+
+    if resume and stdout:
+        raise ValueError("Comp records written to standard output cannot be resumed")
+
+    if path1 == "-" and engine == "bedtools":
+        raise ValueError("Reading complexes from standard input needs the `numpy` engine")
+
+    if streaming and (engine != "numpy" or processing_type not in ("abc", "AandBandC")):
+        raise ValueError("Streaming is only available with the `numpy` engine in abc and AandBandC modes")
+
+    # Complexes kept per sort scheme; the comp records still count all of them
+    limit = ComplexLimit(max_complexes, sample) if max_complexes is not None or sample is not None else None
+
+    # Stage timings and counters of this run, written to run_report.json in out_dir
+    if report or profile_anchor is not None or trace_memory:
+        run_report = RunReport(out_dir, profile_anchor, trace_memory)
+    else:
+        run_report = None
+    activate(run_report)
+    budget = MemoryBudget(memory_budget) if memory_budget is not None else None
+
+    if streaming:
+        # Each chromosome is indexed on its own by stream_anchors
+        index = ChIA_Drop = None
+        sorter = index_sort
+    elif engine == "numpy":
+        with stage("load"):
+            index = session.index if session is not None else load_index(path1)
+        ChIA_Drop = index.view()
+        sorter = index_sort
+    elif engine == "bedtools":
+        from pybedtools import BedTool
+        index = None
+        ChIA_Drop = session.complexes if session is not None else BedTool(path1)
+        sorter = sorter_for(engine)
+    else:
+        raise ValueError(f"Unknown engine `{engine}`, expected `bedtools` or `numpy`")
 
     colors_flags = process_color_arg(colors)
 
@@ -29,254 +99,459 @@ def start(path1, path2, processing_type, graphs,
     else:
         frag_description = f"frag{extension}bp"
 
-    # delete the out_dir folder if it exists
-    if out_dir != "/" and os.path.exists(out_dir):
+    # delete the out_dir folder if it exists, unless resuming the run recorded in it
+    resuming = resume and RunManifest.exists(out_dir)
+    if out_dir != "/" and os.path.exists(out_dir) and not resuming:
         shutil.rmtree(out_dir)
 
-    os.makedirs(out_dir)
+    os.makedirs(out_dir, exist_ok=resuming)
+
+    plots = PlotQueue(render_workers)
+    # The comp records file, opened once by the mode below
+    records = None
+    # Every ranked complex of the run, written to one NPZ file at the end
+    sink = None
+    if export_complexes:
+        complexes_file = create_complexes_filename(dataset, path2 or "multiple", frag_description)
+        sink = ComplexSink(os.path.join(out_dir, complexes_file) if out_dir != "/" else complexes_file)
+    # GEMs touching each site or region, shared across anchor triples and queries
+    if session is not None:
+        region_gems = session.region_gems
+    elif budget is not None:
+        # Leave most of the memory budget to the anchor batches and plots
+        region_gems = GemSetCache(min(cache_budget, memory_budget // 8))
+    else:
+        region_gems = GemSetCache(cache_budget)
 
     if processing_type == "abc":
-        filter_regions_filename = os.path.join(out_dir, "filter_regions.bed")
-        generate_filter_regions(path2, filter_regions_filename)
-        filter_regions = BedTool(filter_regions_filename)
-
-        intersected = ChIA_Drop.intersect(filter_regions, wa=True, wb=True)
-
-        # Dictionary to store the intersected regions for each line of b
-        filtered_intersections = {}
-
-        for intersection in intersected:
-            b_fields = intersection.fields[5:]  # 5 fields in a
-            b_fields = ' '.join(b_fields)  # Make the key hashable
-            # Check if the key exists, if not, add an empty list
-            if b_fields not in filtered_intersections:
-                filtered_intersections[b_fields] = []
-            # Append the intersection to the list
-            filtered_intersections[b_fields].append(intersection)
-        # Convert lists to BedTool objects
-        for i in filtered_intersections:
-            filtered_intersections[i] = BedTool(filtered_intersections[i])
+        if streaming:
+            # Reading a chromosome block and grouping its anchors happen on each step
+            chunks = timed(stream_anchors(path1, path2), "group")
+        elif budget is not None:
+            chunks = budget_chunks(ChIA_Drop, index, path2, os.path.join(out_dir, "filter_regions.bed"), budget)
+        else:
+            with stage("group"):
+                chunks = [(index, group_anchors(ChIA_Drop, path2, os.path.join(out_dir, "filter_regions.bed"),
+                                                session))]
 
         graphs_flags = process_graphs_arg(graphs)
-
-        csv_file = create_csv_filename(dataset, path2, frag_description)
-        if out_dir != "/":
-            path = os.path.join(out_dir, csv_file)
-        else:
-            path = csv_file
+        schemes = [scheme for plot_name, plot_schemes in ABC_PLOTS
+                   for scheme, _, _, _, _ in plot_schemes if graphs_flags[scheme]]
+
+        csv_file = STDOUT if stdout else create_csv_filename(dataset, path2, frag_description)
+        manifest = open_manifest(out_dir, run_parameters(path1, processing_type, schemes, num_fragments_min,
+                                                         num_fragments_max, extension, graph_flag,
+                                                         histogram_options, max_complexes, sample), csv_file, resume)
+        if manifest is not None:
+            csv_file = manifest.csv_file
+        records = RecordsWriter(csv_file, out_dir)
         # Write the header of the comp records file
-        with open(path, 'a', newline='') as file:
-            writer = csv.writer(file)
+        if manifest is None or not manifest.resumed:
             field = ["Region ID", "Site A", "Site B", "Site C", "Region", "Sort Scheme",
                      "num_complexes", "num_1frag", "num_2frag", "num_3frag",
                      "num_4frag", "num>=5frag"]
-            writer.writerow(field)
-
-        for key, ChIA_Drop_anchor in filtered_intersections.items():
-            anchors = key.split(" ")[3:]
-            id = anchors[9]
-
-            # Error check
-            if int(anchors[1]) >= int(anchors[2]) or int(anchors[4]) >= int(anchors[5]) or int(anchors[7]) >= int(anchors[8]) \
-            or int(anchors[2]) >= int(anchors[4]) or int(anchors[5]) >= int(anchors[7]):
-                print(f"Error for {id}: left is larger than right, please check the input file")
-                continue
-
-            A = f"{anchors[0]}\t{anchors[1]}\t{anchors[2]}"
-            B = f"{anchors[3]}\t{anchors[4]}\t{anchors[5]}"
-            C = f"{anchors[6]}\t{anchors[7]}\t{anchors[8]}"
-            filter_region = f"{anchors[0]}\t{anchors[1]}\t{anchors[8]}"
-
-            filter = f"{anchors[0]}\t{anchors[1]}\t{anchors[5]}"
-            region_bed = BedTool(filter, from_string=True)
-            ChIA_Drop_ab = ChIA_Drop_anchor.intersect(region_bed, wa=True, wb=True)
-
-            filter = f"{anchors[0]}\t{anchors[4]}\t{anchors[8]}"
-            region_bed = BedTool(filter, from_string=True)
-            ChIA_Drop_bc = ChIA_Drop_anchor.intersect(region_bed, wa=True, wb=True)
-
-            # ---------------- First plot ----------------
-
-            ranked_gems_list = []
-            left_anchor_list = []
-            right_anchor_list = []
-            middle_anchor_list = []
-            commands_list = ["AtoC", "CtoA", "AandC"]
-
-            if graphs_flags["AtoC"] or graphs_flags["CtoA"] or graphs_flags["AandC"]:
-                if graphs_flags["AtoC"]:
-                    ranked_gems = process_left(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region)
-                    output_file = create_plot_filename(dataset, id, "AtoC", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(A)
-                    right_anchor_list.append(C)
-                    middle_anchor_list.append(B)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "AtoC", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graphs_flags["CtoA"]:
-                    ranked_gems = process_right(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region)
-                    output_file = create_plot_filename(dataset, id, "CtoA", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(A)
-                    right_anchor_list.append(C)
-                    middle_anchor_list.append(B)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "CtoA", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graphs_flags["AandC"]:
-                    region = f"{anchors[0]}:{anchors[1]}-{anchors[2]};{anchors[6]}:{anchors[7]}-{anchors[8]}"
-                    yes_chroms, no_chroms = process_multiple_regions(region, "yes;yes")
-                    ranked_gems = process_multiple(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, yes_chroms, no_chroms)
-                    output_file = create_plot_filename(dataset, id, "AandC", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(A)
-                    right_anchor_list.append(C)
-                    middle_anchor_list.append(B)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "AandC", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graph_flag == "yes":
-                    output_file = create_plot_filename(dataset, id, "stripes", num_fragments_min, num_fragments_max,
-                                                    len(ranked_gems), frag_description)
-                    plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
-                                                right_anchor_list, middle_anchor_list, out_dir,
-                                                colors_flags, anchor_options, id, dataset, commands_list, extension,
-                                                frag_height, line_width, plot_width, subplots_margins, frag_description)
-
-            # ---------------- Second plot ----------------
-
-            ranked_gems_list = []
-            left_anchor_list = []
-            right_anchor_list = []
-            middle_anchor_list = []
-            commands_list = ["BtoAC", "BtoA", "BtoC"]
-
-            if graphs_flags["Bcentered"] or graphs_flags["BtoA"] or graphs_flags["BtoC"]:
-                if graphs_flags["Bcentered"]:  # B centered to A & C
-                    ranked_gems = process_middle(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, C, filter_region, B)
-                    output_file = create_plot_filename(dataset, id, "Bcentered", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(A)
-                    right_anchor_list.append(C)
-                    middle_anchor_list.append(B)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "BtoAC", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graphs_flags["BtoA"]:
-                    ranked_gems = process_right(ChIA_Drop_ab, num_fragments_min, num_fragments_max, A, B, filter_region)
-                    output_file = create_plot_filename(dataset, id, "BtoA", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(A)
-                    right_anchor_list.append(B)
-                    middle_anchor_list.append(C)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "BtoA", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graphs_flags["BtoC"]:
-                    ranked_gems = process_left(ChIA_Drop_bc, num_fragments_min, num_fragments_max, B, C, filter_region)
-                    output_file = create_plot_filename(dataset, id, "BtoC", num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
-                    ranked_gems_list.append(ranked_gems)
-                    left_anchor_list.append(B)
-                    right_anchor_list.append(C)
-                    middle_anchor_list.append(A)
-                    if histogram_options == "yes":
-                        generate_file(ranked_gems, output_file, out_dir)
-                    write_to_csv_file(id, A, B, C, "BtoC", len(ranked_gems), csv_file, out_dir, ranked_gems)
-
-                if graph_flag == "yes":
-                    output_file = create_plot_filename(dataset, id, "jets", num_fragments_min, num_fragments_max,
-                                                    len(ranked_gems), frag_description)
-                    plot_ranked_gems(ranked_gems_list, output_file, left_anchor_list,
-                                                right_anchor_list, middle_anchor_list, out_dir,
-                                                colors_flags, anchor_options, id, dataset, commands_list, extension,
-                                                frag_height, line_width, plot_width, subplots_margins, frag_description)
-        os.remove(filter_regions_filename)
+            records.writerow(field)
+
+        for index, filtered_intersections in chunks:
+            jobs = []
+            for key, ChIA_Drop_anchor in filtered_intersections.items():
+                if manifest is not None and manifest.done(key):
+                    continue
+                anchors = key.split(" ")[3:]
+                id = anchors[9]
+
+                # Error check
+                if int(anchors[1]) >= int(anchors[2]) or int(anchors[4]) >= int(anchors[5]) or int(anchors[7]) >= int(anchors[8]) \
+                or int(anchors[2]) >= int(anchors[4]) or int(anchors[5]) >= int(anchors[7]):
+                    print(f"Error for {id}: left is larger than right, please check the input file", file=sys.stderr)
+                    continue
+
+                A = f"{anchors[0]}\t{anchors[1]}\t{anchors[2]}"
+                B = f"{anchors[3]}\t{anchors[4]}\t{anchors[5]}"
+                C = f"{anchors[6]}\t{anchors[7]}\t{anchors[8]}"
+                jobs.append(((key, id), (ChIA_Drop_anchor, num_fragments_min, num_fragments_max, A, B, C, schemes)))
+
+            if run_report is not None:
+                run_report.expect([id for (key, id), job in jobs])
+            results = map_anchors(engine, index, [job for _, job in jobs], workers, region_gems, limit)
+            for ((key, id), job), ranked in zip(jobs, results):
+                A, B, C = job[3:6]
+                sites = {"A": A, "B": B, "C": C}
+                rendered = []
+
+                for plot_name, plot_schemes in ABC_PLOTS:
+                    ranked_gems_list = []
+                    left_anchor_list = []
+                    right_anchor_list = []
+                    middle_anchor_list = []
+                    commands_list = []
+
+                    for scheme, command, left, right, middle in plot_schemes:
+                        if not graphs_flags[scheme]:
+                            continue
+                        ranked_gems = ranked[scheme]
+                        output_file = create_plot_filename(dataset, id, scheme, num_fragments_min, num_fragments_max, len(ranked_gems), frag_description)
+                        ranked_gems_list.append(ranked_gems)
+                        left_anchor_list.append(sites[left])
+                        right_anchor_list.append(sites[right])
+                        middle_anchor_list.append(sites[middle])
+                        commands_list.append(command)
+                        if histogram_options == "yes":
+                            generate_file(ranked_gems, output_file, out_dir)
+                        write_to_csv_file(id, A, B, C, command, num_complexes(ranked_gems), records, ranked_gems)
+                        if sink is not None:
+                            sink.add(id, command, ranked_gems)
+
+                    if ranked_gems_list and graph_flag == "yes":
+                        output_file = create_plot_filename(dataset, id, plot_name, num_fragments_min, num_fragments_max,
+                                                        len(ranked_gems), frag_description)
+                        rendered.append(plots.submit(ranked_gems_list, output_file, left_anchor_list,
+                                                    right_anchor_list, middle_anchor_list, out_dir,
+                                                    colors_flags, anchor_options, id, dataset, commands_list, extension,
+                                                    frag_height, line_width, plot_width, subplots_margins, frag_description,
+                                                    density_threshold=density_threshold))
+
+                # The rows of the triple are on disk before the manifest records its CSV size
+                records.flush()
+                if manifest is not None:
+                    manifest.commit(key, schemes, rendered)
+                if run_report is not None:
+                    count_window(run_report, filtered_intersections, key)
+                    run_report.anchor(id, complexes={scheme: num_complexes(gems) for scheme, gems in ranked.items()})
+                if budget is not None:
+                    budget.relieve(plots)
 
     elif processing_type == "AandBandC":
-        filter_regions_filename = "filter_regions.bed"
-        generate_filter_regions(path2, filter_regions_filename)
-        filter_regions = BedTool(filter_regions_filename)
-
-        intersected = ChIA_Drop.intersect(filter_regions, wa=True, wb=True)
-
-        # Dictionary to store the intersected regions for each line of b
-        filtered_intersections = {}
-
-        for intersection in intersected:
-            b_fields = intersection.fields[5:]  # 5 fields in a
-            b_fields = ' '.join(b_fields)  # Make the key hashable
-            # Check if the key exists, if not, add an empty list
-            if b_fields not in filtered_intersections:
-                filtered_intersections[b_fields] = []
-            # Append the intersection to the list
-            filtered_intersections[b_fields].append(intersection)
-        # Convert lists to BedTool objects
-        for i in filtered_intersections:
-            filtered_intersections[i] = BedTool(filtered_intersections[i])
+        if streaming:
+            # Reading a chromosome block and grouping its anchors happen on each step
+            chunks = timed(stream_anchors(path1, path2), "group")
+        elif budget is not None:
+            chunks = budget_chunks(ChIA_Drop, index, path2, "filter_regions.bed", budget)
+        else:
+            with stage("group"):
+                chunks = [(index, group_anchors(ChIA_Drop, path2, "filter_regions.bed", session))]
 
         if out_dir != "/" and not os.path.exists(out_dir):
             os.makedirs(out_dir)
 
-        csv_file = create_csv_filename(dataset, path2, frag_description)
-        path = os.path.join(out_dir, csv_file)
+        csv_file = STDOUT if stdout else create_csv_filename(dataset, path2, frag_description)
+        manifest = open_manifest(out_dir, run_parameters(path1, processing_type, ["AandBandC"], num_fragments_min,
+                                                         num_fragments_max, extension, graph_flag,
+                                                         histogram_options, max_complexes, sample), csv_file, resume)
+        if manifest is not None:
+            csv_file = manifest.csv_file
+        records = RecordsWriter(csv_file, out_dir)
         # Write the header of the comp records file
-        with open(path, 'a', newline='') as file:
-            writer = csv.writer(file)
+        if manifest is None or not manifest.resumed:
             field = ["Region ID", "Site A", "Site B", "Site C", "Region", "Sort Scheme",
                      "num_complexes", "num_1frag", "num_2frag", "num_3frag",
                      "num_4frag", "num>=5frag"]
-            writer.writerow(field)
-
-        for key, ChIA_Drop_anchor in filtered_intersections.items():
-            region = key.split(" ")[3:]
-            id = region[9]
-
-            # Error check
-            if region[1] >= region[2] or region[4] >= region[5] or region[7] >= region[8] \
-            or region[2] >= region[4] or region[5] >= region[7]:
-                print(f"Error for {id}: left is larger than right, please check the input file")
-                continue
-
-            A = f"{region[0]}:{region[1]}-{region[2]}"
-            B = f"{region[3]}:{region[4]}-{region[5]}"
-            C = f"{region[6]}:{region[7]}-{region[8]}"
-            r = f"{region[0]}:{region[1]}-{region[8]}"
-            region = f"{A};{B};{C}"
-
-            if operation != "yes;yes;yes":
-                print("The operation is automatically set as `yes;yes;yes`")
-            operation = "yes;yes;yes"
-
-            yes_chroms, no_chroms = process_multiple_regions(region, operation)
-            ranked_gems = process_multiple(ChIA_Drop_anchor, num_fragments_min, num_fragments_max, yes_chroms, no_chroms)
+            records.writerow(field)
+
+        for index, filtered_intersections in chunks:
+            jobs = []
+            for key, ChIA_Drop_anchor in filtered_intersections.items():
+                if manifest is not None and manifest.done(key):
+                    continue
+                region = key.split(" ")[3:]
+                id = region[9]
+
+                # Error check
+                if region[1] >= region[2] or region[4] >= region[5] or region[7] >= region[8] \
+                or region[2] >= region[4] or region[5] >= region[7]:
+                    print(f"Error for {id}: left is larger than right, please check the input file", file=sys.stderr)
+                    continue
+
+                A = f"{region[0]}:{region[1]}-{region[2]}"
+                B = f"{region[3]}:{region[4]}-{region[5]}"
+                C = f"{region[6]}:{region[7]}-{region[8]}"
+                r = f"{region[0]}:{region[1]}-{region[8]}"
+                region = f"{A};{B};{C}"
+
+                if operation != "yes;yes;yes":
+                    print("The operation is automatically set as `yes;yes;yes`", file=sys.stderr)
+                operation = "yes;yes;yes"
+
+                yes_chroms, no_chroms = process_multiple_regions(region, operation)
+                sites = [f"{chrom}\t{left}\t{right}" for chrom, left, right in yes_chroms]
+                jobs.append(((key, id, A, B, C, r, yes_chroms, no_chroms),
+                             (ChIA_Drop_anchor, num_fragments_min, num_fragments_max, *sites, ["AandBandC"])))
+
+            if run_report is not None:
+                run_report.expect([record[1] for record, job in jobs])
+            results = map_anchors(engine, index, [job for _, job in jobs], workers, region_gems, limit)
+            for (record, job), ranked in zip(jobs, results):
+                key, id, A, B, C, r, yes_chroms, no_chroms = record
+                ranked_gems = ranked["AandBandC"]
+                rendered = []
+                if graph_flag == "yes":
+                    output_file = create_plot_filename(dataset, id, "AandBandC", num_fragments_min,
+                                                    num_fragments_max, len(ranked_gems), frag_description)
+                    rendered.append(plots.submit([ranked_gems], output_file, [""], [""], [""], out_dir,
+                                                colors_flags, anchor_options, id, dataset, ["multiple"],
+                                                extension, frag_height, line_width, plot_width, subplots_margins, frag_description,
+                                                flag="multiple_abc", regions=yes_chroms+no_chroms,
+                                                density_threshold=density_threshold))
+                if histogram_options == "yes":
+                    generate_file(ranked_gems, "output_file", out_dir)  # TODO: revise file name
+                write_to_csv_file_multiple(id, A, B, C, r, "AandBandC", num_complexes(ranked_gems), records,
+                                           ranked_gems)
+                if sink is not None:
+                    sink.add(id, "AandBandC", ranked_gems)
+                records.flush()
+                if manifest is not None:
+                    manifest.commit(key, ["AandBandC"], rendered)
+                if run_report is not None:
+                    count_window(run_report, filtered_intersections, key)
+                    run_report.anchor(id, complexes={"AandBandC": num_complexes(ranked_gems)})
+                if budget is not None:
+                    budget.relieve(plots)
+
+    elif processing_type == "batch":
+        csv_file = STDOUT if stdout else create_csv_filename(dataset, path2, frag_description)
+        records = RecordsWriter(csv_file, out_dir)
+        # Write the header of the comp records file
+        field = ["Query ID", "Regions", "Operations",
+                 "num_complexes", "num_1frag", "num_2frag", "num_3frag",
+                 "num_4frag", "num>=5frag"]
+        records.writerow(field)
+
+        for regions, operations, id in read_queries(path2):
+            if run_report is not None:
+                run_report.expect([id])
+            yes_chroms, no_chroms = process_multiple_regions(regions, operations)
+            with stage("sort"):
+                ranked_gems = sorter.process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max,
+                                                      yes_chroms, no_chroms, region_gems, limit)
+            output_file = create_plot_filename(dataset, id, "multiple", num_fragments_min,
+                                               num_fragments_max, len(ranked_gems), frag_description)
             if graph_flag == "yes":
-                output_file = create_plot_filename(dataset, id, "AandBandC", num_fragments_min,
-                                                num_fragments_max, len(ranked_gems), frag_description)
-                plot_ranked_gems([ranked_gems], output_file, [""], [""], [""], out_dir,
-                                            colors_flags, anchor_options, id, dataset, ["multiple"],
-                                            extension, frag_height, line_width, plot_width, subplots_margins, frag_description,
-                                            flag="multiple_abc", regions=yes_chroms+no_chroms)
+                plots.submit([ranked_gems], output_file, [""], [""], [""], out_dir,
+                             colors_flags, anchor_options, id, dataset, ["multiple"],
+                             extension, frag_height, line_width, plot_width, subplots_margins, frag_description,
+                             flag="multiple_abc", regions=yes_chroms+no_chroms,
+                             density_threshold=density_threshold)
             if histogram_options == "yes":
-                generate_file(ranked_gems, "output_file", out_dir)  # TODO: revise file name
-            write_to_csv_file_multiple(id, A, B, C, r, "AandBandC", len(ranked_gems), csv_file, out_dir, ranked_gems)
+                generate_file(ranked_gems, output_file, out_dir)
+            write_to_csv_file_batch(id, regions, operations, num_complexes(ranked_gems), records, ranked_gems)
+            if sink is not None:
+                sink.add(id, "multiple", ranked_gems)
+            if run_report is not None:
+                run_report.anchor(id, complexes={"multiple": num_complexes(ranked_gems)})
+            if budget is not None:
+                budget.relieve(plots)
 
     else:
         if out_dir != "/" and not os.path.exists(out_dir):
             os.makedirs(out_dir)
         yes_chroms, no_chroms = process_multiple_regions(region, operation)
-        ranked_gems = process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max, yes_chroms, no_chroms)
+        with stage("sort"):
+            ranked_gems = sorter.process_multiple(ChIA_Drop, num_fragments_min, num_fragments_max,
+                                                  yes_chroms, no_chroms, region_gems, limit)
         output_file = create_plot_filename(dataset, None, "multiple", num_fragments_min,
                                            num_fragments_max, len(ranked_gems), frag_description)
         if graph_flag == "yes":
-            plot_ranked_gems([ranked_gems], output_file, [""], [""], [""], out_dir,
+            plots.submit([ranked_gems], output_file, [""], [""], [""], out_dir,
                                         colors_flags, anchor_options, 0, dataset, ["multiple"],
                                         extension, frag_height, line_width, plot_width, subplots_margins, frag_description,
-                                        flag="multiple", regions=yes_chroms+no_chroms)
+                                        flag="multiple", regions=yes_chroms+no_chroms,
+                                        density_threshold=density_threshold)
         if histogram_options == "yes":
             generate_file(ranked_gems, "output_file", out_dir)  # TODO: revise file name
+        if sink is not None:
+            sink.add(region, "multiple", ranked_gems)
+        if stdout:
+            # This mode keeps no records file; on standard output its one query is a batch record
+            records = RecordsWriter(STDOUT, out_dir)
+            records.writerow(["Query ID", "Regions", "Operations",
+                              "num_complexes", "num_1frag", "num_2frag", "num_3frag",
+                              "num_4frag", "num>=5frag"])
+            write_to_csv_file_batch(0, region, operation, num_complexes(ranked_gems), records, ranked_gems)
+
+    plots.close()
+    if records is not None:
+        records.close()
+    if sink is not None:
+        with stage("export"):
+            sink.close()
+    if processing_type in ("abc", "AandBandC") and manifest is not None:
+        manifest.close()
+
+    if run_report is not None:
+        run_report.write(mode=processing_type, engine=engine, path1=path1, path2=path2,
+                         num_frag_min=num_fragments_min, num_frag_max=num_fragments_max,
+                         workers=workers, render_workers=render_workers, streaming=streaming,
+                         cache=region_gems.stats(), memory=budget.stats() if budget is not None else None)
+        activate(None)
+
+
+def cleanup_temp_files(paths=None):
+    """Delete the pybedtools temp files in paths, by default those of earlier runs in this process.
+
+    By default the temp files of open datasets, which their cached groupings
+    still read, are kept.
+    """
+    # pybedtools is only imported by the bedtools engine; without it there is nothing to delete
+    pybedtools = sys.modules.get("pybedtools")
+    if pybedtools is None or pybedtools.settings.KEEP_TEMPFILES:
+        return
+    if paths is None:
+        paths = [path for path in pybedtools.filenames.TEMPFILES if path not in _session_tempfiles]
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def temp_files_since(count):
+    """The pybedtools temp files created after the first count of this process."""
+    filenames = sys.modules.get("pybedtools.filenames")
+    return filenames.TEMPFILES[count:] if filenames is not None else []
+
+
+def open_manifest(out_dir, parameters, csv_file, resume):
+    """The run manifest of out_dir, or None unless the run is resumable.
+
+    Only runs with resume keep a manifest, so other runs write no extra file
+    and sync nothing per anchor triple.
+    """
+    if not resume or out_dir == "/" or csv_file == STDOUT:
+        return None
+    return RunManifest(out_dir, parameters, csv_file, resume)
+
+
+def run_parameters(path1, processing_type, schemes, num_fragments_min, num_fragments_max,
+                   extension, graph_flag, histogram_options, max_complexes=None, sample=None):
+    """Parameters a resumed run must share with the run it continues."""
+    return {"mode": processing_type, "path1": os.path.abspath(path1), "schemes": schemes,
+            "num_frag_min": num_fragments_min, "num_frag_max": num_fragments_max,
+            "extension": extension, "plot": graph_flag, "histogram": histogram_options,
+            "max_complexes": max_complexes, "sample": sample}
+
+
+def group_anchors(ChIA_Drop, path2, filter_regions_filename, session=None):
+    """Group the fragments of ChIA_Drop by the anchor triples of path2.
+
+    The grouping of a session is kept until path2 changes.
+    """
+    if session is not None:
+        key = (os.path.abspath(path2), tuple(source_signature(path2).values()))
+        if key not in session.anchor_groups:
+            session.anchor_groups[key] = group_anchors(ChIA_Drop, path2, filter_regions_filename)
+        return session.anchor_groups[key]
+
+    if isinstance(ChIA_Drop, FragmentView):
+        return group_by_anchor(ChIA_Drop.index, path2)
+
+    generate_filter_regions(path2, filter_regions_filename)
+    filtered_intersections = intersect_filter_regions(ChIA_Drop, filter_regions_filename)
+    os.remove(filter_regions_filename)
+    return filtered_intersections
+
+
+def budget_chunks(ChIA_Drop, index, path2, filter_regions_filename, budget):
+    """Group the anchor triples of path2 a batch at a time, as sized by a MemoryBudget.
+
+    Only the fragments of one batch are held at a time. The anchor triples are
+    batched in the order of a single grouping, so the rows come out as without
+    a budget. The bedtools engine intersects path1 with every anchor triple
+    once and reads the fragments of each batch from the result. When memory
+    runs short, its fragment sets are spilled to temp files.
+    """
+    with stage("group"):
+        if index is not None:
+            spans = order_anchor_spans(index, read_anchor_spans(path2))
+            keys = [span[0] for span in spans]
+        else:
+            generate_filter_regions(path2, filter_regions_filename)
+            intersected = intersect_anchors(ChIA_Drop, filter_regions_filename)
+            os.remove(filter_regions_filename)
+            keys = list(dict.fromkeys(' '.join(intersection.fields[5:]) for intersection in intersected))
+
+    position = 0
+    while position < len(keys):
+        with stage("group"):
+            if index is not None:
+                filtered_intersections = group_anchor_spans(index, spans[position:position + budget.batch_size])
+            else:
+                filtered_intersections = group_intersections(intersected,
+                                                             set(keys[position:position + budget.batch_size]))
+        position += budget.batch_size
+
+        if index is None and budget.over(0.5):
+            for key, ChIA_Drop_anchor in filtered_intersections.items():
+                filtered_intersections[key] = ChIA_Drop_anchor.saveas()
+            budget.spills += len(filtered_intersections)
+            gc.collect()
+
+        yield index, filtered_intersections
+        del filtered_intersections
+        budget.adapt()
+
+
+class AnchorWindows(dict):
+    """The fragments of each anchor triple's window, by key, as BedTools.
+
+    sizes holds the number of fragments and of distinct GEMs of each window,
+    counted while the windows are grouped, so a run report does not read the
+    windows again.
+    """
+
+    def __init__(self, windows=(), sizes=None):
+        super().__init__(windows)
+        self.sizes = {} if sizes is None else sizes
+
+
+def window_size(filtered_intersections, key):
+    """Number of fragments and of distinct GEMs in the window of anchor triple key."""
+    sizes = getattr(filtered_intersections, "sizes", None)
+    if sizes is not None:
+        return sizes[key]
+    window = filtered_intersections[key]
+    return len(window), len(window.gem_codes())
+
+
+def count_window(run_report, filtered_intersections, key):
+    """Count the window of anchor triple key as scanned, once, whatever the engine and schemes."""
+    fragments, gems = window_size(filtered_intersections, key)
+    run_report.count("fragments_scanned", fragments)
+    run_report.count("gems_scanned", gems)
+
+
+def intersect_filter_regions(ChIA_Drop, filter_regions_filename):
+    """Group the fragments intersecting each anchor triple's filter region."""
+    return group_intersections(intersect_anchors(ChIA_Drop, filter_regions_filename))
+
+
+def intersect_anchors(ChIA_Drop, filter_regions_filename):
+    """Fragments of ChIA_Drop, each followed by the filter region line of an anchor triple it intersects."""
+    from pybedtools import BedTool
+    filter_regions = BedTool(filter_regions_filename)
+    return ChIA_Drop.intersect(filter_regions, wa=True, wb=True)
+
+
+def group_intersections(intersected, keys=None):
+    """Group the intersect_anchors lines by anchor triple, only those in keys if given."""
+    from pybedtools import BedTool
+
+    # Dictionary to store the intersected regions for each line of b
+    filtered_intersections = AnchorWindows()
+    gem_ids = {}
+
+    for intersection in intersected:
+        b_fields = intersection.fields[5:]  # 5 fields in a
+        b_fields = ' '.join(b_fields)  # Make the key hashable
+        if keys is not None and b_fields not in keys:
+            continue
+        # Check if the key exists, if not, add an empty list
+        if b_fields not in filtered_intersections:
+            filtered_intersections[b_fields] = []
+            gem_ids[b_fields] = set()
+        # Append the intersection to the list
+        filtered_intersections[b_fields].append(intersection)
+        gem_ids[b_fields].add(intersection.fields[4])
+    # Convert lists to BedTool objects
+    for i in filtered_intersections:
+        filtered_intersections.sizes[i] = (len(filtered_intersections[i]), len(gem_ids[i]))
+        filtered_intersections[i] = BedTool(filtered_intersections[i])
+
+    return filtered_intersections
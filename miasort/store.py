@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .index import FragmentIndex, FRAGMENT_COLUMNS, POSITION_COLUMNS, GEM_COLUMNS
+
+STORE_VERSION = 3
+STORE_SUFFIX = ".mia"
+
+
+class StringTable:
+    """Read-only list of strings stored as one UTF-8 blob plus offsets.
+
+    Used for the GEM id dictionary so that reopening a store does not build
+    millions of Python strings up front; names are decoded on lookup.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        return self.data[self.offsets[code]:self.offsets[code + 1]].tobytes().decode()
+
+    @staticmethod
+    def encode(strings):
+        encoded = [string.encode() for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return data, offsets
+
+
+def default_store_path(path1):
+    return f"{path1}{STORE_SUFFIX}"
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+def source_signature(path1):
+    stat = os.stat(path1)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def compile_store(path1, store_path=None):
+    """Parse a region file once and save it as a columnar store of .npy files."""
+    if store_path is None:
+        store_path = default_store_path(path1)
+
+    index = FragmentIndex.from_file(path1)
+    write_store(index, store_path, source=path1)
+    return store_path
+
+
+def write_store(index, store_path, source=None):
+    # Write next to the destination first so a crash never leaves a half store
+    tmp_path = f"{store_path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for column in FRAGMENT_COLUMNS + POSITION_COLUMNS + GEM_COLUMNS:
+        np.save(os.path.join(tmp_path, f"{column}.npy"), np.asarray(getattr(index, column)))
+
+    data, offsets = StringTable.encode(index.gem_names[code] for code in range(len(index.gem_names)))
+    np.save(os.path.join(tmp_path, "gem_name_data.npy"), data)
+    np.save(os.path.join(tmp_path, "gem_name_offsets.npy"), offsets)
+
+    meta = {
+        "version": STORE_VERSION,
+        "num_fragments": len(index),
+        "chroms": list(index.chroms),
+        "source": os.path.abspath(source) if source else None,
+        "source_signature": source_signature(source) if source else None,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=2)
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.rename(tmp_path, store_path)
+
+
+def read_meta(store_path):
+    with open(os.path.join(store_path, "meta.json"), "r") as file:
+        return json.load(file)
+
+
+def open_store(store_path):
+    """Memory-map a store written by compile_store as a FragmentIndex."""
+    meta = read_meta(store_path)
+    if meta["version"] != STORE_VERSION:
+        raise ValueError(f"{store_path} was written by an incompatible version of miasort, "
+                         "please compile it again")
+
+    def load(column):
+        return np.load(os.path.join(store_path, f"{column}.npy"), mmap_mode='r')
+
+    columns = {column: load(column) for column in FRAGMENT_COLUMNS + POSITION_COLUMNS + GEM_COLUMNS}
+    gem_names = StringTable(load("gem_name_data"), load("gem_name_offsets"))
+
+    return FragmentIndex(meta["chroms"], gem_names, columns)
+
+
+def load_index(path1):
+    """Open path1 as a FragmentIndex.
+
+    path1 may be a store directory, or a region file. A region file is served
+    from its `.mia` store when one was compiled from the current version of the
+    file, and parsed as text otherwise.
+    """
+    if is_store(path1):
+        return open_store(path1)
+
+    store_path = default_store_path(path1)
+    if is_store(store_path):
+        meta = read_meta(store_path)
+        if meta["version"] == STORE_VERSION and meta["source_signature"] == source_signature(path1):
+            return open_store(store_path)
+
+    return FragmentIndex.from_file(path1)
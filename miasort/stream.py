@@ -0,0 +1,91 @@
+from array import array
+
+import numpy as np
+
+from .index import FragmentIndex, open_region, read_anchor_spans, group_anchor_spans
+
+
+class ChromosomeWindow:
+    """Fragments of one chromosome that overlap at least one anchor span.
+
+    Fragments are added in position order and tested against the merged anchor
+    spans with a sweep line, so fragments outside every span are never stored.
+    """
+
+    def __init__(self, chrom, spans):
+        self.chrom = chrom
+        self.spans = spans
+        self.merged = merge_spans([(start, end) for _, _, start, end in spans])
+        self.next_span = 0
+        self.last_start = None
+        self.gem_codes = {}
+        self.start, self.end, self.gem_size, self.gem = array('q'), array('q'), array('q'), array('q')
+
+    def add(self, start, end, gem_size, gem_id):
+        if self.last_start is not None and start < self.last_start:
+            raise ValueError(f"Fragments of {self.chrom} are not sorted by start position")
+        self.last_start = start
+
+        # Spans ending before this fragment cannot overlap any later fragment either
+        merged = self.merged
+        while self.next_span < len(merged) and merged[self.next_span][1] <= start:
+            self.next_span += 1
+        if self.next_span == len(merged) or merged[self.next_span][0] >= end:
+            return
+
+        self.start.append(start)
+        self.end.append(end)
+        self.gem_size.append(gem_size)
+        self.gem.append(self.gem_codes.setdefault(gem_id, len(self.gem_codes)))
+
+    def group_by_anchor(self):
+        """Index the kept fragments and group them by anchor triple."""
+        index = FragmentIndex.from_arrays([self.chrom], list(self.gem_codes),
+                                          np.zeros(len(self.start), dtype=np.int32),
+                                          np.frombuffer(self.start, dtype=np.int64),
+                                          np.frombuffer(self.end, dtype=np.int64),
+                                          np.frombuffer(self.gem_size, dtype=np.int64).astype(np.int32),
+                                          np.frombuffer(self.gem, dtype=np.int64))
+        return index, group_anchor_spans(index, self.spans)
+
+
+def merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def stream_anchors(path1, path2):
+    """Yield (index, filtered_intersections) for each chromosome of path1.
+
+    path1 must be sorted by position (chromosome blocks, then start). It is read
+    once, and each chromosome's anchor triples are grouped as soon as its block
+    ends, so only the fragments inside anchor spans of one chromosome are held
+    in memory at a time.
+    """
+    spans_by_chrom = {}
+    for span in read_anchor_spans(path2):
+        spans_by_chrom.setdefault(span[1], []).append(span)
+
+    seen = set()
+    window = None
+    with open_region(path1) as file:
+        for line in file:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            if window is None or fields[0] != window.chrom:
+                if fields[0] in seen:
+                    raise ValueError(f"{path1} is not sorted by position: {fields[0]} appears in more than one block")
+                seen.add(fields[0])
+                if window is not None and window.spans:
+                    yield window.group_by_anchor()
+                window = ChromosomeWindow(fields[0], spans_by_chrom.get(fields[0], []))
+            window.add(int(fields[1]), int(fields[2]), int(fields[3]), fields[4])
+
+    if window is not None and window.spans:
+        yield window.group_by_anchor()
@@ -9,12 +9,16 @@ setup(
     long_description=open('README.md').read(),
     long_description_content_type="text/markdown",
     url="https://github.com/minjikimlab/mia-sort",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=[
         'matplotlib==3.9.2',
+        'numpy',
         'pybedtools==0.10.0',
         'setuptools==70.3.0',
     ],
+    entry_points={
+        "console_scripts": ["miasort=miasort.cli:main"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+out_dir = "./test_folder_syn_cooccurrence"
+os.makedirs(out_dir, exist_ok=True)
+
+
+def read_gems(path1):
+    """The fragments of each GEM of a region file."""
+    gems = {}
+    with open(path1) as file:
+        for line in file:
+            chrom, start, end, _, gem_id = line.split()[:5]
+            gems.setdefault(gem_id, []).append((chrom, int(start), int(end)))
+    return gems
+
+
+def brute_force(gems, sites, num_frag_min=2, num_frag_max=1000):
+    """Complexes touching each pair of sites, of GEMs whose fragment count in the whole file is within limits."""
+    counts = {}
+    for fragments in gems.values():
+        if not num_frag_min <= len(fragments) <= num_frag_max:
+            continue
+        touched = [i for i, (chrom, start, end) in enumerate(sites)
+                   if any(c == chrom and s < end and e > start for c, s, e in fragments)]
+        for position, row in enumerate(touched):
+            for col in touched[position:]:
+                counts[row, col] = counts.get((row, col), 0) + 1
+    return counts
+
+
+def cooccurrence(path1, name, **limits):
+    path = miasort.anchor_cooccurrence(path1, "./data/test_input_abc.domains",
+                                       out_path=os.path.join(out_dir, f"{name}_cooccurrence.npz"), **limits)
+    matrix = miasort.load_cooccurrence(path)
+    sites = [(str(chrom), int(start), int(end)) for chrom, start, end in
+             zip(matrix["chroms"][matrix["anchor_chrom"]], matrix["anchor_start"], matrix["anchor_end"])]
+    counts = {(int(row), int(col)): int(count) for row, col, count in
+              zip(matrix["cooccurrence_row"], matrix["cooccurrence_col"], matrix["cooccurrence_count"])}
+    return sites, counts
+
+
+# Every pair count matches a count over the GEMs of the region file
+gems = read_gems("./data/test_input.region")
+sites, counts = cooccurrence("./data/test_input.region", "test_input_abc")
+assert len(sites) == 6
+assert all(row <= col for row, col in counts)
+assert counts == brute_force(gems, sites)
+
+# A and C of cr1_M-1, B with A of cr1_M-3, and the two C sites
+assert sites[0][1:] == (100000, 108000) and sites[4][1:] == (300000, 308000)
+assert counts[(0, 4)] == 5
+assert counts[(2, 3)] == 3
+assert counts[(4, 5)] == 10
+
+# A GEM with 2 fragments at sites A and C of cr1_M-1 and 2 more elsewhere has 4 fragments in all,
+# so it is left out with num_frag_max=3 although only 2 of its fragments touch the sites
+path1 = os.path.join(out_dir, "extra_gem.region")
+extra = [("chr3", 101000, 101500), ("chr3", 301000, 301500), ("chr9", 5000, 5500), ("chr9", 9000, 9500)]
+with open("./data/test_input.region") as infile, open(path1, "w") as outfile:
+    outfile.write(infile.read())
+    outfile.writelines(f"{chrom}\t{start}\t{end}\t4\textra-gem\n" for chrom, start, end in extra)
+gems = read_gems(path1)
+
+sites, counts = cooccurrence(path1, "extra_gem")
+assert counts == brute_force(gems, sites) and counts[(0, 4)] == 6
+sites, counts = cooccurrence(path1, "extra_gem_max3", num_frag_max=3)
+assert counts == brute_force(gems, sites, num_frag_max=3)
+assert counts.get((0, 4), 0) == brute_force(read_gems("./data/test_input.region"), sites, num_frag_max=3).get((0, 4), 0)
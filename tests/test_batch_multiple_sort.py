@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+QUERIES = [("chr3:100000-108000;chr3:150000-155000;chr3:300000-308000;chr3:420000-428000", "yes;no;yes;yes", "q1"),
+           ("chr3:100000-108000;chr3:300000-308000", "yes;yes", "q2"),
+           ("chr3:150000-155000;chr3:300000-318000", "yes;yes", "q3")]
+
+out_dir = "./test_folder_batch"
+os.makedirs(out_dir, exist_ok=True)
+path2 = os.path.join(out_dir, "queries.tsv")
+with open(path2, "w") as file:
+    file.write("# regions\toperations\tid\n")
+    for query in QUERIES:
+        file.write("\t".join(query) + "\n\n")
+
+
+def complexes(path):
+    """Exported complexes of each query, as (GEM, span, fragments) in rank order."""
+    exported = miasort.load_complexes(path)
+    offsets = exported["complex_fragments"]
+    by_query = {}
+    for i, anchor in enumerate(exported["complex_anchor"]):
+        refs = exported["fragment_refs"][offsets[i]:offsets[i + 1]]
+        fragments = [(int(exported["fragment_start"][ref]), int(exported["fragment_end"][ref])) for ref in refs]
+        by_query.setdefault(str(exported["anchor_ids"][anchor]), []).append(
+            (str(exported["gem_ids"][exported["complex_gem"][i]]), int(exported["complex_span"][i]), fragments))
+    return by_query
+
+
+for engine in ["bedtools", "numpy"]:
+    # One batch run against the complexes loaded once
+    batch_dir = f"{out_dir}_{engine}"
+    miasort.batch_multiple_sort("./data/test_input.region", path2, out_dir=batch_dir, engine=engine,
+                                export_complexes=True)
+    batch = complexes(os.path.join(batch_dir, "test_input_queries.tsv_frag6000bp_complexes.npz"))
+    with open(os.path.join(batch_dir, "test_input_queries.tsv_frag6000bp_comp_records.csv")) as file:
+        rows = [line.rstrip("\n").split(",") for line in file][1:]
+    assert [row[0] for row in rows] == [id for _, _, id in QUERIES]
+
+    # ... ranks each query as a run of its own
+    for (regions, operations, id), row in zip(QUERIES, rows):
+        query_dir = f"{out_dir}_{engine}_{id}"
+        miasort.unlimited_multiple_sort("./data/test_input.region", regions, operations, out_dir=query_dir,
+                                        plot=False, engine=engine, export_complexes=True)
+        single = complexes(os.path.join(query_dir, "test_input_multiple_frag6000bp_complexes.npz"))
+        assert list(single.values()) == [batch.get(id, [])], f"Query {id} differs in the {engine} batch"
+        assert int(row[3]) == len(batch.get(id, []))
+    assert batch, "No complexes in the batch"
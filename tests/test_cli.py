@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+
+COMMAND = [sys.executable, "-m", "miasort", "--type", "abc", "--path2", "./data/test_input.domains"]
+CSV_FILE = "test_input_test_input.domains_frag6000bp_comp_records.csv"
+
+
+def miasort(*args, stdin=None, stdout=subprocess.PIPE):
+    return subprocess.run(COMMAND + list(args), stdin=stdin, stdout=stdout, stderr=subprocess.PIPE, text=True)
+
+
+# The comp records written to --out_dir
+result = miasort("--path1", "./data/test_input.region", "--out_dir", "./test_folder_cli", "--plot", "no")
+assert result.returncode == 0, result.stderr
+with open(os.path.join("./test_folder_cli", CSV_FILE)) as file:
+    records = file.read()
+assert records.count("\n") > 1
+
+# The same records on standard output, without --out_dir, from a plain, gzipped or piped region file
+with open("./data/test_input.region", "rb") as infile, gzip.open("./test_folder_cli/test_input.region.gz", "wb") as outfile:
+    shutil.copyfileobj(infile, outfile)
+for args, stdin in [(["--path1", "./data/test_input.region"], None),
+                    (["--path1", "./test_folder_cli/test_input.region.gz"], None),
+                    (["--path1", "-"], "./data/test_input.region"),
+                    ([], "./data/test_input.region")]:
+    if stdin is None:
+        result = miasort(*args, "--stdout")
+    else:
+        with open(stdin) as file:
+            result = miasort(*args, "--stdout", stdin=file)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == records, f"The records on standard output differ with {args}"
+
+# With nothing to write there, --out_dir is left as it is
+result = miasort("--path1", "./data/test_input.region", "--out_dir", "./test_folder_cli", "--stdout", "--plot", "no")
+assert result.returncode == 0 and result.stdout == records, result.stderr
+assert os.path.exists(os.path.join("./test_folder_cli", CSV_FILE))
+
+# Plots or histograms still need --out_dir, and so do records written to a file
+for args in [["--stdout", "--plot", "yes"], ["--stdout", "--histogram", "yes"], []]:
+    result = miasort("--path1", "./data/test_input.region", *args)
+    assert result.returncode != 0 and "--out_dir is required" in result.stderr, args
+
+# A reader that goes away (e.g. `head`) ends the run with status 1 and no traceback
+read_end, write_end = os.pipe()
+os.close(read_end)
+result = miasort("--path1", "./data/test_input.region", "--stdout", stdout=write_end)
+os.close(write_end)
+assert result.returncode == 1, result.returncode
+assert "Traceback" not in result.stderr and "Exception ignored" not in result.stderr, result.stderr
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import filecmp
+import gzip
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import zlib
+
+import numpy as np
+
+from miasort.store import compile_store
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin")
+CONVERTERS = ["pairs2complexes", "porec2complexes", "sprite2complexes"]
+CHROMS = {"chr1": 5000000, "chr2": 3000000, "chrM": 16569}
+THREADS = 4
+
+out_dir = "./test_folder_converters"
+if os.path.exists(out_dir):
+    shutil.rmtree(out_dir)
+os.makedirs(out_dir)
+
+for converter in CONVERTERS:
+    subprocess.run(["g++", "-std=c++17", "-O2", "-Wall", "-Wextra", "-Werror", "-pthread",
+                    "-o", os.path.join(out_dir, converter), os.path.join(BIN_DIR, f"{converter}.cpp"), "-lz"],
+                   check=True)
+
+sizes = os.path.join(out_dir, "chrom.sizes")
+with open(sizes, "w") as file:
+    file.writelines(f"{chrom}\t{size}\n" for chrom, size in CHROMS.items())
+
+
+def position(rng, chrom):
+    return rng.randrange(1000, CHROMS[chrom] - 1000)
+
+
+def pairs_lines(rng, count):
+    yield "## pairs format v1.0\n#columns: readID chr1 pos1 chr2 pos2 strand1 strand2\n"
+    for i in range(count):
+        chrom1, chrom2 = rng.choice(list(CHROMS)), rng.choice(list(CHROMS))
+        pos1 = position(rng, chrom1)
+        pos2 = pos1 + rng.randrange(0, 60000) if chrom1 == chrom2 else position(rng, chrom2)
+        yield f"read{i}\t{chrom1}\t{pos1}\t{chrom2}\t{pos2}\t+\t-\n"
+
+
+def porec_lines(rng, count):
+    yield ",".join(f"column{i}" for i in range(1, 19)) + "\n"
+    for i in range(count):
+        for _ in range(rng.randrange(1, 8)):
+            chrom = rng.choice(list(CHROMS))
+            start = position(rng, chrom)
+            fields = ["0", "0", "0", chrom, str(start), str(start + rng.randrange(100, 2000)), "0", f"read{i}"]
+            fields += ["0"] * 9 + [rng.choice(["True", "True", "False"])]
+            yield ",".join(fields) + "\n"
+
+
+def sprite_lines(rng, count):
+    for i in range(count):
+        locations = []
+        for _ in range(rng.randrange(1, 12)):
+            chrom = rng.choice(list(CHROMS))
+            locations.append(f"{chrom}:{position(rng, chrom)}")
+        yield f"DPM.cluster{i}\t" + "\t".join(locations) + "\n"
+
+
+def bgzf(data):
+    """data as BGZF blocks, as written by bgzip."""
+    blocks = []
+    for offset in range(0, len(data), 65280):
+        chunk = data[offset:offset + 65280]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = compressor.compress(chunk) + compressor.flush()
+        header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff" + struct.pack("<HBBHH", 6, 66, 67, 2, len(deflated) + 25)
+        blocks.append(header + deflated + struct.pack("<II", zlib.crc32(chunk), len(chunk)))
+    blocks.append(bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000"))
+    return b"".join(blocks)
+
+
+def run(converter, path, output, threads):
+    subprocess.run([os.path.join(out_dir, converter), out_dir, path, sizes, os.path.join(out_dir, output),
+                    "250", "8000", str(threads)], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def same_store(path, expected):
+    """Whether the store at path holds the columns and GEM names of the expected one."""
+    with open(os.path.join(path, "meta.json")) as file, open(os.path.join(expected, "meta.json")) as other:
+        meta, expected_meta = json.load(file), json.load(other)
+    if any(meta[key] != expected_meta[key] for key in ("version", "num_fragments", "chroms")):
+        return False
+    columns = sorted(name for name in os.listdir(expected) if name.endswith(".npy"))
+    return sorted(name for name in os.listdir(path) if name.endswith(".npy")) == columns and \
+        all(np.array_equal(np.load(os.path.join(path, name)), np.load(os.path.join(expected, name)))
+            for name in columns)
+
+
+# Inputs above the 4 MB chunk of the readers, so lines and complexes cross chunk boundaries
+inputs = {"pairs2complexes": ("lib.pairs", pairs_lines, 150000),
+          "porec2complexes": ("lib.csv", porec_lines, 40000),
+          "sprite2complexes": ("lib.clusters", sprite_lines, 60000)}
+
+for converter, (name, lines, count) in inputs.items():
+    data = "".join(lines(random.Random(name), count)).encode()
+    assert len(data) > 4 << 20
+    paths = {"plain": os.path.join(out_dir, name), "gzip": os.path.join(out_dir, f"{name}.gz"),
+             "bgzf": os.path.join(out_dir, f"bgzf_{name}.gz")}
+    with open(paths["plain"], "wb") as file:
+        file.write(data)
+    with gzip.open(paths["gzip"], "wb") as file:
+        file.write(data)
+    with open(paths["bgzf"], "wb") as file:
+        file.write(bgzf(data))
+
+    # The same complexes for every input compression and number of threads
+    reference = os.path.join(out_dir, f"{converter}_plain_1.complexes")
+    for compression, path in paths.items():
+        for threads in [1, THREADS]:
+            run(converter, path, f"{converter}_{compression}_{threads}", threads)
+            output = os.path.join(out_dir, f"{converter}_{compression}_{threads}.complexes")
+            assert filecmp.cmp(output, reference, shallow=False), f"{converter} differs for {compression}, {threads}"
+    assert os.path.getsize(reference) > 0
+
+    # A `.mia` output is the store compile_complexes builds from the text output
+    expected = compile_store(reference, os.path.join(out_dir, f"{converter}_compiled.mia"))
+    for compression, path in paths.items():
+        for threads in [1, THREADS]:
+            store = f"{converter}_{compression}_{threads}.mia"
+            run(converter, path, store, threads)
+            assert same_store(os.path.join(out_dir, store), expected), f"The {store} store differs"
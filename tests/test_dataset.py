@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import functools
+import os
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+REGIONS = "chr3:100000-108000;chr3:150000-155000;chr3:300000-308000"
+
+
+class Separate:
+    """The sort functions of miasort on the test region file, each call a separate run."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __getattr__(self, name):
+        return functools.partial(getattr(miasort, name), "./data/test_input.region", engine=self.engine)
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def outputs(out_dir):
+    """Contents of the CSV and histogram files of out_dir."""
+    return {name: read(os.path.join(out_dir, name)) for name in sorted(os.listdir(out_dir))
+            if name.endswith((".csv", ".txt"))}
+
+
+def calls(sorter, prefix):
+    """Outputs of a series of calls of every mode, some with the same anchor file."""
+    results = []
+    for i, path2 in enumerate(["test_input.domains", "test_input_abc.domains", "test_input.domains"]):
+        sorter.abc_sort(f"./data/{path2}", SCHEMES, out_dir=f"{prefix}_abc_{i}", plot=False, histogram=True)
+        results.append(outputs(f"{prefix}_abc_{i}"))
+    sorter.multiple_sort("./data/test_input_abc.domains", out_dir=f"{prefix}_AandBandC", plot=False, histogram=True)
+    results.append(outputs(f"{prefix}_AandBandC"))
+    sorter.unlimited_multiple_sort(REGIONS, "yes;yes;yes", out_dir=f"{prefix}_multiple", plot=False, histogram=True)
+    results.append(outputs(f"{prefix}_multiple"))
+    return results
+
+
+for engine in ["bedtools", "numpy"]:
+    separate = calls(Separate(engine), f"./test_folder_dataset_separate_{engine}")
+    assert all(separate), "A separate run wrote nothing"
+
+    with miasort.Dataset("./data/test_input.region", engine=engine) as dataset:
+        other = miasort.Dataset("./data/test_input.region", engine=engine)
+        other.abc_sort("./data/test_input.domains", SCHEMES, out_dir=f"./test_folder_dataset_other_{engine}",
+                       plot=False)
+        assert calls(dataset, f"./test_folder_dataset_session_{engine}") == separate, \
+            f"The {engine} dataset calls differ from separate runs"
+
+        # Closing one dataset only deletes its own temp files
+        other_files = list(other.tempfiles)
+        other.close()
+        assert not any(os.path.exists(path) for path in other_files)
+        dataset_files = list(dataset.tempfiles)
+        assert all(os.path.exists(path) for path in dataset_files)
+        assert bool(dataset_files) == (engine == "bedtools")
+
+        # Separate runs in between keep the temp files of the open dataset, which its cached groupings read
+        calls(Separate(engine), f"./test_folder_dataset_between_{engine}")
+        assert all(os.path.exists(path) for path in dataset_files)
+        assert calls(dataset, f"./test_folder_dataset_session_{engine}") == separate
+    assert not any(os.path.exists(path) for path in dataset.tempfiles + dataset_files)
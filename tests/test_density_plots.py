@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+
+import miasort
+import miasort.plot
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+CSV_FILE = "test_input_test_input_abc.domains_frag6000bp_comp_records.csv"
+
+# Record the density images drawn, by their number of complexes
+draw_density = miasort.plot.draw_density
+drawn = []
+
+
+def recording_draw_density(*args):
+    drawn.append(args[6])
+    return draw_density(*args)
+
+
+miasort.plot.draw_density = recording_draw_density
+
+for threshold in [None, 3]:
+    drawn.clear()
+    out_dir = f"./test_folder_density_{threshold}"
+    miasort.abc_sort("./data/test_input.region", "./data/test_input_abc.domains", SCHEMES, out_dir=out_dir,
+                     engine="numpy", density_threshold=threshold)
+    with open(os.path.join(out_dir, CSV_FILE)) as file:
+        counts = [int(row["num_complexes"]) for row in csv.DictReader(file)]
+
+    # Only the plots with more complexes than the threshold switch to a density image
+    expected = [] if threshold is None else [count for count in counts if count > threshold]
+    assert sorted(drawn) == sorted(expected), f"Density images of {drawn} complexes with threshold {threshold}"
+    assert len([name for name in os.listdir(out_dir) if name.endswith(".png")]) == 6
+assert any(count > 3 for count in counts) and any(0 < count <= 3 for count in counts)
+
+drawn.clear()
+miasort.unlimited_multiple_sort("./data/test_input.region", "chr3:100000-108000;chr3:300000-308000", "yes;yes",
+                                out_dir="./test_folder_density_multiple", engine="numpy", density_threshold=1)
+assert len(drawn) == 1 and drawn[0] > 1
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+ENGINES = ["bedtools", "numpy"]
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+# abc and AandBandC modes: the comp records CSV of both engines
+for engine in ENGINES:
+    miasort.abc_sort("./data/test_input.region",
+                     "./data/test_input.domains",
+                     "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC",
+                     out_dir=f"./test_folder_engines_abc_{engine}",
+                     plot=False,
+                     engine=engine)
+    miasort.multiple_sort("./data/test_input.region",
+                          "./data/test_input_abc.domains",
+                          out_dir=f"./test_folder_engines_AandBandC_{engine}",
+                          plot=False,
+                          engine=engine)
+
+for mode, path2 in [("abc", "test_input.domains"), ("AandBandC", "test_input_abc.domains")]:
+    csv_file = f"test_input_{path2}_frag6000bp_comp_records.csv"
+    records = [read(os.path.join(f"./test_folder_engines_{mode}_{engine}", csv_file)) for engine in ENGINES]
+    assert records[0].count("\n") > 1, f"No {mode} records"
+    assert records[0] == records[1], f"The {mode} records of the bedtools and numpy engines differ"
+
+# multiple mode keeps no records file, so the exported complexes are compared
+complexes = []
+for engine in ENGINES:
+    out_dir = f"./test_folder_engines_multiple_{engine}"
+    miasort.unlimited_multiple_sort("./data/test_input.region",
+                                    "chr3:100000-108000;chr3:150000-155000;chr3:300000-308000;chr3:420000-428000",
+                                    "yes;no;yes;yes",
+                                    out_dir=out_dir,
+                                    plot=False,
+                                    engine=engine,
+                                    export_complexes=True)
+    exported = miasort.load_complexes(os.path.join(out_dir, "test_input_multiple_frag6000bp_complexes.npz"))
+    complexes.append(list(zip(exported["gem_ids"][exported["complex_gem"]], exported["complex_span"])))
+
+assert complexes[0], "No multiple complexes"
+assert complexes[0] == complexes[1], "The multiple complexes of the bedtools and numpy engines differ"
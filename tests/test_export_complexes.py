@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+
+import numpy as np
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+
+# The fragments of each GEM in the region file
+gems = {}
+with open("./data/test_input.region") as file:
+    for line in file:
+        chrom, start, end, _, gem_id = line.split()[:5]
+        gems.setdefault(gem_id, set()).add((chrom, int(start), int(end)))
+
+# The A-start to C-end window of each anchor triple
+windows = {}
+with open("./data/test_input_abc.domains") as file:
+    for line in file:
+        fields = line.split()
+        windows[fields[9]] = (fields[0], int(fields[1]), int(fields[8]))
+
+exports = {}
+for engine in ["bedtools", "numpy"]:
+    out_dir = f"./test_folder_export_{engine}"
+    miasort.abc_sort("./data/test_input.region", "./data/test_input_abc.domains", SCHEMES, out_dir=out_dir,
+                     plot=False, engine=engine, export_complexes=True)
+    exported = miasort.load_complexes(os.path.join(out_dir, "test_input_test_input_abc.domains_frag6000bp_complexes.npz"))
+
+    exports[engine] = exported
+
+    # Every complex reads back with fragments of its GEM in the anchor window (those the scheme
+    # keeps) and their span, ranked from 1 in each anchor and scheme
+    offsets = exported["complex_fragments"]
+    assert len(offsets) == len(exported["complex_gem"]) + 1 and offsets[-1] == len(exported["fragment_refs"])
+    ranked = {}
+    for i in range(len(exported["complex_gem"])):
+        key = (str(exported["anchor_ids"][exported["complex_anchor"][i]]),
+               str(exported["schemes"][exported["complex_scheme"][i]]))
+        refs = exported["fragment_refs"][offsets[i]:offsets[i + 1]]
+        fragments = {(str(exported["chroms"][exported["fragment_chrom"][ref]]),
+                      int(exported["fragment_start"][ref]), int(exported["fragment_end"][ref])) for ref in refs}
+        gem_id = str(exported["gem_ids"][exported["complex_gem"][i]])
+        chrom, start, end = windows[key[0]]
+        assert fragments and fragments <= {fragment for fragment in gems[gem_id]
+                                           if fragment[0] == chrom and fragment[1] < end and fragment[2] > start}, \
+            f"The fragments of {gem_id} are not its fragments in the window of {key[0]}"
+        assert exported["complex_span"][i] == max(end for _, _, end in fragments) - min(start for _, start, _ in fragments)
+        ranked.setdefault(key, []).append((int(exported["complex_rank"][i]), len(fragments)))
+
+    # ... and their numbers match the comp records
+    with open(os.path.join(out_dir, "test_input_test_input_abc.domains_frag6000bp_comp_records.csv")) as file:
+        rows = list(csv.DictReader(file))
+    assert rows
+    for row in rows:
+        complexes = ranked.get((row["Region ID"], row["Sort Scheme"]), [])
+        assert [rank for rank, _ in complexes] == list(range(1, len(complexes) + 1))
+        assert int(row["num_complexes"]) == len(complexes)
+        sizes = [size for _, size in complexes]
+        assert [int(row[f"num_{n}frag"]) for n in range(1, 5)] == [sizes.count(n) for n in range(1, 5)]
+        assert int(row["num>=5frag"]) == sum(size >= 5 for size in sizes)
+
+# Both engines export the same columns
+assert exports["bedtools"].keys() == exports["numpy"].keys()
+assert all(np.array_equal(exports["bedtools"][name], exports["numpy"][name]) for name in exports["numpy"])
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+
+# Seconds `import miasort` may take, best of 5 runs in fresh interpreters
+IMPORT_BUDGET = 0.5
+
+# Only loaded by the bedtools engine and by plotting
+LAZY_MODULES = ["matplotlib", "pybedtools"]
+
+script = f"""
+import sys, time
+start = time.perf_counter()
+import miasort
+print(time.perf_counter() - start)
+print(",".join(module for module in {LAZY_MODULES!r} if module in sys.modules))
+"""
+
+times = []
+for _ in range(5):
+    seconds, loaded = subprocess.run([sys.executable, "-c", script], check=True,
+                                     capture_output=True, text=True).stdout.splitlines()
+    times.append(float(seconds))
+    assert not loaded, f"`import miasort` loaded {loaded}"
+
+print(f"import miasort: {min(times):.3f}s (budget {IMPORT_BUDGET}s)")
+assert min(times) <= IMPORT_BUDGET, f"`import miasort` took {min(times):.3f}s, over the {IMPORT_BUDGET}s budget"
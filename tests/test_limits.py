@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+ENGINES = ["bedtools", "numpy"]
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+CSV_FILE = "test_input_test_input.domains_frag6000bp_comp_records.csv"
+COMPLEXES_FILE = "test_input_test_input.domains_frag6000bp_complexes.npz"
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def run(engine, name, **options):
+    """Comp records, histogram files and exported (anchor, scheme, GEM) rows of one run."""
+    out_dir = f"./test_folder_limits_{name}_{engine}"
+    miasort.abc_sort("./data/test_input.region", "./data/test_input.domains", SCHEMES,
+                     out_dir=out_dir, plot=False, histogram=True, engine=engine,
+                     export_complexes=True, **options)
+    histograms = {file: read(os.path.join(out_dir, file)) for file in os.listdir(out_dir) if file.endswith(".txt")}
+    exported = miasort.load_complexes(os.path.join(out_dir, COMPLEXES_FILE))
+    rows = list(zip(exported["anchor_ids"][exported["complex_anchor"]],
+                    exported["schemes"][exported["complex_scheme"]],
+                    exported["gem_ids"][exported["complex_gem"]]))
+    return read(os.path.join(out_dir, CSV_FILE)), histograms, rows
+
+
+def counts(histogram):
+    """The size and total lines of a histogram file, without its `kept` line."""
+    return [line for line in histogram.splitlines() if not line.startswith("kept")]
+
+
+full = {engine: run(engine, "all") for engine in ENGINES}
+assert full["bedtools"] == full["numpy"], "The engines differ without a limit"
+full_records, full_histograms, full_rows = full["numpy"]
+
+for name, options in [("max", {"max_complexes": 2}), ("sample", {"sample": 2})]:
+    results = {engine: run(engine, name, **options) for engine in ENGINES}
+
+    # Both engines keep the same complexes and write the same files
+    assert results["bedtools"] == results["numpy"], f"The engines differ with {options}"
+    records, histograms, rows = results["numpy"]
+
+    # The records and the histogram totals still count every complex
+    assert records == full_records
+    assert histograms.keys() == full_histograms.keys()
+    for file, histogram in histograms.items():
+        assert counts(histogram) == counts(full_histograms[file]), file
+    assert any("kept\t2" in histogram for histogram in histograms.values())
+
+    # At most 2 complexes of each anchor and scheme are kept, in the order of the full ranking
+    for key in set(row[:2] for row in full_rows):
+        kept = [row[2] for row in rows if row[:2] == key]
+        ranking = [row[2] for row in full_rows if row[:2] == key]
+        assert len(kept) == min(2, len(ranking))
+        if name == "max":
+            assert kept == ranking[:len(kept)]
+        else:
+            assert kept == [gem for gem in ranking if gem in kept]
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+NUM_ANCHORS = 160
+
+# More anchor triples than the first batch holds, out of position order
+out_dir = "./test_folder_budget_anchors"
+os.makedirs(out_dir, exist_ok=True)
+anchors_file = os.path.join(out_dir, "sliding.domains")
+with open(anchors_file, "w") as file:
+    for i in range(NUM_ANCHORS):
+        start = 90000 + 4000 * (i * 37 % NUM_ANCHORS)
+        file.write(f"chr3\t{start}\t{start + 8000}\tchr3\t{start + 50000}\t{start + 55000}\t"
+                   f"chr3\t{start + 200000}\t{start + 208000}\tslide-{i}\n")
+
+csv_file = "test_input_sliding.domains_frag6000bp_comp_records.csv"
+for engine in ["bedtools", "numpy"]:
+    records = []
+    # A budget below the RSS of the run shrinks the batches and spills the bedtools fragment sets
+    for memory_budget in [None, 2 ** 24]:
+        run_dir = f"./test_folder_budget_{engine}_{memory_budget}"
+        miasort.abc_sort("./data/test_input.region", anchors_file, SCHEMES, out_dir=run_dir,
+                         plot=False, engine=engine, memory_budget=memory_budget)
+        with open(os.path.join(run_dir, csv_file)) as file:
+            records.append(file.read())
+    assert records[0].count("\n") > 6 * 64, "Too few anchor triples with complexes"
+    assert records[0] == records[1], f"The {engine} rows differ with a memory budget"
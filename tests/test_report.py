@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import pstats
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+
+for engine in ["bedtools", "numpy"]:
+    for workers in [1, 2]:
+        out_dir = f"./test_folder_report_{engine}_{workers}"
+        miasort.abc_sort("./data/test_input.region", "./data/test_input_abc.domains", SCHEMES,
+                         out_dir=out_dir, plot=False, engine=engine, workers=workers,
+                         profile_anchor="cr1_M-2")
+
+        with open(os.path.join(out_dir, "run_report.json")) as file:
+            report = json.load(file)
+        assert report["engine"] == engine and report["workers"] == workers
+        assert [anchor["id"] for anchor in report["anchors"]] == ["cr1_M-1", "cr1_M-2", "cr1_M-3"]
+        assert report["stages"]["sort"]["calls"] == 3
+        assert "records" in report["stages"]
+        # The same windows are scanned with either engine and any number of workers
+        assert report["counters"]["fragments_scanned"] == 135
+        assert report["counters"]["gems_scanned"] == 63
+        assert sum(anchor["counters"]["fragments_scanned"] for anchor in report["anchors"]) == 135
+        if engine == "bedtools":
+            assert report["counters"]["intersect_calls"] > 0
+
+        # The profile of cr1_M-2 covers its sort, even when a worker ran it
+        assert os.listdir(out_dir).count("cr1_M-2.prof") == 1
+        assert not [name for name in os.listdir(out_dir) if name.endswith(".prof") and name != "cr1_M-2.prof"]
+        stats = pstats.Stats(os.path.join(out_dir, "cr1_M-2.prof"))
+        functions = {name for _, _, name in stats.stats}
+        assert "sort_anchor" in functions, f"The sort is not profiled with {workers} workers"
+        assert "write_to_csv_file" in functions
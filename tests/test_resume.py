@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+
+import miasort
+import miasort.start
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+CSV_FILE = "test_input_test_input_abc.domains_frag6000bp_comp_records.csv"
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def sort(out_dir, **options):
+    miasort.abc_sort("./data/test_input.region", "./data/test_input_abc.domains", SCHEMES,
+                     out_dir=out_dir, plot=False, engine="numpy", **options)
+
+
+# Resumable runs continue what an earlier run of this test left, so start afresh
+for out_dir in ["./test_folder_resume", "./test_folder_resume_extended"]:
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+
+sort("./test_folder_resume_full")
+full = read(os.path.join("./test_folder_resume_full", CSV_FILE))
+assert not os.path.exists(os.path.join("./test_folder_resume_full", "run_manifest.jsonl"))
+
+
+# Interrupt the run half-way through the rows of its second anchor triple
+class Interrupted(Exception):
+    pass
+
+
+write_to_csv_file = miasort.start.write_to_csv_file
+rows = []
+
+
+def interrupting_write(*args):
+    if len(rows) == 8:
+        raise Interrupted()
+    rows.append(args)
+    return write_to_csv_file(*args)
+
+
+out_dir = "./test_folder_resume"
+miasort.start.write_to_csv_file = interrupting_write
+try:
+    sort(out_dir, resume=True)
+    raise AssertionError("The run was not interrupted")
+except Interrupted:
+    pass
+finally:
+    miasort.start.write_to_csv_file = write_to_csv_file
+
+with open(os.path.join(out_dir, "run_manifest.jsonl")) as file:
+    entries = [json.loads(line) for line in file]
+committed = entries[-1]["csv_size"]
+assert len(entries) == 2, "Only the first anchor triple is complete"
+
+# Rows of the incomplete triple (here a cut row) past the committed size are dropped on resume
+csv_path = os.path.join(out_dir, CSV_FILE)
+with open(csv_path, "a") as file:
+    file.write("cr1_M-2,chr3:100000-109800,")
+assert read(csv_path)[:committed] == full[:committed]
+
+sort(out_dir, resume=True)
+assert read(csv_path) == full, "The resumed run differs from an uninterrupted one"
+
+# A run with other parameters cannot continue it
+try:
+    sort(out_dir, resume=True, num_frag_min=3)
+    raise AssertionError("Resuming with other parameters did not raise")
+except ValueError:
+    pass
+
+# A run extended to a larger anchor file continues in the CSV file named after it
+out_dir = "./test_folder_resume_extended"
+miasort.abc_sort("./data/test_input.region", "./data/test_input.domains", SCHEMES,
+                 out_dir=out_dir, plot=False, engine="numpy", resume=True)
+sort(out_dir, resume=True)
+assert sorted(name for name in os.listdir(out_dir) if name.endswith(".csv")) == [CSV_FILE]
+assert read(os.path.join(out_dir, CSV_FILE)) == full
+
+# An empty manifest is no record of a run: the run starts over
+with open(os.path.join(out_dir, "run_manifest.jsonl"), "w"):
+    pass
+sort(out_dir, resume=True)
+assert read(os.path.join(out_dir, CSV_FILE)) == full
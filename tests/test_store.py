@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+
+import numpy as np
+
+import miasort
+from miasort.store import load_index
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+out_dir = "./test_folder_store"
+
+
+def records(path1, name):
+    """Comp records of an abc run of the numpy engine on path1."""
+    miasort.abc_sort(path1, "./data/test_input.domains", SCHEMES, out_dir=f"{out_dir}_{name}", plot=False,
+                     histogram=True, engine="numpy")
+    csv_file = [file for file in os.listdir(f"{out_dir}_{name}") if file.endswith(".csv")][0]
+    with open(os.path.join(f"{out_dir}_{name}", csv_file)) as file:
+        return file.read()
+
+
+def from_store(path1):
+    return isinstance(load_index(path1).start, np.memmap)
+
+
+os.makedirs(out_dir, exist_ok=True)
+path1 = os.path.join(out_dir, "lib.region")
+shutil.copyfile("./data/test_input.region", path1)
+store = miasort.compile_complexes(path1)
+assert store == f"{path1}.mia" and from_store(path1) and from_store(store)
+
+# The store gives the records of the text file, whether found next to it or given as path1
+text = records("./data/test_input.region", "text")
+assert records(path1, "store") == text
+assert records(store, "store_path") == text
+
+# Once the region file changes, its store is stale and the file is parsed again
+with open(path1) as file:
+    lines = file.readlines()
+gem = lines[0].split()[4]
+with open(path1, "w") as file:
+    file.writelines(line for line in lines if line.split()[4] != gem)
+assert not from_store(path1)
+changed = records(path1, "changed")
+assert changed != text
+
+fresh = os.path.join(out_dir, "fresh.region")
+shutil.copyfile(path1, fresh)
+assert records(fresh, "fresh") == changed
+
+# A change that keeps the size is caught by the modification time
+with open(path1, "w") as file:
+    file.writelines(lines)
+miasort.compile_complexes(path1)
+assert from_store(path1)
+os.utime(path1, ns=(os.stat(path1).st_atime_ns, os.stat(path1).st_mtime_ns + 10 ** 9))
+assert not from_store(path1)
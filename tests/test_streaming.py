@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+out_dir = "./test_folder_streaming"
+os.makedirs(out_dir, exist_ok=True)
+
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+
+def write(path, lines):
+    with open(path, "w") as file:
+        file.writelines(lines)
+    return path
+
+
+def outputs(run_dir):
+    return {name: read(os.path.join(run_dir, name)) for name in sorted(os.listdir(run_dir))
+            if name.endswith((".csv", ".txt"))}
+
+
+# Two chromosome blocks sorted by position, and anchors on both
+with open("./data/test_input.region") as file:
+    lines = sorted(file, key=lambda line: (line.split()[0], int(line.split()[1])))
+copies = [line.replace("chr3", "chr5") for line in lines]
+region = write(os.path.join(out_dir, "sorted.region"), lines + copies)
+anchors = read("./data/test_input_abc.domains").splitlines(keepends=True)
+anchors[-1] = anchors[-1] if anchors[-1].endswith("\n") else anchors[-1] + "\n"
+domains = write(os.path.join(out_dir, "two_chroms.domains"),
+                anchors + [line.replace("chr3", "chr5").replace("cr1_", "cr5_") for line in anchors])
+
+# Streaming writes the records and histograms of a run that loads the file whole
+for mode, sort in [("abc", miasort.abc_sort), ("AandBandC", miasort.multiple_sort)]:
+    results = []
+    for streaming in [False, True]:
+        run_dir = f"{out_dir}_{mode}_{streaming}"
+        args = [region, domains] + ([SCHEMES] if mode == "abc" else [])
+        sort(*args, out_dir=run_dir, plot=False, histogram=True, engine="numpy", streaming=streaming)
+        results.append(outputs(run_dir))
+    assert results[0] and any("cr5_" in text for text in results[0].values())
+    assert results[0] == results[1], f"Streaming changes the {mode} output"
+
+# Input that is not sorted by position is rejected
+unsorted = write(os.path.join(out_dir, "unsorted.region"), [lines[1], lines[0]] + lines[2:])
+split = write(os.path.join(out_dir, "split.region"), lines[:10] + copies + lines[10:])
+for path1 in [unsorted, split, "./data/test_input.region"]:
+    try:
+        miasort.abc_sort(path1, domains, SCHEMES, out_dir=f"{out_dir}_rejected", plot=False,
+                         engine="numpy", streaming=True)
+        raise AssertionError(f"Streaming {path1} did not raise")
+    except ValueError:
+        pass
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import os
+
+import miasort
+
+SCHEMES = "AtoC;CtoA;AandC;Bcentered;BtoA;BtoC"
+
+
+def outputs(out_dir):
+    """Contents of the CSV, histogram and PNG files of out_dir."""
+    files = {}
+    for name in sorted(os.listdir(out_dir)):
+        if name.endswith((".csv", ".txt", ".png")):
+            with open(os.path.join(out_dir, name), "rb") as file:
+                files[name] = file.read()
+    return files
+
+
+for engine in ["bedtools", "numpy"]:
+    results = {}
+    for workers, render_workers in [(1, 0), (2, 0), (1, 2), (3, 2)]:
+        out_dir = f"./test_folder_workers_{engine}_{workers}_{render_workers}"
+        miasort.abc_sort("./data/test_input.region", "./data/test_input_abc.domains", SCHEMES, out_dir=out_dir,
+                         histogram=True, engine=engine, workers=workers, render_workers=render_workers)
+        results[workers, render_workers] = outputs(out_dir)
+
+    serial = results[1, 0]
+    assert any(name.endswith(".png") for name in serial) and any(name.endswith(".csv") for name in serial)
+    for settings, files in results.items():
+        assert files.keys() == serial.keys(), f"Other files are written with workers, render_workers = {settings}"
+        for name, data in files.items():
+            assert data == serial[name], f"{name} differs with workers, render_workers = {settings}"